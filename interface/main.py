@@ -1,4 +1,6 @@
+import os
 import sys
+import time
 from pathlib import Path
 
 project_root = Path(__file__).parent.parent
@@ -6,17 +8,36 @@ sys.path.insert(0, str(project_root))
 
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
-import folium
-from streamlit_folium import st_folium
 
 from utils.geo import vn2000_to_latlon
-from utils.forecast import predict_for_station
+from utils.forecast import forecast_version
+from utils.cache import ResultCache
+from utils.worker import ForecastPool
+from utils.warmup import start_warm_up
 from utils.hsi import compute_hsi
+from utils.history import load_hk_history, station_series, quarter_start, HK_COLUMNS, HK_DEPTH_BY_SPECIES
+from utils.lttb import downsample, DEFAULT_MAX_POINTS
+from utils.telemetry import Telemetry, stage, record, process_memory
 
 st.title("🌊 Dự báo môi trường nước cho Cá giò và Hàu khu vực biển Quảng Ninh")
 
+# Display names of the forecast environment columns (keys = forecast column names)
+ENV_PARAM_NAMES = {
+    'DO': 'Oxy hòa tan (mg/L)',
+    'Temperature': 'Nhiệt độ (°C)',
+    'pH': 'pH',
+    'Salinity': 'Độ mặn (‰)',
+    'NH3': 'Amoniac - NH3 (mg/L)',
+    'PO4': 'Phosphat - PO43- (mg/L)',
+    'H2S': 'H2S (mg/L)',
+    'BOD5': 'BOD5 (mg/L)',
+    'COD': 'COD (mg/L)',
+    'TSS': 'TSS (mg/L)',
+    'Coliform': 'Coliform (MPN/100mL)',
+    'Alkalinity': 'Độ kiềm (mg/L)',
+    'Transparency': 'Độ trong (cm)'
+}
+
 # Load data of Quảng Ninh
 @st.cache_data
 def load_data():
@@ -28,13 +49,10 @@ def load_data():
     
     # Convert VN-2000 coordinates to WGS84 (lat, lon)
     coords = df[['X', 'Y']].drop_duplicates()
-    coords['lat'] = None
-    coords['lon'] = None
-    
-    for idx, row in coords.iterrows():
-        lat, lon = vn2000_to_latlon(row['X'], row['Y'])
-        coords.at[idx, 'lat'] = lat
-        coords.at[idx, 'lon'] = lon
+    coords['lat'], coords['lon'] = vn2000_to_latlon(
+        coords['X'].to_numpy(dtype=float),
+        coords['Y'].to_numpy(dtype=float)
+    )
     
     # Merge the converted coordinates into the original dataframe
     df = df.merge(coords[['X', 'Y', 'lat', 'lon']], on=['X', 'Y'], how='left')
@@ -52,48 +70,65 @@ def load_radius_data(species):
         st.warning(f"Không tìm thấy file {filename}")
         return None
 
-@st.cache_data
-def calculate_hsi_for_all_stations(species, year, quarter, station_list):
-    """Calculate HSI for all stations for a specific year and quarter - optimized version"""
-    import concurrent.futures
-    
-    def calculate_single_station(station_row):
-        try:
-            forecast_df = predict_for_station(
-                species=species,
-                x=station_row['X'],
-                y=station_row['Y'],
-                start_year=year,
-                start_quarter=quarter,
-                n_quarters=1
-            )
-            
-            forecast_with_hsi = compute_hsi(forecast_df, species=species)
-            
-            if len(forecast_with_hsi) > 0:
-                return (station_row['Station'], {
-                    'HSI': forecast_with_hsi.iloc[0]['HSI'],
-                    'HSI_Level': forecast_with_hsi.iloc[0]['HSI_Level']
-                })
-        except:
-            pass
-        return None
-    
-    # Use ThreadPoolExecutor for parallel processing
-    hsi_results = {}
-    stations_list = station_list.to_dict('records')
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-        results = executor.map(calculate_single_station, stations_list)
-        
-    for result in results:
-        if result:
-            hsi_results[result[0]] = result[1]
+@st.cache_resource
+def load_hk_reference():
+    """Raw Hong Kong monitoring records (read-only, shared across sessions)"""
+    return load_hk_history()
+
+@st.cache_resource
+def get_result_cache():
+    """Shared, bounded result cache for all sessions (LRU + TTL)"""
+    return ResultCache(max_entries=64, ttl_seconds=6 * 3600)
+
+@st.cache_resource
+def get_figure_cache():
+    """Shared cache of Plotly figure specs for the station detail tabs"""
+    return ResultCache(max_entries=512, ttl_seconds=6 * 3600)
+
+@st.cache_resource
+def get_forecast_pool():
+    """Forecast worker pool shared across sessions (models stay loaded, identical requests are merged)"""
+    return ForecastPool(cache=get_result_cache())
+
+def calculate_hsi_for_all_stations(species, year, quarter):
+    """Calculate HSI for all stations for a specific year and quarter - batched in the worker pool"""
+    return get_forecast_pool().hsi_map(species, year, quarter)
+
+def load_timeline_payload(species):
+    """Compute HSI and radius for all stations over the whole 2026-2030 horizon in one batched job"""
+    from utils.timeline import build_timeline_payload
     
-    return hsi_results
+    def compute():
+        df = load_data()
+        stations = df[['Station', 'Station_Name', 'lat', 'lon']].drop_duplicates('Station')
+        df_timeline = get_forecast_pool().timeline(species)
+        return build_timeline_payload(df_timeline, stations)
+
+    key = ("timeline_payload", species, forecast_version(species))
+    return get_result_cache().get_or_compute(key, compute)
+
+@st.cache_resource
+def get_telemetry():
+    """Per-stage timings of the last reruns (all sessions)"""
+    return Telemetry(max_runs=100)
+
+@st.cache_resource
+def warm_up_dashboard():
+    """Runs once per server process: restore the warm-up snapshot, then load the data, start the
+    workers and precompute the default view in a background thread (errors are logged, never raised)"""
+    return start_warm_up(get_forecast_pool(), get_result_cache(), preload=(load_data,))
+
+# Admin panel (timings, cache hit rates, memory): ?admin=1 or AQUAR_ADMIN=1
+admin_mode = os.environ.get("AQUAR_ADMIN") == "1" or st.query_params.get("admin") == "1"
+
+telemetry_run = get_telemetry().begin()
+
+with stage("model_load"):
+    warm_up_dashboard()
 
 # Load data
-df = load_data()
+with stage("data_load"):
+    df = load_data()
 
 # Get the list of unique monitoring stations
 stations = df[['Station', 'Station_Name', 'lat', 'lon']].drop_duplicates()
@@ -144,7 +179,7 @@ st.header("🗺 Bản đồ các trạm quan trắc môi trường")
 # Map display settings
 st.subheader("⚙️ Cài đặt hiển thị bản đồ")
 
-col_map1, col_map2, col_map3 = st.columns(3)
+col_map1, col_map2, col_map3, col_map4 = st.columns(4)
 
 with col_map1:
     map_year = st.number_input(
@@ -171,19 +206,45 @@ with col_map3:
         help="Tính toán và hiển thị HSI cho tất cả các trạm"
     )
 
+with col_map4:
+    animate_map = st.checkbox(
+        "Trình chiếu theo quý",
+        value=False,
+        help="Tính sẵn HSI và bán kính cho toàn bộ 2026-2030, chuyển quý ngay trên bản đồ bằng thanh trượt"
+    )
+
+telemetry_run.label = f"{species} Q{map_quarter}/{map_year}"
+
 # Load radius data based on selected species
-df_radius = load_radius_data(species)
+with stage("r_lookup"):
+    df_radius = load_radius_data(species)
 
 # Calculate HSI for all stations if needed
 hsi_data = {}
-if show_hsi:
+if show_hsi and not animate_map:
     with st.spinner('Đang tính toán HSI cho các trạm...'):
-        stations_unique = df[['Station', 'X', 'Y']].drop_duplicates()
-        hsi_data = calculate_hsi_for_all_stations(species, map_year, map_quarter, stations_unique)
-
-st.info("💡 **Hướng dẫn:** Click vào các điểm đỏ trên bản đồ để chọn trạm và xem chi tiết. Vòng tròn màu xanh biểu thị vùng áp dụng kết quả dự báo cho Q{}/{}. Hover chuột để xem thông tin nhanh.".format(map_quarter, map_year))
+        try:
+            with stage("forecast"):
+                hsi_data = calculate_hsi_for_all_stations(species, map_year, map_quarter)
+        except Exception as e:
+            st.warning(f"Không tính được HSI cho bản đồ: {str(e)}")
+
+timeline_payload = None
+if animate_map:
+    with st.spinner('Đang tính toán HSI cho toàn bộ các quý 2026-2030...'):
+        with stage("forecast"):
+            timeline_payload = load_timeline_payload(species)
+    st.info("💡 **Hướng dẫn:** Kéo thanh trượt hoặc bấm ▶ ở góc dưới bản đồ để xem HSI và bán kính áp dụng qua từng quý. Chọn trạm ở mục bên dưới để xem chi tiết.")
+else:
+    st.info("💡 **Hướng dẫn:** Click vào các điểm đỏ trên bản đồ để chọn trạm và xem chi tiết. Vòng tròn màu xanh biểu thị vùng áp dụng kết quả dự báo cho Q{}/{}. Hover chuột để xem thông tin nhanh.".format(map_quarter, map_year))
+
+# Map libraries are only imported once the map is built, so the page header renders first
+import folium
+import streamlit.components.v1 as components
+from streamlit_folium import st_folium
 
 # Create Folium map
+map_build_t0 = time.perf_counter()
 center_lat = stations['lat'].mean()
 center_lon = stations['lon'].mean()
 
@@ -195,72 +256,74 @@ m = folium.Map(
     attr='Esri World Imagery'
 )
 
-# Add radius circles first (so they appear below markers)
+# Time-slider mode: the whole horizon is embedded once, quarter switching happens in the browser
+if timeline_payload is not None:
+    from utils.timeline import TimeSliderLayer
+    TimeSliderLayer(timeline_payload, initial_period=(map_year, map_quarter)).add_to(m)
+
+# Compact side table for the displayed quarter: popups only carry the station ID,
+# the details are looked up here for the station that was actually clicked
+station_lookup = stations.drop_duplicates('Station').set_index('Station')
+radius_by_station = {}
 if df_radius is not None:
-    # Filter radius data for the selected map display period
-    radius_filtered = df_radius[
-        (df_radius['year'] == map_year) & 
+    radius_period = df_radius[
+        (df_radius['year'] == map_year) &
         (df_radius['quarter'] == map_quarter)
-    ].copy()
+    ]
+    radius_by_station = dict(zip(radius_period['station'], radius_period['R_km']))
+
+def render_station_details(station):
+    """Render the details that used to be embedded in every marker popup"""
+    row = station_lookup.loc[station]
     
-    # Merge with station coordinates
-    radius_filtered = radius_filtered.merge(
-        stations[['Station', 'lat', 'lon']], 
-        left_on='station', 
-        right_on='Station', 
-        how='left'
-    )
+    radius_info = ""
+    if pd.notna(radius_by_station.get(station)):
+        radius_info = f"<p style='margin: 5px 0;'><b>Bán kính áp dụng:</b> {radius_by_station[station]} km</p>"
+    
+    hsi_info = ""
+    if station in hsi_data:
+        hsi_info = f"""
+        <p style='margin: 5px 0;'><b>HSI (Q{map_quarter}/{map_year}):</b> {hsi_data[station]['HSI']:.3f}</p>
+        <p style='margin: 5px 0;'><b>Đánh giá:</b> {hsi_data[station]['HSI_Level']}</p>
+        """
     
-    # Add circles for each station
-    for idx, row in radius_filtered.iterrows():
-        if pd.notna(row['lat']) and pd.notna(row['lon']) and pd.notna(row['R_km']):
+    st.markdown(f"""
+    <div style="font-family: Arial;">
+        <h4 style="color: #2E86AB; margin: 0 0 10px 0;">{station}</h4>
+        <p style="margin: 5px 0;"><b>Tên:</b> {row['Station_Name']}</p>
+        <p style="margin: 5px 0;"><b>Vĩ độ:</b> {row['lat']:.6f}</p>
+        <p style="margin: 5px 0;"><b>Kinh độ:</b> {row['lon']:.6f}</p>
+        {radius_info}
+        {hsi_info}
+    </div>
+    """, unsafe_allow_html=True)
+
+# Add radius circles first (so they appear below markers)
+if timeline_payload is None:
+    for station, row in station_lookup.iterrows():
+        r_km = radius_by_station.get(station)
+        if pd.notna(row['lat']) and pd.notna(row['lon']) and pd.notna(r_km):
             # Convert km to meters for folium Circle
-            radius_m = row['R_km'] * 1000
-            
-            # Create circle
             folium.Circle(
                 location=[row['lat'], row['lon']],
-                radius=radius_m,
+                radius=r_km * 1000,
                 color='#2E86AB',
                 fill=True,
                 fillColor='#2E86AB',
                 fillOpacity=0.15,
                 weight=2,
                 opacity=0.5,
-                popup=folium.Popup(
-                    f"<b>{row['station']}</b><br>Bán kính: {row['R_km']} km<br>Q{row['quarter']}/{row['year']}",
-                    max_width=200
-                ),
-                tooltip=f"{row['station']}: R = {row['R_km']} km"
+                tooltip=f"{station}: R = {r_km} km"
             ).add_to(m)
 
 # Add markers for each station (on top of circles)
-for idx, row in stations.iterrows():
-    # Get radius info if available
-    radius_info = ""
-    if df_radius is not None:
-        station_radius = df_radius[
-            (df_radius['station'] == row['Station']) &
-            (df_radius['year'] == map_year) &
-            (df_radius['quarter'] == map_quarter)
-        ]
-        if len(station_radius) > 0:
-            r_km = station_radius.iloc[0]['R_km']
-            radius_info = f"<p style='margin: 5px 0;'><b>Bán kính áp dụng:</b> {r_km} km</p>"
-    
-    # Get HSI info if available
-    hsi_info = ""
+for station, row in (station_lookup.iterrows() if timeline_payload is None else []):
     hsi_tooltip = ""
     marker_color = '#C81E1E'  # Default red
     
-    if row['Station'] in hsi_data:
-        hsi_value = hsi_data[row['Station']]['HSI']
-        hsi_level = hsi_data[row['Station']]['HSI_Level']
-        
-        hsi_info = f"""
-        <p style='margin: 5px 0;'><b>HSI (Q{map_quarter}/{map_year}):</b> {hsi_value:.3f}</p>
-        <p style='margin: 5px 0;'><b>Đánh giá:</b> {hsi_level}</p>
-        """
+    if station in hsi_data:
+        hsi_value = hsi_data[station]['HSI']
+        hsi_level = hsi_data[station]['HSI_Level']
         
         hsi_tooltip = f" | HSI: {hsi_value:.3f} ({hsi_level})"
         
@@ -274,25 +337,12 @@ for idx, row in stations.iterrows():
         else:
             marker_color = '#dc3545'  # Red - Not suitable
     
-    # Create popup content
-    popup_html = f"""
-    <div style="font-family: Arial; width: 240px;">
-        <h4 style="color: #2E86AB; margin: 0 0 10px 0;">{row['Station']}</h4>
-        <p style="margin: 5px 0;"><b>Tên:</b> {row['Station_Name']}</p>
-        <p style="margin: 5px 0;"><b>Vĩ độ:</b> {row['lat']:.6f}</p>
-        <p style="margin: 5px 0;"><b>Kinh độ:</b> {row['lon']:.6f}</p>
-        {radius_info}
-        {hsi_info}
-    </div>
-    """
-    
-    tooltip_text = f"{row['Station']} - {row['Station_Name']}{hsi_tooltip}"
-    
+    # Popup only carries the station ID, details are rendered server-side on click
     folium.CircleMarker(
         location=[row['lat'], row['lon']],
         radius=8,
-        popup=folium.Popup(popup_html, max_width=300),
-        tooltip=tooltip_text,
+        popup=folium.Popup(station),
+        tooltip=f"{station}{hsi_tooltip}",
         color=marker_color,
         fill=True,
         fillColor=marker_color,
@@ -301,7 +351,7 @@ for idx, row in stations.iterrows():
     ).add_to(m)
 
 # Add legend to map
-if show_hsi:
+if show_hsi or animate_map:
     legend_html = """
     <div style="position: fixed; 
                 bottom: 50px; right: 50px; width: 200px; height: auto; 
@@ -316,32 +366,46 @@ if show_hsi:
     """
     m.get_root().html.add_child(folium.Element(legend_html))
 
+record("map_build", time.perf_counter() - map_build_t0)
+
 # Initialize session state for selected station FIRST
 if 'selected_station' not in st.session_state:
     st.session_state.selected_station = None
 
 # Display map and capture clicks
-map_data = st_folium(
-    m,
-    width=None,
-    height=500,
-    returned_objects=["last_object_clicked"],
-    key=f"folium_map_{map_year}_{map_quarter}_{species}"
-)
+with stage("serialization"):
+    if timeline_payload is not None:
+        components.html(m.get_root().render(), height=500)
+        map_data = None
+    else:
+        map_data = st_folium(
+            m,
+            width=None,
+            height=500,
+            returned_objects=["last_object_clicked", "last_object_clicked_popup"],
+            key=f"folium_map_{map_year}_{map_quarter}_{species}"
+        )
 
 # Handle marker click - Update session state if clicked
 if map_data and map_data.get("last_object_clicked"):
-    clicked_lat = map_data["last_object_clicked"]["lat"]
-    clicked_lon = map_data["last_object_clicked"]["lng"]
+    closest_station = (map_data.get("last_object_clicked_popup") or "").strip()
+    
+    if closest_station not in station_lookup.index:
+        clicked_lat = map_data["last_object_clicked"]["lat"]
+        clicked_lon = map_data["last_object_clicked"]["lng"]
+        
+        # Find the station closest to clicked location
+        stations_copy = stations.copy()
+        stations_copy['distance'] = ((stations_copy['lat'] - clicked_lat)**2 + (stations_copy['lon'] - clicked_lon)**2)**0.5
+        closest_station = stations_copy.loc[stations_copy['distance'].idxmin(), 'Station']
     
-    # Find the station closest to clicked location
-    stations_copy = stations.copy()
-    stations_copy['distance'] = ((stations_copy['lat'] - clicked_lat)**2 + (stations_copy['lon'] - clicked_lon)**2)**0.5
-    closest_station = stations_copy.loc[stations_copy['distance'].idxmin(), 'Station']
+    # Details of the clicked station (looked up server-side)
+    render_station_details(closest_station)
     
     # Only update and rerun if different station
     if st.session_state.selected_station != closest_station:
         st.session_state.selected_station = closest_station
+        get_telemetry().end(telemetry_run, status="rerun")
         st.rerun()
 
 st.divider()
@@ -354,7 +418,7 @@ stations_sorted = stations.copy()
 stations_sorted['sort_key'] = stations_sorted['Station'].str.extract('(\d+)').astype(int)
 stations_sorted = stations_sorted.sort_values('sort_key')
 
-col_select1, col_select2 = st.columns([3, 1])
+col_select1, _ = st.columns([3, 1])
 
 with col_select1:
     # Get default index based on session state
@@ -398,48 +462,47 @@ with col_select1:
     # Update session state
     st.session_state.selected_station = selected_station
 
-with col_select2:
-    calculate_btn = st.button("📊 Tính HSI", type="primary", use_container_width=True)
-
-# Calculate and display HSI when button is clicked or station is selected
-if selected_station and (calculate_btn or 'last_station' not in st.session_state or st.session_state.last_station != selected_station):
-    st.session_state.last_station = selected_station
+# Calculate and display HSI for the selected station. Results come from the shared caches,
+# so the panel is rendered on every rerun and changing a widget inside the tabs keeps it visible
+if selected_station:
     
     # Get station information
-    station_data = df[df['Station'] == selected_station][['X', 'Y', 'Station_Name']].iloc[0]
-    x_coord = station_data['X']
-    y_coord = station_data['Y']
+    station_data = df[df['Station'] == selected_station][['Station_Name']].iloc[0]
     station_name = station_data['Station_Name']
     
     with st.spinner(f'Đang tính toán HSI cho trạm {selected_station}...'):
         try:
             # Call prediction function
-            forecast_df = predict_for_station(
-                species=species,
-                x=x_coord,
-                y=y_coord,
-                start_year=start_year,
-                start_quarter=start_quarter,
-                n_quarters=n_quarters
-            )
+            with stage("forecast"):
+                forecast_df = get_forecast_pool().forecast(
+                    species=species,
+                    start_year=start_year,
+                    start_quarter=start_quarter,
+                    n_quarters=n_quarters,
+                    stations=[selected_station]
+                )
+            if forecast_df.empty:
+                raise ValueError("❌ Không đủ dữ liệu lịch sử (cần ≥ 4 quý)")
             
             # Calculate HSI using compute_hsi
-            forecast_with_hsi = compute_hsi(forecast_df, species=species)
+            with stage("hsi"):
+                forecast_with_hsi = compute_hsi(forecast_df, species=species)
             
             # Get radius information for each forecasted quarter
             if df_radius is not None:
-                radius_info_list = []
-                for idx, row in forecast_with_hsi.iterrows():
-                    station_radius = df_radius[
-                        (df_radius['station'] == selected_station) &
-                        (df_radius['year'] == int(row['year'])) &
-                        (df_radius['quarter'] == int(row['quarter']))
-                    ]
-                    if len(station_radius) > 0:
-                        radius_info_list.append(station_radius.iloc[0]['R_km'])
-                    else:
-                        radius_info_list.append(None)
-                forecast_with_hsi['R_km'] = radius_info_list
+                with stage("r_lookup"):
+                    radius_info_list = []
+                    for idx, row in forecast_with_hsi.iterrows():
+                        station_radius = df_radius[
+                            (df_radius['station'] == selected_station) &
+                            (df_radius['year'] == int(row['year'])) &
+                            (df_radius['quarter'] == int(row['quarter']))
+                        ]
+                        if len(station_radius) > 0:
+                            radius_info_list.append(station_radius.iloc[0]['R_km'])
+                        else:
+                            radius_info_list.append(None)
+                    forecast_with_hsi['R_km'] = radius_info_list
             
             # Format results for display
             hsi_results = []
@@ -470,54 +533,27 @@ if selected_station and (calculate_btn or 'last_station' not in st.session_state
                 st.info("ℹ️ **Bán kính áp dụng** là khoảng cách từ trạm quan trắc mà kết quả dự báo HSI có thể áp dụng được.")
             
             # Create tabs for chart and table view
-            tab1, tab2, tab3 = st.tabs(["📈 Biểu đồ HSI", "🌡️ Biểu đồ các thông số môi trường", "📋 Bảng dữ liệu"])
+            tab1, tab2, tab3, tab4 = st.tabs(["📈 Biểu đồ HSI", "🌡️ Biểu đồ các thông số môi trường", "📋 Bảng dữ liệu", "📜 Lịch sử + dự báo"])
+            
+            import plotly.graph_objects as go
+            from utils.figures import cached_hsi_figure, cached_env_figure
+            
+            figure_key = (species, selected_station, start_year, start_quarter, n_quarters, forecast_version(species))
             
             with tab1:
                 # Prepare data for chart
                 chart_data = hsi_df.copy()
                 chart_data['HSI_numeric'] = pd.to_numeric(chart_data['HSI'], errors='coerce')
                 
-                # Create line chart with Plotly
-                fig = go.Figure()
-                
-                # Add HSI line
-                fig.add_trace(go.Scatter(
-                    x=chart_data['Thời gian'],
-                    y=chart_data['HSI_numeric'],
-                    mode='lines+markers',
-                    name='HSI',
-                    line=dict(color='#2E86AB', width=3),
-                    marker=dict(size=10, symbol='circle'),
-                    hovertemplate='<b>%{x}</b><br>HSI: %{y:.3f}<br><extra></extra>'
-                ))
-                
-                # Add threshold lines
-                fig.add_hline(y=0.85, line_dash="dash", line_color="green", 
-                             annotation_text="Rất phù hợp (≥0.85)", 
-                             annotation_position="right")
-                fig.add_hline(y=0.75, line_dash="dash", line_color="orange", 
-                             annotation_text="Phù hợp (≥0.75)", 
-                             annotation_position="right")
-                fig.add_hline(y=0.5, line_dash="dash", line_color="red", 
-                             annotation_text="Ít phù hợp (≥0.5)", 
-                             annotation_position="right")
-                
-                # Customize layout
-                fig.update_layout(
-                    title=f"Xu hướng HSI qua các quý - {species_display}",
-                    xaxis_title="Thời gian",
-                    yaxis_title="Chỉ số HSI",
-                    yaxis_range=[0, 1],
-                    height=500,
-                    hovermode='x unified',
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    paper_bgcolor='rgba(0,0,0,0)',
+                # Figure specs are shared across reruns and sessions
+                fig = cached_hsi_figure(
+                    get_figure_cache(),
+                    figure_key,
+                    chart_data['Thời gian'],
+                    chart_data['HSI_numeric'],
+                    f"Xu hướng HSI qua các quý - {species_display}"
                 )
                 
-                # Update axes
-                fig.update_xaxes(showgrid=True, gridwidth=1, gridcolor='lightgray')
-                fig.update_yaxes(showgrid=True, gridwidth=1, gridcolor='lightgray')
-                
                 st.plotly_chart(fig, use_container_width=True)
                 
                 # Show statistics
@@ -540,17 +576,7 @@ if selected_station and (calculate_btn or 'last_station' not in st.session_state
                 
                 # Get environmental parameters from forecast_df
                 # Common parameters to visualize
-                param_names = {
-                    'temp': 'Nhiệt độ (°C)',
-                    'salinity': 'Độ mặn (‰)',
-                    'DO': 'Oxy hòa tan (mg/L)',
-                    'pH': 'pH',
-                    'turbidity': 'Độ đục (NTU)',
-                    'chlorophyll': 'Chlorophyll-a (μg/L)',
-                    'NH4': 'Amoni - NH4+ (mg/L)',
-                    'NO3': 'Nitrat - NO3- (mg/L)',
-                    'PO4': 'Phosphat - PO43- (mg/L)'
-                }
+                param_names = ENV_PARAM_NAMES
                 
                 # Filter only available parameters
                 available_params = [col for col in forecast_with_hsi.columns if col in param_names.keys()]
@@ -566,55 +592,16 @@ if selected_station and (calculate_btn or 'last_station' not in st.session_state
                     
                     if selected_params:
                         # Create time labels
-                        time_labels = [f"Q{int(row['quarter'])}/{int(row['year'])}" 
-                                     for _, row in forecast_with_hsi.iterrows()]
-                        
-                        # Create subplots
-                        num_params = len(selected_params)
-                        cols_per_row = 2
-                        num_rows = (num_params + cols_per_row - 1) // cols_per_row
-                        
-                        from plotly.subplots import make_subplots
-                        
-                        fig_env = make_subplots(
-                            rows=num_rows,
-                            cols=cols_per_row,
-                            subplot_titles=[param_names.get(p, p) for p in selected_params],
-                            vertical_spacing=0.12,
-                            horizontal_spacing=0.1
-                        )
-                        
-                        for idx, param in enumerate(selected_params):
-                            row = (idx // cols_per_row) + 1
-                            col = (idx % cols_per_row) + 1
-                            
-                            values = forecast_with_hsi[param].values
-                            
-                            fig_env.add_trace(
-                                go.Scatter(
-                                    x=time_labels,
-                                    y=values,
-                                    mode='lines+markers',
-                                    name=param_names.get(param, param),
-                                    line=dict(width=2),
-                                    marker=dict(size=8),
-                                    showlegend=False,
-                                    hovertemplate='<b>%{x}</b><br>Giá trị: %{y:.2f}<br><extra></extra>'
-                                ),
-                                row=row,
-                                col=col
-                            )
-                            
-                            # Update axes
-                            fig_env.update_xaxes(showgrid=True, gridwidth=1, gridcolor='lightgray', row=row, col=col)
-                            fig_env.update_yaxes(showgrid=True, gridwidth=1, gridcolor='lightgray', row=row, col=col)
+                        time_labels = [f"Q{int(q)}/{int(y)}" 
+                                     for y, q in zip(forecast_with_hsi['year'], forecast_with_hsi['quarter'])]
                         
-                        # Update layout
-                        fig_env.update_layout(
-                            height=300 * num_rows,
-                            plot_bgcolor='rgba(0,0,0,0)',
-                            paper_bgcolor='rgba(0,0,0,0)',
-                            hovermode='closest'
+                        # Only the traces of newly selected parameters are rebuilt
+                        fig_env = cached_env_figure(
+                            get_figure_cache(),
+                            figure_key,
+                            time_labels,
+                            {p: forecast_with_hsi[p].to_numpy() for p in selected_params},
+                            {p: param_names.get(p, p) for p in selected_params}
                         )
                         
                         st.plotly_chart(fig_env, use_container_width=True)
@@ -668,6 +655,62 @@ if selected_station and (calculate_btn or 'last_station' not in st.session_state
                     column_config=column_config
                 )
             
+            with tab4:
+                # Observed 2021-2024 series followed by the forecast, downsampled server-side (LTTB)
+                # Chỉ các biến dự báo dạng số (bỏ Station, toạ độ, thời gian, HSI)
+                history_params = [
+                    c for c in forecast_with_hsi.select_dtypes('number').columns
+                    if c in df.columns and c not in ('X', 'Y', 'year', 'quarter', 'HSI')
+                ]
+                
+                history_param = st.selectbox(
+                    "Thông số:",
+                    options=history_params,
+                    key="history_param"
+                )
+                
+                if history_param:
+                    obs_dates, obs_values = station_series(
+                        df.rename(columns={'Quarter': 'Date'}),
+                        selected_station,
+                        history_param
+                    )
+                    obs_dates, obs_values = downsample(obs_dates, obs_values, DEFAULT_MAX_POINTS)
+                    
+                    fc_dates = quarter_start(forecast_with_hsi['year'], forecast_with_hsi['quarter'])
+                    
+                    fig_history = go.Figure()
+                    fig_history.add_trace(go.Scatter(
+                        x=obs_dates,
+                        y=obs_values,
+                        mode='lines+markers',
+                        name='Quan trắc',
+                        line=dict(color='#2E86AB', width=2),
+                        marker=dict(size=6)
+                    ))
+                    fig_history.add_trace(go.Scatter(
+                        x=fc_dates,
+                        y=forecast_with_hsi[history_param],
+                        mode='lines+markers',
+                        name='Dự báo',
+                        line=dict(color='#fd7e14', width=2, dash='dash'),
+                        marker=dict(size=8)
+                    ))
+                    fig_history.add_vline(x=fc_dates.iloc[0], line_dash="dot", line_color="gray")
+                    
+                    fig_history.update_layout(
+                        title=f"{history_param} - trạm {selected_station}",
+                        xaxis_title="Thời gian",
+                        height=450,
+                        hovermode='x unified',
+                        plot_bgcolor='rgba(0,0,0,0)',
+                        paper_bgcolor='rgba(0,0,0,0)',
+                    )
+                    fig_history.update_xaxes(showgrid=True, gridwidth=1, gridcolor='lightgray')
+                    fig_history.update_yaxes(showgrid=True, gridwidth=1, gridcolor='lightgray')
+                    
+                    st.plotly_chart(fig_history, use_container_width=True)
+            
         except Exception as e:
             st.error(f"❌ Lỗi khi tính toán: {str(e)}")
             with st.expander("Chi tiết lỗi"):
@@ -675,6 +718,170 @@ if selected_station and (calculate_btn or 'last_station' not in st.session_state
 
 st.divider()
 
+# Multi-station comparison: all selected stations are forecast in one batched call
+st.subheader("⚖️ So sánh nhiều trạm")
+
+compare_param_names = ENV_PARAM_NAMES
+
+col_compare1, col_compare2 = st.columns(2)
+
+with col_compare1:
+    compare_stations = st.multiselect(
+        "Chọn các trạm cần so sánh (tối đa 20):",
+        options=stations_sorted['Station'].tolist(),
+        default=stations_sorted['Station'].tolist()[:3],
+        max_selections=20,
+        format_func=lambda x: f"{x} - {stations_sorted[stations_sorted['Station']==x]['Station_Name'].values[0]}",
+        key="compare_stations"
+    )
+
+with col_compare2:
+    compare_params = st.multiselect(
+        "Thông số môi trường:",
+        options=list(compare_param_names.keys()),
+        default=['DO', 'Temperature', 'Salinity'],
+        format_func=lambda x: compare_param_names.get(x, x),
+        key="compare_params"
+    )
+
+if compare_stations:
+    with st.spinner(f'Đang dự báo cho {len(compare_stations)} trạm...'):
+        try:
+            # One batched forecast for all N stations (sorted so the request key does not depend on selection order)
+            compare_df = get_forecast_pool().forecast(
+                species=species,
+                start_year=start_year,
+                start_quarter=start_quarter,
+                n_quarters=n_quarters,
+                stations=sorted(compare_stations)
+            )
+            compare_df = compute_hsi(compare_df, species=species)
+            compare_df['Thời gian'] = [f"Q{int(q)}/{int(y)}" for y, q in zip(compare_df['year'], compare_df['quarter'])]
+            
+            import plotly.graph_objects as go
+            from plotly.subplots import make_subplots
+            
+            plot_params = [p for p in compare_params if p in compare_df.columns]
+            num_rows = 1 + len(plot_params)
+            
+            fig_compare = make_subplots(
+                rows=num_rows,
+                cols=1,
+                shared_xaxes=True,
+                subplot_titles=["Chỉ số HSI"] + [compare_param_names.get(p, p) for p in plot_params],
+                vertical_spacing=0.08 if num_rows > 1 else 0.0
+            )
+            
+            for station in compare_stations:
+                station_df = compare_df[compare_df['Station'] == station]
+                if station_df.empty:
+                    continue
+                
+                for row_idx, column in enumerate(['HSI'] + plot_params, start=1):
+                    fig_compare.add_trace(
+                        go.Scatter(
+                            x=station_df['Thời gian'],
+                            y=station_df[column],
+                            mode='lines+markers',
+                            name=station,
+                            legendgroup=station,
+                            showlegend=(row_idx == 1),
+                            marker=dict(size=6),
+                            hovertemplate=f'<b>{station}</b> %{{x}}<br>{column}: %{{y:.3f}}<extra></extra>'
+                        ),
+                        row=row_idx,
+                        col=1
+                    )
+            
+            # HSI threshold lines
+            fig_compare.add_hline(y=0.85, line_dash="dash", line_color="green", row=1, col=1)
+            fig_compare.add_hline(y=0.75, line_dash="dash", line_color="orange", row=1, col=1)
+            fig_compare.add_hline(y=0.5, line_dash="dash", line_color="red", row=1, col=1)
+            
+            fig_compare.update_xaxes(showgrid=True, gridwidth=1, gridcolor='lightgray')
+            fig_compare.update_yaxes(showgrid=True, gridwidth=1, gridcolor='lightgray')
+            fig_compare.update_layout(
+                height=280 * num_rows,
+                hovermode='x unified',
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)',
+            )
+            
+            st.plotly_chart(fig_compare, use_container_width=True)
+            
+            missing = sorted(set(compare_stations) - set(compare_df['Station']))
+            if missing:
+                st.warning(f"Không đủ dữ liệu lịch sử (cần ≥ 4 quý) cho trạm: {', '.join(missing)}")
+        
+        except Exception as e:
+            st.error(f"❌ Lỗi khi so sánh các trạm: {str(e)}")
+            with st.expander("Chi tiết lỗi"):
+                st.exception(e)
+
+# Long Hong Kong reference series (training data source), downsampled server-side before plotting
+with st.expander("🌏 Chuỗi tham chiếu Hồng Kông (dữ liệu huấn luyện)"):
+    try:
+        hk_df = load_hk_reference()
+        
+        col_hk1, col_hk2, col_hk3 = st.columns(3)
+        
+        with col_hk1:
+            hk_station = st.selectbox(
+                "Trạm HK:",
+                options=sorted(hk_df['Station'].unique()),
+                key="hk_station"
+            )
+        
+        with col_hk2:
+            hk_param = st.selectbox(
+                "Thông số:",
+                options=list(HK_COLUMNS.keys()),
+                key="hk_param"
+            )
+        
+        with col_hk3:
+            depth_options = sorted(hk_df['Depth'].dropna().unique())
+            default_depth = HK_DEPTH_BY_SPECIES.get(species)
+            hk_depth = st.selectbox(
+                "Tầng nước:",
+                options=depth_options,
+                index=depth_options.index(default_depth) if default_depth in depth_options else 0,
+                key="hk_depth"
+            )
+        
+        hk_dates, hk_values = station_series(hk_df, hk_station, hk_param, depth=hk_depth)
+        n_total = len(hk_dates)
+        hk_dates, hk_values = downsample(hk_dates, hk_values, DEFAULT_MAX_POINTS)
+        
+        if n_total > 0:
+            import plotly.graph_objects as go
+            
+            fig_hk = go.Figure(go.Scatter(
+                x=hk_dates,
+                y=hk_values,
+                mode='lines',
+                name=hk_param,
+                line=dict(color='#2E86AB', width=1.5)
+            ))
+            fig_hk.update_layout(
+                title=f"{hk_param} - trạm {hk_station} ({hk_depth})",
+                xaxis_title="Thời gian",
+                height=400,
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)',
+            )
+            fig_hk.update_xaxes(showgrid=True, gridwidth=1, gridcolor='lightgray')
+            fig_hk.update_yaxes(showgrid=True, gridwidth=1, gridcolor='lightgray')
+            
+            st.plotly_chart(fig_hk, use_container_width=True)
+            st.caption(f"Hiển thị {len(hk_dates)} / {n_total} điểm (rút gọn bằng Largest-Triangle-Three-Buckets)")
+        else:
+            st.info("Không có dữ liệu cho lựa chọn này.")
+    except Exception as e:
+        st.error(f"❌ Lỗi khi đọc dữ liệu Hồng Kông: {str(e)}")
+
+st.divider()
+
 # Display the statistical information
 st.subheader("📊 Thông tin dữ liệu")
 col1, col2, col3 = st.columns(3)
@@ -707,4 +914,49 @@ with st.expander("📋 Xem danh sách các trạm quan trắc"):
         display_stations,
         use_container_width=True,
         hide_index=True
-    )
\ No newline at end of file
+    )
+
+get_telemetry().end(telemetry_run)
+
+# Admin panel: where the rerun time goes, cache efficiency and memory of the server process and its forecast workers
+if admin_mode:
+    st.divider()
+    st.subheader("🛠️ Telemetry")
+    
+    memory = process_memory()
+    col_mem1, col_mem2, col_mem3, col_mem4 = st.columns(4)
+    with col_mem1:
+        st.metric("Lượt chạy gần nhất", f"{telemetry_run.total * 1000:.0f} ms")
+    with col_mem2:
+        st.metric("RSS tiến trình chính", f"{memory['rss_mb']:.0f} MB" if memory['rss_mb'] is not None else "N/A")
+    with col_mem3:
+        st.metric("RSS đỉnh tiến trình chính", f"{memory['peak_rss_mb']:.0f} MB" if memory['peak_rss_mb'] is not None else "N/A")
+    with col_mem4:
+        st.metric("RSS worker dự báo", f"{memory['children_rss_mb']:.0f} MB" if memory['children_rss_mb'] is not None else "N/A")
+    
+    st.markdown("#### ⏱️ Thời gian theo bước")
+    st.dataframe(get_telemetry().summary().round(1), use_container_width=True, hide_index=True)
+    
+    with st.expander(f"Các lượt chạy gần nhất ({len(get_telemetry())})"):
+        st.dataframe(get_telemetry().runs().iloc[::-1].round(1), use_container_width=True, hide_index=True)
+    
+    st.markdown("#### 🗃️ Cache")
+    cache_rows = []
+    for name, cache in [("Kết quả dự báo", get_result_cache()), ("Biểu đồ", get_figure_cache())]:
+        cache_stats = cache.stats()
+        cache_rows.append({
+            'Cache': name,
+            'Số phần tử': f"{cache_stats['entries']} / {cache_stats['max_entries']}",
+            'Hit': cache_stats['hits'],
+            'Miss': cache_stats['misses'],
+            'Tỉ lệ hit': f"{cache_stats['hit_rate']:.1%}",
+            'Evicted': cache_stats['evictions'],
+            'Expired': cache_stats['expirations'],
+        })
+    st.dataframe(pd.DataFrame(cache_rows), use_container_width=True, hide_index=True)
+    
+    pool_stats = get_forecast_pool().stats()
+    st.caption(
+        f"Pool dự báo: {pool_stats['workers']} worker × {pool_stats['threads_per_worker']} luồng | "
+        f"đã gửi {pool_stats['submitted']} | gộp {pool_stats['deduplicated']} | đang chạy {pool_stats['inflight']}"
+    )
@@ -1,13 +1,21 @@
 import pandas as pd
 import numpy as np
 import xgboost as xgb
-import joblib
 import warnings
 import os
+import json
+import hashlib
+import argparse
+import sys
 from pathlib import Path
 from sklearn.multioutput import MultiOutputRegressor
 from sklearn.metrics import mean_squared_error
 
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from utils.model_bundle import bundle_path, load_model_bundle, save_model_bundle
+
 warnings.filterwarnings('ignore')
 
 
@@ -23,6 +31,65 @@ COBIA_FEATURES = [
     'TSS', 'Coliform', 'Alkalinity', 'Transparency'
 ]
 
+# Các bước dự báo (quý) của chế độ dự báo trực tiếp (direct multi-horizon)
+DIRECT_HORIZONS = list(range(1, 9))
+
+# Tập kiểm định theo thời gian: số quý cuối của mỗi trạm, và số vòng không cải
+# thiện RMSE kiểm định trước khi dừng sớm
+VALID_QUARTERS = 4
+EARLY_STOPPING_ROUNDS = 50
+# Số cây tối thiểu sau early stopping: một cửa sổ kiểm định nhỏ / nhiễu không được
+# dồn booster về 1-2 cây (dự báo gần như hằng số)
+MIN_BOOST_ROUNDS = 50
+
+# Tham số XGBoost mặc định của mô hình môi trường (ghi đè bởi <mô hình>_params.json
+# của model/tune.py nếu có)
+FORECAST_XGB_PARAMS = dict(
+    n_estimators=1000,
+    learning_rate=0.05,
+    max_depth=5,            # Độ sâu trung bình (tránh overfit)
+    subsample=0.8,          # Mỗi cây học 80% số dòng
+    colsample_bytree=0.8,   # Mỗi cây học 80% số cột, giống kiểu drop out trong NN
+    objective='reg:squarederror',
+    n_jobs=-1,
+    random_state=42
+)
+
+# Cache ma trận đặc trưng (.npz) theo nội dung file nguồn + tham số tiền xử lý.
+# Tăng PREPROCESS_VERSION khi đổi logic prepare_time_series_data / handle_outliers /
+# prepare_metal_data để không dùng lại cache cũ.
+PREPROCESS_VERSION = 1
+FEATURE_CACHE_DIR = Path(__file__).resolve().parent / "output" / "feature_cache"
+
+
+# Hàm nội suy tuyến tính theo trạm, cho kết quả giống hệt
+# group[cols].interpolate(method='linear', limit_direction='both') trên từng trạm
+# nhưng không gọi Python cho từng trạm: điểm đã biết gần nhất phía trước / phía sau
+# (trong cùng trạm) lấy bằng groupby ffill / bfill, rồi nội suy như np.interp.
+# Yêu cầu df đã sắp xếp theo trạm (mỗi trạm là một khối dòng liền nhau).
+def interpolate_by_group(df, cols, group_col='Station'):
+    values = df[cols].to_numpy(dtype=float)
+    valid = ~np.isnan(values)
+    pos = np.broadcast_to(np.arange(len(df), dtype=float)[:, None], values.shape)
+
+    # Vị trí và giá trị của các điểm đã biết (NaN ở chỗ thiếu)
+    known = pd.DataFrame(
+        np.hstack([np.where(valid, pos, np.nan), values]), index=df.index
+    ).groupby(df[group_col].to_numpy(), sort=False)
+    prev = known.ffill().to_numpy()
+    nxt = known.bfill().to_numpy()
+
+    n = len(cols)
+    x0, y0 = prev[:, :n], prev[:, n:]
+    x1, y1 = nxt[:, :n], nxt[:, n:]
+
+    # Cùng công thức với np.interp (pandas dùng np.interp): slope * (x - x0) + y0;
+    # ngoài khoảng (đầu / cuối chuỗi) lấy giá trị đã biết gần nhất
+    with np.errstate(invalid='ignore', divide='ignore'):
+        inner = (y1 - y0) / (x1 - x0) * (pos - x0) + y0
+    filled = np.where(np.isnan(x0), y1, np.where(np.isnan(x1), y0, inner))
+
+    return pd.DataFrame(np.where(valid, values, filled), index=df.index, columns=cols)
 
 # Hàm đọc CSV, làm sạch, điền dữ liệu thiếu và tạo Lag Features.
 def prepare_time_series_data(csv_path, features_list, lags=[1, 4]):
@@ -36,28 +103,27 @@ def prepare_time_series_data(csv_path, features_list, lags=[1, 4]):
     # Xử lý thời gian (đổi thành thời gian theo quý)
     df['Date'] = pd.to_datetime(df['Quarter'], errors='coerce')
     df = df.dropna(subset=['Date'])
-    df = df.sort_values(by=['Station', 'Date'])
+    df = df.sort_values(by=['Station', 'Date']).reset_index(drop=True)
 
     # Điền dữ liệu thiếu (Imputation) theo trạm (một số trạm bị thiếu quý, ví dụ thiếu 2020Q2 thì lấy trung bình của Q1 và Q3)
-    def fill_missing(group):
-        # Nội suy tuyến tính
-        group[features_list] = group[features_list].interpolate(method='linear', limit_direction='both')
-        # Fill median trạm
-        group[features_list] = group[features_list].fillna(group[features_list].median())
-        return group
-
-    df = df.groupby('Station').apply(fill_missing).reset_index(drop=True)
+    # Nội suy tuyến tính
+    df[features_list] = interpolate_by_group(df, features_list, 'Station')
+    # Fill median trạm
+    df[features_list] = df[features_list].fillna(
+        df.groupby('Station')[features_list].transform('median')
+    )
     
     # Fill median cho các ô feature bị thiếu
     df[features_list] = df[features_list].fillna(df[features_list].median())
 
-    # Tạo Lag Features
-    lag_cols = []
-    for col in features_list:
-        for lag in lags:
-            new_col_name = f"{col}_lag{lag}"
-            lag_cols.append(new_col_name)
-            df[new_col_name] = df.groupby('Station')[col].shift(lag)
+    # Tạo Lag Features (một lần shift nhiều cột cho mỗi lag)
+    shifted = {lag: df.groupby('Station')[features_list].shift(lag) for lag in lags}
+    lag_cols = [f"{col}_lag{lag}" for col in features_list for lag in lags]
+    df_lags = pd.DataFrame(
+        {f"{col}_lag{lag}": shifted[lag][col] for col in features_list for lag in lags},
+        index=df.index
+    )
+    df = pd.concat([df, df_lags], axis=1)
     
     df['Quarter_Num'] = df['Date'].dt.quarter
     time_features = ['Quarter_Num']
@@ -69,6 +135,25 @@ def prepare_time_series_data(csv_path, features_list, lags=[1, 4]):
     input_features = lag_cols + time_features
     return df_final, input_features
 
+# Hàm tạo mục tiêu cho dự báo trực tiếp: mỗi bước h có cột riêng {c}_h{h}.
+# Dòng t có lag1 = giá trị quý t-1, lag4 = quý t-4 (giống chế độ rolling),
+# mục tiêu bước h là giá trị quý t+h-1 của cùng trạm (h = 1 chính là mục tiêu rolling).
+def add_direct_targets(df, features, horizons=DIRECT_HORIZONS, group_cols='Station'):
+    grouped = df.groupby(group_cols, sort=False)[features]
+
+    shifted = []
+    target_cols = []
+    for h in horizons:
+        df_h = grouped.shift(-(h - 1))
+        df_h.columns = [f"{c}_h{h}" for c in features]
+        shifted.append(df_h)
+        target_cols += list(df_h.columns)
+
+    df = pd.concat([df] + shifted, axis=1)
+    # Bỏ các dòng cuối mỗi trạm chưa đủ tương lai cho bước xa nhất
+    df = df.dropna(subset=target_cols).reset_index(drop=True)
+    return df, target_cols
+
 # Hàm xử lý ngoại lệ
 def clip_percentile(series, lower=0.01, upper=0.99):
     lo = series.quantile(lower)
@@ -86,33 +171,269 @@ def handle_outliers(df, features):
     return df
 
 
+# Hàm băm nội dung file (SHA-256), đọc theo từng khối
+def file_hash(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+# Đường dẫn cache: khoá gồm loại dữ liệu, hash file nguồn, phiên bản tiền xử lý và tham số
+def feature_cache_path(kind, csv_path, params):
+    key = json.dumps(
+        {"kind": kind, "source": file_hash(csv_path), "version": PREPROCESS_VERSION, "params": params},
+        sort_keys=True
+    )
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+    return FEATURE_CACHE_DIR / f"{kind}_{Path(csv_path).stem}_{digest}.npz"
+
+# Lưu DataFrame theo cột vào .npz (không pickle); cột chuỗi lưu dạng unicode,
+# `meta` (danh sách cột đặc trưng / mục tiêu...) lưu dạng JSON.
+# Ghi ra file tạm rồi đổi tên để không để lại cache dở dang.
+def save_feature_frame(path, df, meta):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    arrays = {"__columns__": np.array(df.columns, dtype=str), "__meta__": np.array(json.dumps(meta))}
+    for i, col in enumerate(df.columns):
+        values = df[col].to_numpy()
+        arrays[f"col{i}"] = values.astype(str) if values.dtype == object else values
+
+    tmp_path = path.with_name(path.name + f".{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+def load_feature_frame(path):
+    with np.load(path, allow_pickle=False) as data:
+        columns = data["__columns__"].tolist()
+        df = pd.DataFrame({
+            col: data[f"col{i}"].astype(object) if data[f"col{i}"].dtype.kind == 'U' else data[f"col{i}"]
+            for i, col in enumerate(columns)
+        })
+        meta = json.loads(data["__meta__"].item())
+    return df, meta
+
+# Hàm lấy (df, meta) từ cache nếu có, nếu không thì gọi build() rồi lưu lại.
+# build() trả về (df, meta) với meta là dict JSON được.
+def cached_feature_frame(kind, csv_path, params, build, use_cache=True):
+    if not use_cache:
+        return build()
+
+    path = feature_cache_path(kind, csv_path, params)
+    if path.exists():
+        try:
+            df, meta = load_feature_frame(path)
+            print(f"⚡ Dùng ma trận đặc trưng đã cache: {path.name} {df.shape}")
+            return df, meta
+        except (OSError, ValueError, KeyError):
+            print(f"⚠️ Cache hỏng, tạo lại: {path.name}")
+
+    df, meta = build()
+    save_feature_frame(path, df, meta)
+    return df, meta
+
+# Hàm chuẩn bị dữ liệu huấn luyện HÀU / CÁ GIÒ (prepare_time_series_data, tuỳ chọn
+# handle_outliers), dùng cache khi file nguồn và tham số không đổi.
+# Trả về (df, input_features) như prepare_time_series_data.
+def load_training_frame(csv_path, features_list, lags=[1, 4], clip_outliers=True, use_cache=True):
+    def build():
+        df, input_features = prepare_time_series_data(csv_path, features_list, lags=lags)
+        if clip_outliers:
+            df = handle_outliers(df, features_list)
+        return df, {"input_features": input_features}
+
+    params = {"features": list(features_list), "lags": list(lags), "clip_outliers": clip_outliers}
+    df, meta = cached_feature_frame("species", csv_path, params, build, use_cache)
+    return df, meta["input_features"]
+
+
+# Tham số đã tinh chỉnh (model/tune.py) được lưu cạnh bundle mô hình: <tên mô hình>_params.json
+def tuned_params_path(model_out_path):
+    return f"{bundle_path(model_out_path)}_params.json"
+
+# Hàm đọc tham số đã tinh chỉnh (nếu có) để ghi đè tham số mặc định khi huấn luyện
+def load_tuned_params(model_out_path):
+    path = tuned_params_path(model_out_path)
+    if not os.path.exists(path):
+        return {}
+
+    with open(path, encoding='utf-8') as f:
+        tuned = json.load(f)
+    print(f"⚙️  Dùng tham số đã tinh chỉnh: {path}")
+    return tuned["params"]
+
+# Hàm tách tập kiểm định theo thời gian: `n_last` dòng (quý) mới nhất của mỗi trạm
+# là tập kiểm định, bỏ thêm `gap` dòng ngay trước đó khỏi tập huấn luyện.
+# Mô hình trực tiếp cần gap = max(horizons) - 1: mục tiêu {c}_h{h} của các dòng đó
+# là giá trị của chính các quý kiểm định.
+# Trả về (mặt nạ huấn luyện, mặt nạ kiểm định)
+def time_holdout_split(df, group_cols, date_col, n_last=VALID_QUARTERS, gap=0):
+    rank = df.groupby(group_cols)[date_col].rank(method='first', ascending=False)
+    return (rank > n_last + gap).to_numpy(), (rank <= n_last).to_numpy()
+
+# Số dòng mỗi trạm bỏ trước tập kiểm định để mục tiêu huấn luyện không chạm tới nó
+def holdout_gap(horizons=None):
+    return max(horizons) - 1 if horizons else 0
+
+# Hàm cắt booster tại vòng tốt nhất của early stopping: mô hình lưu ra chỉ còn các
+# cây thực sự được dùng khi predict (nhỏ hơn, dự báo nhanh hơn).
+# Giữ ít nhất `min_rounds` cây (nếu booster đã có đủ số vòng đó).
+def truncate_to_best_iteration(estimator, min_rounds=1):
+    booster = estimator.get_booster()
+    best_score = booster.best_score
+    n_rounds = min(max(booster.best_iteration + 1, min_rounds), booster.num_boosted_rounds())
+    best_iteration = n_rounds - 1
+
+    truncated = booster[:n_rounds]
+    truncated.set_attr(best_iteration=str(best_iteration), best_score=str(best_score))
+    truncated.feature_names = booster.feature_names
+
+    estimator._Booster = truncated
+    # Bỏ early stopping để fit tiếp (fine-tune) không đòi eval_set
+    estimator.set_params(early_stopping_rounds=None)
+    return estimator
+
+# Hàm huấn luyện một biến mục tiêu (một booster) có early stopping, cắt tại vòng tốt nhất
+# (không ít hơn min_rounds cây)
+def fit_target(xgb_params, X_train, y_train, X_valid, y_valid, early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+               min_rounds=MIN_BOOST_ROUNDS):
+    estimator = xgb.XGBRegressor(early_stopping_rounds=early_stopping_rounds, **xgb_params)
+    estimator.fit(X_train, y_train, eval_set=[(X_valid, y_valid)], verbose=False)
+    return truncate_to_best_iteration(estimator, min_rounds)
+
+# Hàm học lại với đúng số cây early stopping đã chọn trên toàn bộ dữ liệu (kể cả tập
+# kiểm định): mô hình lưu ra vẫn học được các quý mới nhất mà dashboard dự báo từ đó
+def refit_target(xgb_params, n_trees, X, y, **extra_params):
+    estimator = xgb.XGBRegressor(**dict(xgb_params, n_estimators=n_trees, **extra_params))
+    return estimator.fit(X, y)
+
+# Gói các booster từng biến lại như MultiOutputRegressor.fit để phần còn lại của
+# pipeline (predict, lưu bundle, fine-tune) dùng như cũ
+def wrap_multi_output(estimators, xgb_params):
+    model = MultiOutputRegressor(xgb.XGBRegressor(**xgb_params))
+    model.estimators_ = list(estimators)
+    model.n_features_in_ = estimators[0].n_features_in_
+    model.feature_names_in_ = estimators[0].feature_names_in_
+    return model
+
+# Hàm huấn luyện có tập kiểm định: mỗi biến (mỗi booster) dừng sớm theo RMSE kiểm
+# định của chính nó rồi được cắt tại vòng tốt nhất (ít nhất min_rounds cây). Với booster
+# nhiều đầu ra (multi_strategy) thì dừng sớm theo RMSE trung bình của mọi biến.
+# refit=True: sau khi chọn số cây, học lại trên `refit_data` = (X, y) (mặc định
+# train + kiểm định) bằng refit_target.
+# Trả về (model, số cây của từng biến, RMSE kiểm định của từng biến trước khi học lại)
+def fit_with_early_stopping(xgb_params, X_train, y_train, X_valid, y_valid,
+                            multi_strategy=None, early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+                            min_rounds=MIN_BOOST_ROUNDS, refit=True, refit_data=None):
+    if refit_data is None:
+        refit_data = (pd.concat([X_train, X_valid]), pd.concat([y_train, y_valid]))
+    X_full, y_full = refit_data
+
+    if multi_strategy is None:
+        estimators = [
+            fit_target(xgb_params, X_train, y_train[c], X_valid, y_valid[c], early_stopping_rounds, min_rounds)
+            for c in y_train.columns
+        ]
+        model = wrap_multi_output(estimators, xgb_params)
+        n_trees = [e.best_iteration + 1 for e in estimators]
+        valid_rmse = np.sqrt(mean_squared_error(y_valid, model.predict(X_valid), multioutput='raw_values'))
+        if refit:
+            model = wrap_multi_output(
+                [refit_target(xgb_params, n, X_full, y_full[c]) for n, c in zip(n_trees, y_train.columns)],
+                xgb_params
+            )
+    else:
+        model = xgb.XGBRegressor(tree_method='hist', multi_strategy=multi_strategy,
+                                 early_stopping_rounds=early_stopping_rounds, **xgb_params)
+        model.fit(X_train, y_train, eval_set=[(X_valid, y_valid)], verbose=False)
+        model = truncate_to_best_iteration(model, min_rounds)
+        n_trees = [model.best_iteration + 1] * y_train.shape[1]
+        valid_rmse = np.sqrt(mean_squared_error(y_valid, model.predict(X_valid), multioutput='raw_values'))
+        if refit:
+            model = refit_target(xgb_params, n_trees[0], X_full, y_full,
+                                 tree_method='hist', multi_strategy=multi_strategy)
+
+    return model, n_trees, valid_rmse
+
+# Hàm in RMSE theo biến (hoặc trung bình theo bước h với mô hình dự báo trực tiếp)
+def print_rmse(rmse, features, horizons=None, n_trees=None):
+    if horizons is not None:
+        rmse = np.reshape(rmse, (len(horizons), len(features)))
+        trees = np.reshape(n_trees, rmse.shape) if n_trees is not None else None
+        for i, h in enumerate(horizons):
+            extra = f" | cây TB: {np.mean(trees[i]):.0f}" if trees is not None else ""
+            print(f"   🔹 h={h:<13} RMSE: {np.mean(rmse[i]):.4f}{extra}")
+    else:
+        for i, col_name in enumerate(features):
+            extra = f" | cây: {n_trees[i]}" if n_trees is not None else ""
+            print(f"   🔹 {col_name:<15} RMSE: {rmse[i]:.4f}{extra}")
+
 # Hàm huấn luyện
-def train_forecast_model(csv_path, features, model_out_path, meta_out_path=None):
+# mode="rolling": dự báo quý kế tiếp (dùng lặp rolling khi dự báo nhiều quý)
+# mode="direct": mỗi bước h trong `horizons` có mô hình riêng (các cột {c}_h{h}),
+#                mọi bước được dự báo cùng lúc từ cùng một dòng đặc trưng
+# multi_strategy=None: MultiOutputRegressor, mỗi biến một booster huấn luyện lần lượt
+# multi_strategy="multi_output_tree" / "one_output_per_tree": một booster XGBoost
+#                nhiều đầu ra (lá vector / mỗi cây một biến), một lần dựng histogram
+#                cho mọi biến và một lần gọi predict khi dự báo
+# valid_quarters > 0: giữ `valid_quarters` quý cuối mỗi trạm làm tập kiểm định,
+#                chọn số cây từng biến (dừng sớm, ít nhất MIN_BOOST_ROUNDS), báo RMSE ngoài mẫu
+#                rồi học lại trên toàn bộ dữ liệu; 0 = huấn luyện đủ n_estimators
+def train_forecast_model(csv_path, features, model_out_path,
+                         mode="rolling", horizons=DIRECT_HORIZONS, multi_strategy=None,
+                         valid_quarters=VALID_QUARTERS, use_cache=True):
     model_out_path = str(model_out_path)
+    if mode not in ("rolling", "direct"):
+        raise ValueError("mode phải là 'rolling' hoặc 'direct'")
     
-    df_train, input_cols = prepare_time_series_data(csv_path, features, lags=[1, 4])
+    # Đọc + làm sạch + tạo lag + xử lý ngoại lệ (lấy từ cache nếu file nguồn không đổi)
+    df_train, input_cols = load_training_frame(csv_path, features, lags=[1, 4], use_cache=use_cache)
     
     if df_train is None:
         return
-    
-    df_train = handle_outliers(df_train, features)
+
+    target_cols = features
+    if mode == "direct":
+        df_train, target_cols = add_direct_targets(df_train, features, horizons)
+        print(f"🎯 Dự báo trực tiếp {len(horizons)} bước: {len(df_train)} mẫu, {len(target_cols)} mục tiêu")
 
     X = df_train[input_cols]      # Quá khứ
-    y = df_train[features]        # Hiện tại (Mục tiêu)
+    y = df_train[target_cols]     # Hiện tại / các quý tới (Mục tiêu)
 
     # Các tham số
-    model = MultiOutputRegressor(xgb.XGBRegressor(
-        n_estimators=1000,
-        learning_rate=0.05,
-        max_depth=5,            # Độ sâu trung bình (tránh overfit)
-        subsample=0.8,          # Mỗi cây học 80% số dòng
-        colsample_bytree=0.8,   # Mỗi cây học 80% số cột, giống kiểu drop out trong NN
-        objective='reg:squarederror',
-        n_jobs=-1,
-        random_state=42
-    ))
-
-    model.fit(X, y)
+    xgb_params = dict(FORECAST_XGB_PARAMS)
+    xgb_params.update(load_tuned_params(model_out_path))
+    report_horizons = horizons if mode == "direct" else None
+    metrics = {}
+
+    if valid_quarters:
+        # Tách theo thời gian: quý cuối mỗi trạm để kiểm định, không xáo trộn
+        train_mask, valid_mask = time_holdout_split(
+            df_train, 'Station', 'Date', valid_quarters, gap=holdout_gap(report_horizons)
+        )
+        # Chọn số cây trên tập kiểm định rồi học lại trên toàn bộ dữ liệu (kể cả quý mới nhất)
+        model, n_trees, valid_rmse = fit_with_early_stopping(
+            xgb_params, X[train_mask], y[train_mask], X[valid_mask], y[valid_mask],
+            multi_strategy=multi_strategy, refit_data=(X, y)
+        )
+
+        print(f"\n📊 KẾT QUẢ KIỂM ĐỊNH ({valid_quarters} quý cuối mỗi trạm, {int(valid_mask.sum())} mẫu):")
+        print("-" * 50)
+        print_rmse(valid_rmse, features, report_horizons, n_trees)
+        print("-" * 50)
+        print(f"👉 RMSE kiểm định trung bình: {np.mean(valid_rmse):.4f} | tổng số cây: {sum(n_trees)}")
+        metrics["valid_quarters"] = valid_quarters
+        metrics["valid_rmse"] = dict(zip(target_cols, valid_rmse))
+        metrics["n_trees"] = dict(zip(target_cols, n_trees))
+    else:
+        if multi_strategy is None:
+            model = MultiOutputRegressor(xgb.XGBRegressor(**xgb_params))
+        else:
+            model = xgb.XGBRegressor(tree_method='hist', multi_strategy=multi_strategy, **xgb_params)
+
+        model.fit(X, y)
     
     # Tính RMSE sau khi train (dùng tập train để test nên là kết quả ko có ý nghĩa lắm)
     print("\n📊 KẾT QUẢ ĐÁNH GIÁ (TRAINING SCORE):")
@@ -123,27 +444,38 @@ def train_forecast_model(csv_path, features, model_out_path, meta_out_path=None)
     mse = mean_squared_error(y, y_pred, multioutput='raw_values')
     rmse = np.sqrt(mse)
     
-    for i, col_name in enumerate(features):
-        print(f"   🔹 {col_name:<15} RMSE: {rmse[i]:.4f}")
+    # Mô hình trực tiếp: trung bình RMSE các biến theo từng bước dự báo
+    print_rmse(rmse, features, report_horizons)
         
     print("-" * 50)
     print(f"👉 RMSE trung bình toàn mô hình: {np.mean(rmse):.4f}")
+    metrics["train_rmse"] = dict(zip(target_cols, rmse))
 
-
-    # Lưu model
-    joblib.dump(model, model_out_path)
-    print(f"\n🎉 Đã lưu model tại: {model_out_path}")
-
-    # Lưu metadata
-    if meta_out_path is None:
-        meta_out_path = model_out_path.replace('.pkl', '_features.pkl')
-    
-    joblib.dump((input_cols, features), meta_out_path)
-    print(f"ℹ️  Đã lưu danh sách features tại: {meta_out_path}")
+    # Lưu model: bundle gồm booster dạng gốc của XGBoost + manifest (cột đầu vào,
+    # biến mục tiêu, bước dự báo, hash dữ liệu, chỉ số đánh giá)
+    path = save_model_bundle(
+        model_out_path, model, input_cols, features,
+        horizons=horizons if mode == "direct" else None,
+        lags=[1, 4],
+        data_path=csv_path,
+        metrics=metrics
+    )
+    print(f"\n🎉 Đã lưu model tại: {path}")
 
 
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(description="Huấn luyện mô hình môi trường gốc (dữ liệu Hồng Kông)")
+    parser.add_argument("--mode", choices=["rolling", "direct"], default="rolling",
+                        help="rolling: dự báo quý kế tiếp; direct: mô hình riêng cho từng bước h = 1..8")
+    parser.add_argument("--multi-strategy", choices=["multi_output_tree", "one_output_per_tree"], default=None,
+                        help="một booster XGBoost nhiều đầu ra thay cho MultiOutputRegressor")
+    parser.add_argument("--valid-quarters", type=int, default=VALID_QUARTERS,
+                        help="số quý cuối mỗi trạm làm tập kiểm định + early stopping (0 = tắt)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="tiền xử lý lại từ CSV, không dùng cache ma trận đặc trưng")
+    args = parser.parse_args()
+
     BASE_DIR = Path(__file__).resolve().parent
     PROJECT_DIR = BASE_DIR.parent 
     
@@ -152,16 +484,25 @@ if __name__ == "__main__":
 
     DATA_DIR = PROJECT_DIR / "data" / "hk_water_quality"
 
+    suffix = "forecast_model" if args.mode == "rolling" else "direct_model"
 
     train_forecast_model(
         csv_path = DATA_DIR / "hk_oyster_quarterly_21vars.csv",
         features = OYSTER_FEATURES,
-        model_out_path = OUTPUT_DIR / "hk_oyster_forecast_model.pkl"
+        model_out_path = OUTPUT_DIR / f"hk_oyster_{suffix}",
+        mode = args.mode,
+        multi_strategy = args.multi_strategy,
+        valid_quarters = args.valid_quarters,
+        use_cache = not args.no_cache
     )
 
 
     train_forecast_model(
         csv_path = DATA_DIR / "hk_cobia_quarterly_21vars.csv",
         features = COBIA_FEATURES,
-        model_out_path = OUTPUT_DIR / "hk_cobia_forecast_model.pkl"
-    )
\ No newline at end of file
+        model_out_path = OUTPUT_DIR / f"hk_cobia_{suffix}",
+        mode = args.mode,
+        multi_strategy = args.multi_strategy,
+        valid_quarters = args.valid_quarters,
+        use_cache = not args.no_cache
+    )
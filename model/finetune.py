@@ -0,0 +1,282 @@
+import os
+import time
+import argparse
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from sklearn.metrics import mean_squared_error
+
+from basemodel import (
+    DIRECT_HORIZONS,
+    EARLY_STOPPING_ROUNDS,
+    add_direct_targets,
+    bundle_path,
+    load_model_bundle,
+    load_training_frame,
+    print_rmse,
+    save_model_bundle,
+    holdout_gap,
+    time_holdout_split,
+    truncate_to_best_iteration,
+)
+from metal import load_metal_data
+
+warnings.filterwarnings('ignore')
+
+
+# Fine-tune dùng chung cho mọi bundle (HÀU, CÁ GIÒ, KIM LOẠI; rolling hoặc direct).
+#
+# Mỗi booster (mỗi biến mục tiêu) được huấn luyện tiếp từ booster cũ
+# (fit(..., xgb_model=booster cũ)) với learning rate nhỏ, các biến chạy song song
+# trong cùng tiến trình (XGBoost nhả GIL khi huấn luyện, như khi nạp bundle).
+# `valid_quarters` quý mới nhất mỗi trạm làm tập kiểm định: dừng sớm, cắt tại vòng
+# tốt nhất và giữ nguyên booster cũ nếu cây thêm vào không làm RMSE kiểm định tốt hơn.
+# Sau đó (mặc định) huấn luyện lại đúng số cây đó trên toàn bộ dữ liệu mới để không
+# bỏ phí các quý mới nhất. Số cây thêm vào của từng biến được ghi vào manifest.
+#
+#   python model/finetune.py --family cobia --mode direct
+
+BASE_DIR = Path(__file__).resolve().parent
+PROJECT_DIR = BASE_DIR.parent
+MODEL_DIR = PROJECT_DIR / "model" / "output"
+QN_DATA_PATH = PROJECT_DIR / "data" / "data_quang_ninh" / "qn_env_clean_ready.csv"
+
+# Khi fine-tune, học chậm lại để không "quên" kiến thức cũ quá nhanh
+FINETUNE_LEARNING_RATE = 0.005
+FINETUNE_MAX_ROUNDS = 1000
+# Số quý cuối mỗi trạm làm tập kiểm định cho mọi họ mô hình: dữ liệu mới để
+# fine-tune thường chỉ vài quý, giữ lại ít hơn VALID_QUARTERS khi huấn luyện từ đầu
+FINETUNE_VALID_QUARTERS = 2
+
+# family → (mô hình gốc, mô hình fine-tune) theo chế độ
+FINETUNE_MODELS = {
+    "oyster": {"rolling": ("hk_oyster_forecast_model", "hk_oyster_finetuned"),
+               "direct": ("hk_oyster_direct_model", "hk_oyster_direct_finetuned")},
+    "cobia": {"rolling": ("hk_cobia_forecast_model", "hk_cobia_finetuned"),
+              "direct": ("hk_cobia_direct_model", "hk_cobia_direct_finetuned")},
+    "metal": {"rolling": ("metal_ts_model", "metal_ts_finetuned"),
+              "direct": ("metal_direct_model", "metal_direct_finetuned")},
+}
+
+
+# Dữ liệu fine-tune theo đúng cấu trúc đầu vào / đầu ra của bundle gốc
+# (logic y hệt như lúc train mô hình gốc, lấy từ cache nếu file dữ liệu không đổi).
+# Trả về (df, y_cols, train_mask, valid_mask); mô hình trực tiếp bỏ thêm
+# max(horizons) - 1 quý trước tập kiểm định (time_holdout_split)
+def load_finetune_data(family, data_path, manifest, valid_quarters, use_cache=True):
+    horizons = manifest["horizons"]
+    if family == "metal":
+        mode = "rolling" if horizons is None else "direct"
+        df, _, _, y_cols = load_metal_data(data_path, mode, horizons or DIRECT_HORIZONS, use_cache)
+        group_cols, date_col = ["X", "Y"], "Quarter"
+    else:
+        features = manifest["targets"]
+        df, _ = load_training_frame(data_path, features, lags=manifest["lags"],
+                                    clip_outliers=False, use_cache=use_cache)
+        y_cols = features
+        if horizons is not None:
+            df, y_cols = add_direct_targets(df, features, horizons)
+        group_cols, date_col = 'Station', 'Date'
+
+    if valid_quarters:
+        train_mask, valid_mask = time_holdout_split(
+            df, group_cols, date_col, valid_quarters, gap=holdout_gap(horizons)
+        )
+    else:
+        train_mask, valid_mask = np.ones(len(df), dtype=bool), np.zeros(len(df), dtype=bool)
+    return df, list(y_cols), train_mask, valid_mask
+
+def _rmse(y, y_pred):
+    return float(np.sqrt(mean_squared_error(y, y_pred)))
+
+# Fine-tune một booster (một biến mục tiêu, hoặc cả booster nhiều đầu ra).
+# Trả về (estimator mới, số cây thêm vào, RMSE kiểm định trước / sau, số giây)
+def finetune_estimator(estimator, X, y, train_mask, valid_mask, learning_rate=FINETUNE_LEARNING_RATE,
+                       max_rounds=FINETUNE_MAX_ROUNDS, refit=True, n_threads=1):
+    start = time.perf_counter()
+    # Booster gốc đã cắt tại vòng tốt nhất mang thuộc tính best_iteration; huấn luyện
+    # tiếp sẽ chép thuộc tính này sang booster mới và predict() bỏ qua mọi cây thêm vào
+    old_booster = estimator.get_booster().copy()
+    old_booster.set_attr(best_iteration=None, best_score=None)
+    base_rounds = old_booster.num_boosted_rounds()
+    params = dict(estimator.get_params(), learning_rate=learning_rate, n_jobs=n_threads)
+
+    if not valid_mask.any():
+        # Không có tập kiểm định: thêm đủ max_rounds cây như trước
+        new = type(estimator)(**dict(params, n_estimators=max_rounds, early_stopping_rounds=None))
+        new.fit(X, y, xgb_model=old_booster, verbose=False)
+        return new, max_rounds, None, None, time.perf_counter() - start
+
+    X_train, y_train = X[train_mask], y[train_mask]
+    X_valid, y_valid = X[valid_mask], y[valid_mask]
+    base_rmse = _rmse(y_valid, estimator.predict(X_valid))
+
+    new = type(estimator)(**dict(params, n_estimators=max_rounds, early_stopping_rounds=EARLY_STOPPING_ROUNDS))
+    new.fit(X_train, y_train, eval_set=[(X_valid, y_valid)], xgb_model=old_booster, verbose=False)
+    new = truncate_to_best_iteration(new)
+    valid_rmse = _rmse(y_valid, new.predict(X_valid))
+
+    n_appended = new.best_iteration + 1 - base_rounds
+    if valid_rmse >= base_rmse:
+        # Cây mới không giúp gì trên quý gần nhất: giữ nguyên booster cũ
+        return estimator, 0, base_rmse, base_rmse, time.perf_counter() - start
+
+    if refit:
+        # Học lại đúng số cây tìm được trên toàn bộ dữ liệu mới (kể cả quý kiểm định)
+        new = type(estimator)(**dict(params, n_estimators=n_appended, early_stopping_rounds=None))
+        new.fit(X, y, xgb_model=old_booster, verbose=False)
+    return new, n_appended, base_rmse, valid_rmse, time.perf_counter() - start
+
+def finetune_model(base_model_path, new_data_path, output_path, family,
+                   learning_rate=FINETUNE_LEARNING_RATE, max_rounds=FINETUNE_MAX_ROUNDS,
+                   valid_quarters=FINETUNE_VALID_QUARTERS, refit=True, workers=None, use_cache=True):
+    """
+    Hàm Fine-tune: Cập nhật mô hình cũ với dữ liệu mới, các biến mục tiêu song song.
+    """
+    base_model_path = bundle_path(base_model_path)
+    t_start = time.perf_counter()
+
+    print(f"\n🔧 BẮT ĐẦU FINE-TUNE MÔ HÌNH TỪ: {base_model_path}")
+
+    # 1. LOAD MÔ HÌNH GỐC + MANIFEST (cột đầu vào, biến mục tiêu, bước dự báo)
+    try:
+        model, manifest = load_model_bundle(base_model_path)
+    except FileNotFoundError:
+        print(f"❌ Lỗi: Không tìm thấy model gốc tại {base_model_path}")
+        return
+    except ValueError as e:
+        print(f"❌ Lỗi: Bundle model gốc không hợp lệ ({e}). Không thể fine-tune chuẩn.")
+        return
+
+    input_cols = manifest["input_cols"]
+    targets = manifest["targets"]
+    horizons = manifest["horizons"]
+
+    # 2. CHUẨN BỊ DỮ LIỆU MỚI
+    print(f"🔄 Đang xử lý dữ liệu mới từ: {new_data_path}")
+    df_ft, y_cols, train_mask, valid_mask = load_finetune_data(family, new_data_path, manifest, valid_quarters, use_cache)
+    if len(df_ft) == 0:
+        print("⚠️ Dữ liệu fine-tune trống hoặc không đủ để tạo lag. Hủy bỏ.")
+        return
+
+    X_new = df_ft[input_cols]
+    y_new = df_ft[y_cols]
+    print(f"📊 Kích thước dữ liệu Fine-tune: {len(X_new)} mẫu "
+          f"({int(valid_mask.sum())} mẫu kiểm định, {valid_quarters} quý cuối mỗi trạm)")
+
+    # 3. FINE-TUNE: mỗi booster một job; booster nhiều đầu ra (--multi-strategy) là một job
+    multi_output = hasattr(model, "estimators_")
+    if multi_output:
+        jobs = [(e, y_new.iloc[:, i]) for i, e in enumerate(model.estimators_)]
+    else:
+        jobs = [(model, y_new)]
+
+    n_cores = os.cpu_count() or 1
+    workers = max(1, min(workers or n_cores, len(jobs)))
+    n_threads = max(1, n_cores // workers)
+    print(f"⏳ Fine-tune {len(jobs)} booster | {workers} luồng song song × {n_threads} luồng XGBoost")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(
+            lambda job: finetune_estimator(job[0], X_new, job[1], train_mask, valid_mask,
+                                           learning_rate, max_rounds, refit, n_threads),
+            jobs
+        ))
+
+    if multi_output:
+        model.estimators_ = [r[0] for r in results]
+        appended = [r[1] for r in results]
+    else:
+        model = results[0][0]
+        appended = [results[0][1]] * len(y_cols)
+
+    # 4. ĐÁNH GIÁ
+    metrics = {"appended_trees": dict(zip(y_cols, appended))}
+    if valid_mask.any():
+        base_rmse = [r[2] for r in results]
+        valid_rmse = [r[3] for r in results]
+        if not multi_output:
+            base_rmse, valid_rmse = base_rmse * len(y_cols), valid_rmse * len(y_cols)
+
+        print("\n📊 RMSE KIỂM ĐỊNH (trước → sau fine-tune, cây thêm vào):")
+        print("-" * 50)
+        if horizons is not None:
+            shape = (len(horizons), len(targets))
+            for h, b, v, n in zip(horizons, np.reshape(base_rmse, shape), np.reshape(valid_rmse, shape),
+                                  np.reshape(appended, shape)):
+                print(f"   🔹 h={h:<13} {np.mean(b):.4f} → {np.mean(v):.4f} | cây TB: {np.mean(n):.0f}")
+        else:
+            for c, b, v, n in zip(y_cols, base_rmse, valid_rmse, appended):
+                print(f"   🔹 {c:<15} {b:.4f} → {v:.4f} | cây: {n}")
+        metrics["valid_quarters"] = valid_quarters
+        metrics["base_valid_rmse"] = dict(zip(y_cols, base_rmse))
+        metrics["valid_rmse"] = dict(zip(y_cols, valid_rmse))
+
+    rmse = np.sqrt(mean_squared_error(y_new, model.predict(X_new), multioutput='raw_values'))
+    print("\n📊 KẾT QUẢ SAU KHI FINE-TUNE (TRÊN TẬP DỮ LIỆU MỚI):")
+    print("-" * 50)
+    print_rmse(rmse, targets, horizons)
+    print("-" * 50)
+    print(f"👉 RMSE trung bình: {np.mean(rmse):.4f} | tổng số cây thêm vào: {sum(appended)}")
+    metrics["finetune_rmse"] = dict(zip(y_cols, rmse))
+
+    # 5. LƯU MÔ HÌNH MỚI: giữ nguyên cấu trúc input/output của model gốc, ghi thêm
+    # dữ liệu fine-tune, số cây thêm vào và checksum của model gốc
+    seconds = [r[4] for r in results]
+    path = save_model_bundle(
+        output_path, model, input_cols, targets,
+        horizons=horizons,
+        lags=manifest["lags"],
+        data_path=new_data_path,
+        metrics=metrics,
+        extra={
+            "base_model": {"name": manifest["name"], "checksum": manifest["checksum"]},
+            "finetune": {"learning_rate": learning_rate, "max_rounds": max_rounds, "refit": refit},
+        }
+    )
+
+    print(f"\n🎉 Đã lưu model Fine-tune tại: {path} | {time.perf_counter() - t_start:.1f}s "
+          f"(booster chậm nhất {max(seconds):.1f}s, tổng {sum(seconds):.1f}s)")
+    return path
+
+def main(family=None, argv=None):
+    name = {"oyster": "HÀU", "cobia": "CÁ GIÒ", "metal": "KIM LOẠI"}.get(family, "HÀU / CÁ GIÒ / KIM LOẠI")
+    parser = argparse.ArgumentParser(description=f"Fine-tune mô hình {name} trên dữ liệu Quảng Ninh")
+    if family is None:
+        parser.add_argument("--family", choices=list(FINETUNE_MODELS), required=True)
+    parser.add_argument("--mode", choices=["rolling", "direct"], default="rolling",
+                        help="rolling: mô hình quý kế tiếp; direct: mô hình dự báo trực tiếp h = 1..8")
+    parser.add_argument("--data", default=str(QN_DATA_PATH), help="file dữ liệu mới để fine-tune")
+    parser.add_argument("--learning-rate", type=float, default=FINETUNE_LEARNING_RATE)
+    parser.add_argument("--max-rounds", type=int, default=FINETUNE_MAX_ROUNDS,
+                        help="số cây thêm vào tối đa của mỗi booster")
+    parser.add_argument("--valid-quarters", type=int, default=FINETUNE_VALID_QUARTERS,
+                        help="số quý mới nhất mỗi trạm làm tập kiểm định + early stopping (0 = tắt)")
+    parser.add_argument("--no-refit", action="store_true",
+                        help="không học lại trên toàn bộ dữ liệu sau khi dừng sớm")
+    parser.add_argument("--workers", type=int, default=None, help="số booster fine-tune song song")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="tiền xử lý lại từ CSV, không dùng cache ma trận đặc trưng")
+    args = parser.parse_args(argv)
+    family = family or args.family
+
+    base_name, out_name = FINETUNE_MODELS[family][args.mode]
+    print(f"📂 Base Model: {MODEL_DIR / base_name}")
+
+    return finetune_model(
+        base_model_path=MODEL_DIR / base_name,
+        new_data_path=args.data,
+        output_path=MODEL_DIR / out_name,
+        family=family,
+        learning_rate=args.learning_rate,
+        max_rounds=args.max_rounds,
+        valid_quarters=args.valid_quarters,
+        refit=not args.no_refit,
+        workers=args.workers,
+        use_cache=not args.no_cache
+    )
+
+if __name__ == "__main__":
+    main()
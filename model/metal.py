@@ -4,7 +4,35 @@ from pathlib import Path
 from sklearn.multioutput import MultiOutputRegressor
 from sklearn.metrics import mean_squared_error
 import xgboost as xgb
-import joblib
+import argparse
+
+from basemodel import (
+    DIRECT_HORIZONS,
+    add_direct_targets,
+    cached_feature_frame,
+    fit_with_early_stopping,
+    load_model_bundle,
+    load_tuned_params,
+    save_model_bundle,
+    holdout_gap,
+    time_holdout_split,
+)
+
+# Số quý cuối mỗi trạm làm tập kiểm định: dữ liệu Quảng Ninh chỉ có vài năm
+# mỗi trạm nên giữ ít hơn mô hình môi trường (basemodel.VALID_QUARTERS)
+METAL_VALID_QUARTERS = 2
+
+# Tham số XGBoost mặc định của mô hình kim loại
+METAL_XGB_PARAMS = dict(
+    n_estimators=800,
+    max_depth=5,
+    learning_rate=0.05,
+    subsample=0.8,
+    colsample_bytree=0.8,
+    objective="reg:squarederror",
+    random_state=42,
+    n_jobs=-1
+)
 
 
 def create_lag_features(df, target_cols, lags=(1, 4)):
@@ -16,7 +44,9 @@ def create_lag_features(df, target_cols, lags=(1, 4)):
 
     return df
 
-def train_model_with_station_history(csv_path, model_out_path):
+# Hàm đọc dữ liệu kim loại, tạo lag theo từng trạm (và mục tiêu dự báo trực tiếp).
+# Trả về (df, feature_cols, target_cols, y_cols); df giữ các cột "X", "Y", "Quarter".
+def prepare_metal_data(csv_path, mode="rolling", horizons=DIRECT_HORIZONS):
     df = pd.read_csv(csv_path)
 
     target_cols = ["CN","As","Cd","Pb","Cu","Hg","Zn","Total_Cr"]
@@ -44,37 +74,103 @@ def train_model_with_station_history(csv_path, model_out_path):
         ["year", "quarter"]
     )
 
-    df = df[feature_cols + target_cols].dropna()
+    y_cols = target_cols
+    if mode == "direct":
+        df, y_cols = add_direct_targets(df, target_cols, horizons, group_cols=["X", "Y"])
+
+    df = df.dropna(subset=feature_cols + y_cols)
+
+    return df, feature_cols, target_cols, y_cols
+
+# Như prepare_metal_data nhưng lấy từ cache ma trận đặc trưng (basemodel.cached_feature_frame)
+# nếu file nguồn và tham số không đổi; df chỉ giữ các cột cần cho huấn luyện.
+def load_metal_data(csv_path, mode="rolling", horizons=DIRECT_HORIZONS, use_cache=True):
+    def build():
+        df, feature_cols, target_cols, y_cols = prepare_metal_data(csv_path, mode, horizons)
+        keep = list(dict.fromkeys(["X", "Y", "Quarter"] + feature_cols + target_cols + y_cols))
+        meta = {"feature_cols": feature_cols, "target_cols": target_cols, "y_cols": y_cols}
+        return df[keep].reset_index(drop=True), meta
+
+    params = {"mode": mode, "horizons": list(horizons) if mode == "direct" else None}
+    df, meta = cached_feature_frame("metal", csv_path, params, build, use_cache)
+    return df, meta["feature_cols"], meta["target_cols"], meta["y_cols"]
+
+# mode="rolling": dự báo quý kế tiếp
+# mode="direct": mô hình riêng cho từng bước h trong `horizons` (cột {c}_h{h})
+# Mô hình được lưu dạng bundle (utils/model_bundle.py), như basemodel.py
+# multi_strategy: như train_forecast_model (basemodel.py), None = MultiOutputRegressor
+# valid_quarters > 0: quý cuối mỗi trạm làm tập kiểm định, chọn số cây từng kim loại
+#                    rồi học lại trên toàn bộ dữ liệu
+def train_model_with_station_history(csv_path, model_out_path, mode="rolling", horizons=DIRECT_HORIZONS,
+                                     multi_strategy=None, valid_quarters=METAL_VALID_QUARTERS, use_cache=True):
+    if mode not in ("rolling", "direct"):
+        raise ValueError("mode phải là 'rolling' hoặc 'direct'")
+
+    df, feature_cols, target_cols, y_cols = load_metal_data(csv_path, mode, horizons, use_cache)
 
     X = df[feature_cols]
-    y = df[target_cols]
+    y = df[y_cols]
 
     # ---- model ----
-    model = MultiOutputRegressor(
-        xgb.XGBRegressor(
-            n_estimators=800,
-            max_depth=5,
-            learning_rate=0.05,
-            subsample=0.8,
-            colsample_bytree=0.8,
-            objective="reg:squarederror",
-            random_state=42,
-            n_jobs=-1
+    xgb_params = dict(METAL_XGB_PARAMS)
+    xgb_params.update(load_tuned_params(model_out_path))
+
+    metrics = {}
+
+    if valid_quarters:
+        # ---- tách theo thời gian + early stopping ----
+        train_mask, valid_mask = time_holdout_split(
+            df, ["X", "Y"], "Quarter", valid_quarters,
+            gap=holdout_gap(horizons if mode == "direct" else None)
+        )
+        # Chọn số cây trên tập kiểm định rồi học lại trên toàn bộ dữ liệu (kể cả quý mới nhất)
+        model, n_trees, valid_rmse = fit_with_early_stopping(
+            xgb_params, X[train_mask], y[train_mask], X[valid_mask], y[valid_mask],
+            multi_strategy=multi_strategy, refit_data=(X, y)
         )
-    )
 
-    model.fit(X, y)
+        print(f"\n📊 RMSE (KIỂM ĐỊNH, {valid_quarters} quý cuối mỗi trạm):")
+        if mode == "direct":
+            valid_rmse = valid_rmse.reshape(len(horizons), len(target_cols))
+            trees = np.reshape(n_trees, valid_rmse.shape)
+            for h, rmse_h, trees_h in zip(horizons, valid_rmse, trees):
+                print(f"  h={h:<8}: {np.mean(rmse_h):.4f} | cây TB: {np.mean(trees_h):.0f}")
+        else:
+            for c, r, n in zip(target_cols, valid_rmse, n_trees):
+                print(f"  {c:<10}: {r:.4f} | cây: {n}")
+        metrics["valid_quarters"] = valid_quarters
+        metrics["valid_rmse"] = dict(zip(y_cols, np.ravel(valid_rmse)))
+        metrics["n_trees"] = dict(zip(y_cols, n_trees))
+    else:
+        if multi_strategy is None:
+            model = MultiOutputRegressor(xgb.XGBRegressor(**xgb_params))
+        else:
+            # một booster nhiều đầu ra cho cả 8 kim loại
+            model = xgb.XGBRegressor(tree_method="hist", multi_strategy=multi_strategy, **xgb_params)
+
+        model.fit(X, y)
 
     # ---- đánh giá train (tham khảo) ----
     y_pred = model.predict(X)
     rmse = np.sqrt(mean_squared_error(y, y_pred, multioutput="raw_values"))
 
     print("\n📊 RMSE (TRAIN):")
-    for c, r in zip(target_cols, rmse):
-        print(f"  {c:<10}: {r:.4f}")
-
-    joblib.dump((model, feature_cols), model_out_path)
-    print(f"\n✅ Saved model: {model_out_path}")
+    if mode == "direct":
+        for h, rmse_h in zip(horizons, rmse.reshape(len(horizons), len(target_cols))):
+            print(f"  h={h:<8}: {np.mean(rmse_h):.4f}")
+    else:
+        for c, r in zip(target_cols, rmse):
+            print(f"  {c:<10}: {r:.4f}")
+    metrics["train_rmse"] = dict(zip(y_cols, rmse))
+
+    path = save_model_bundle(
+        model_out_path, model, feature_cols, target_cols,
+        horizons=horizons if mode == "direct" else None,
+        lags=[1, 4],
+        data_path=csv_path,
+        metrics=metrics
+    )
+    print(f"\n✅ Saved model: {path}")
 
 def predict_future_for_station(
     model_path,
@@ -85,7 +181,8 @@ def predict_future_for_station(
 ):
     target_cols = ["CN","As","Cd","Pb","Cu","Hg","Zn","Total_Cr"]
 
-    model, feature_cols = joblib.load(model_path)
+    model, manifest = load_model_bundle(model_path)
+    feature_cols = manifest["input_cols"]
 
     df_station = df_station.copy()
     df_station["Quarter"] = pd.to_datetime(df_station["Quarter"])
@@ -141,14 +238,43 @@ def predict_future_for_station(
     return df_future
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Huấn luyện mô hình kim loại (dữ liệu Quảng Ninh)")
+    parser.add_argument("--mode", choices=["rolling", "direct"], default="rolling",
+                        help="rolling: dự báo quý kế tiếp; direct: mô hình riêng cho từng bước h = 1..8")
+    parser.add_argument("--multi-strategy", choices=["multi_output_tree", "one_output_per_tree"], default=None,
+                        help="một booster XGBoost nhiều đầu ra thay cho MultiOutputRegressor")
+    parser.add_argument("--valid-quarters", type=int, default=METAL_VALID_QUARTERS,
+                        help="số quý cuối mỗi trạm làm tập kiểm định + early stopping (0 = tắt)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="tiền xử lý lại từ CSV, không dùng cache ma trận đặc trưng")
+    args = parser.parse_args()
+
     BASE_DIR = Path(__file__).resolve().parent
     PROJECT_DIR = BASE_DIR.parent
 
     DATA_PATH = PROJECT_DIR / "data" / "data_quang_ninh" / "qn_env_clean_ready.csv"
-    MODEL_PATH = PROJECT_DIR / "model" / "output" / "metal_ts_model.pkl"
+
+    if args.mode == "direct":
+        # Dự báo trực tiếp được phục vụ qua utils.forecast.predict_for_all_stations(strategy="direct")
+        train_model_with_station_history(
+            DATA_PATH,
+            PROJECT_DIR / "model" / "output" / "metal_direct_model",
+            mode="direct",
+            multi_strategy=args.multi_strategy,
+            valid_quarters=args.valid_quarters,
+            use_cache=not args.no_cache
+        )
+        raise SystemExit(0)
+
+    MODEL_PATH = PROJECT_DIR / "model" / "output" / "metal_ts_model"
 
     # ===== TRAIN =====
-    train_model_with_station_history(DATA_PATH, MODEL_PATH)
+    train_model_with_station_history(
+        DATA_PATH, MODEL_PATH,
+        multi_strategy=args.multi_strategy,
+        valid_quarters=args.valid_quarters,
+        use_cache=not args.no_cache
+    )
 
     # ===== PREDICT cho 1 trạm =====
     df = pd.read_csv(DATA_PATH)
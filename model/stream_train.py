@@ -0,0 +1,366 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import resource
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from basemodel import (
+    EARLY_STOPPING_ROUNDS,
+    FEATURE_CACHE_DIR,
+    MIN_BOOST_ROUNDS,
+    FORECAST_XGB_PARAMS,
+    PREPROCESS_VERSION,
+    file_hash,
+    load_feature_frame,
+    load_tuned_params,
+    save_feature_frame,
+    save_model_bundle,
+    truncate_to_best_iteration,
+    wrap_multi_output,
+)
+from utils.history import HK_COLUMNS, parse_lod
+
+
+# Huấn luyện ngoài bộ nhớ (out-of-core) trên dữ liệu quan trắc gốc theo mẫu
+# (data/water_data/marine_water_quality_*.csv: mọi tầng nước, mọi tháng từ 1986),
+# không cần đưa cả bảng đặc trưng vào một DataFrame.
+#
+# Bước 1: đọc từng file nguồn theo khối `--chunk-rows` dòng, tạo lag theo chuỗi
+#         (trạm, tầng nước) và ghi mỗi khối thành một phân vùng .npz
+#         (model/output/feature_cache/records_<hash>/part_*.npz). Giữa hai khối chỉ
+#         mang theo `max(lags)` mẫu cuối của mỗi chuỗi, nên bộ nhớ không phụ thuộc
+#         kích thước dữ liệu. Phân vùng được dùng lại khi file nguồn không đổi.
+# Bước 2: mỗi biến mục tiêu một booster; xgb.DataIter đọc lần lượt từng phân vùng
+#         vào ExtMemQuantileDMatrix (trang histogram lưu trên đĩa) hoặc QuantileDMatrix
+#         (--matrix quantile: chỉ giữ ma trận đã lượng tử hoá 1 byte/ô trong RAM).
+#         Tập kiểm định là `--valid-years` năm cuối: dừng sớm (ít nhất MIN_BOOST_ROUNDS
+#         cây) rồi học lại số cây đó trên toàn bộ dữ liệu, như basemodel.py.
+#
+# Dữ liệu nguồn phải sắp xếp theo ngày trong mỗi chuỗi (trạm, tầng nước) như file
+# gốc của Hồng Kông; dữ liệu nhiều tỉnh chỉ cần cùng schema (utils.history.HK_COLUMNS).
+#
+#   python model/stream_train.py --chunk-rows 20000
+
+BASE_DIR = Path(__file__).resolve().parent
+PROJECT_DIR = BASE_DIR.parent
+OUTPUT_DIR = PROJECT_DIR / "model" / "output"
+DATA_DIR = PROJECT_DIR / "data" / "water_data"
+
+RECORD_FEATURES = list(HK_COLUMNS)
+SERIES_COLS = ["Station", "Depth"]
+DEPTH_CODES = {"Surface Water": 0, "Middle Water": 1, "Bottom Water": 2}
+TIME_FEATURES = ["Days_Since_Lag1", "Month", "Quarter_Num", "Depth_Code"]
+
+DEFAULT_CHUNK_ROWS = 20000
+DEFAULT_VALID_YEARS = 3
+
+
+def peak_memory_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def record_input_cols(lags):
+    return [f"{c}_lag{lag}" for c in RECORD_FEATURES for lag in lags] + TIME_FEATURES
+
+# Đọc một khối dòng của file nguồn: Station, Date, Depth + các biến (giá trị "<x" → x / 2)
+def parse_records(chunk):
+    df = pd.DataFrame({
+        "Station": chunk["Station"].to_numpy(),
+        "Date": pd.to_datetime(chunk["Dates"], errors="coerce").to_numpy(),
+        "Depth": chunk["Depth"].to_numpy(),
+    })
+    for std_col, hk_col in HK_COLUMNS.items():
+        df[std_col] = parse_lod(chunk[hk_col]).to_numpy()
+    return df.dropna(subset=["Date"]).reset_index(drop=True)
+
+# Tạo lag cho một khối dòng; `n_carry` dòng đầu là các mẫu cuối của khối trước
+# (chỉ dùng làm lịch sử). Trả về (bảng đặc trưng + mục tiêu, phần mang sang khối sau)
+def lag_features(batch, n_carry, lags):
+    series = batch.groupby(SERIES_COLS, sort=False)
+    if (series["Date"].diff() < pd.Timedelta(0)).any():
+        raise ValueError("Dữ liệu nguồn phải sắp xếp theo ngày trong mỗi chuỗi (trạm, tầng nước)")
+
+    shifted = {lag: series[RECORD_FEATURES].shift(lag) for lag in lags}
+    out = pd.DataFrame(
+        {f"{c}_lag{lag}": shifted[lag][c] for c in RECORD_FEATURES for lag in lags},
+        index=batch.index
+    ).astype(np.float32)
+
+    out["Days_Since_Lag1"] = (batch["Date"] - series["Date"].shift(1)).dt.days.astype(np.float32)
+    out["Month"] = batch["Date"].dt.month.astype(np.float32)
+    out["Quarter_Num"] = batch["Date"].dt.quarter.astype(np.float32)
+    out["Depth_Code"] = batch["Depth"].map(DEPTH_CODES).astype(np.float32)
+    for c in RECORD_FEATURES:
+        out[c] = batch[c].astype(np.float32)
+    out["Date"] = batch["Date"]
+
+    # Bỏ phần mang sang và mẫu đầu tiên của mỗi chuỗi (chưa có lag1)
+    keep = (batch.index >= n_carry) & out["Days_Since_Lag1"].notna().to_numpy()
+    carry = series.tail(max(lags)).reset_index(drop=True)
+    return out[keep].reset_index(drop=True), carry
+
+def record_partitions(data_dir=DATA_DIR, pattern="marine_water_quality_*.csv",
+                      lags=(1, 4), chunk_rows=DEFAULT_CHUNK_ROWS, use_cache=True):
+    """
+    Chia dữ liệu quan trắc gốc thành các phân vùng đặc trưng lag (.npz) trên đĩa.
+
+    Tham số
+    ----------
+    data_dir, pattern : thư mục và mẫu tên các file nguồn (đọc theo thứ tự tên file).
+    lags : các bước lag (theo số mẫu của chuỗi trạm × tầng nước).
+    chunk_rows : số dòng đọc mỗi lần, quyết định bộ nhớ đỉnh và kích thước phân vùng.
+
+    Giá trị trả về
+    -------
+    tuple
+        (danh sách file phân vùng, info: input_cols, targets, rows, max_date, sources)
+    """
+    files = sorted(Path(data_dir).glob(pattern))
+    if not files:
+        raise RuntimeError(f"❌ Không có file nào khớp {pattern} trong {data_dir}")
+
+    sources = [{"file": f.name, "sha256": file_hash(f)} for f in files]
+    key = json.dumps(
+        {"sources": sources, "version": PREPROCESS_VERSION, "lags": list(lags), "chunk_rows": chunk_rows},
+        sort_keys=True
+    )
+    part_dir = FEATURE_CACHE_DIR / f"records_{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}"
+    info_path = part_dir / "parts.json"
+
+    if use_cache and info_path.exists():
+        with open(info_path, encoding='utf-8') as f:
+            info = json.load(f)
+        print(f"⚡ Dùng {len(info['parts'])} phân vùng đã tạo: {part_dir.name} ({info['rows']} dòng)")
+        return [part_dir / p for p in info["parts"]], info
+
+    # Ghi vào thư mục tạm rồi đổi tên: không để lại bộ phân vùng dở dang
+    tmp_dir = part_dir.with_name(f"{part_dir.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    usecols = ["Station", "Dates", "Depth"] + list(HK_COLUMNS.values())
+    parts, rows, max_date = [], 0, None
+    carry = None
+    for path in files:
+        for chunk in pd.read_csv(path, usecols=usecols, dtype=str, chunksize=chunk_rows):
+            batch = parse_records(chunk)
+            n_carry = 0 if carry is None else len(carry)
+            if n_carry:
+                batch = pd.concat([carry, batch], ignore_index=True)
+
+            frame, carry = lag_features(batch, n_carry, lags)
+            if frame.empty:
+                continue
+
+            name = f"part_{len(parts):05d}.npz"
+            save_feature_frame(tmp_dir / name, frame, {})
+            parts.append(name)
+            rows += len(frame)
+            batch_max = frame["Date"].max()
+            max_date = batch_max if max_date is None else max(max_date, batch_max)
+
+    info = {
+        "parts": parts,
+        "rows": rows,
+        "max_date": str(max_date.date()),
+        "input_cols": record_input_cols(lags),
+        "targets": RECORD_FEATURES,
+        "lags": list(lags),
+        "sources": sources,
+    }
+    with open(tmp_dir / "parts.json", "w", encoding='utf-8') as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+
+    shutil.rmtree(part_dir, ignore_errors=True)
+    os.replace(tmp_dir, part_dir)
+    print(f"💾 Đã tạo {len(parts)} phân vùng ({rows} dòng) tại {part_dir}")
+    return [part_dir / p for p in parts], info
+
+class RecordBatches(xgb.DataIter):
+    """
+    Đưa lần lượt từng phân vùng vào XGBoost: các dòng có giá trị `target` thuộc tập
+    huấn luyện (Date < valid_from), kiểm định (Date >= valid_from) hoặc tất cả ("all").
+    Mỗi lúc chỉ một phân vùng nằm trong bộ nhớ.
+    """
+
+    def __init__(self, parts, input_cols, target, split, valid_from, cache_prefix=None):
+        self._parts = list(parts)
+        self._input_cols = input_cols
+        self._target = target
+        self._split = split
+        self._valid_from = np.datetime64(valid_from)
+        self._pos = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        while self._pos < len(self._parts):
+            df, _ = load_feature_frame(self._parts[self._pos])
+            self._pos += 1
+
+            mask = df[self._target].notna().to_numpy()
+            if self._split != "all":
+                in_valid = df["Date"].to_numpy() >= self._valid_from
+                mask &= in_valid if self._split == "valid" else ~in_valid
+            if mask.any():
+                input_data(data=df.loc[mask, self._input_cols], label=df.loc[mask, self._target])
+                return True
+        return False
+
+    def reset(self):
+        self._pos = 0
+
+# Ma trận của một biến mục tiêu trên một phần dữ liệu ("train", "valid", "all")
+def record_matrix(parts, input_cols, target, split, valid_from, matrix="extmem", cache_dir=None,
+                  max_bin=256, n_threads=None, ref=None):
+    prefix = str(Path(cache_dir) / f"{target}_{split}") if matrix == "extmem" else None
+    batches = RecordBatches(parts, input_cols, target, split, valid_from, prefix)
+    matrix_cls = xgb.ExtMemQuantileDMatrix if matrix == "extmem" else xgb.QuantileDMatrix
+    return matrix_cls(batches, max_bin=max_bin, nthread=n_threads, ref=ref)
+
+# Ma trận huấn luyện / kiểm định của một biến mục tiêu (tập kiểm định dùng chung
+# điểm cắt histogram với tập huấn luyện qua ref=)
+def build_matrices(parts, input_cols, target, valid_from, matrix="extmem", cache_dir=None,
+                   max_bin=256, n_threads=None):
+    args = (parts, input_cols, target)
+    dtrain = record_matrix(*args, "train", valid_from, matrix, cache_dir, max_bin, n_threads)
+    dvalid = record_matrix(*args, "valid", valid_from, matrix, cache_dir, max_bin, n_threads, ref=dtrain)
+    return dtrain, dvalid
+
+# Tham số sklearn (FORECAST_XGB_PARAMS) → tham số của xgb.train
+def native_params(xgb_params, n_threads=None):
+    params = dict(xgb_params)
+    n_rounds = params.pop("n_estimators")
+    n_jobs = params.pop("n_jobs", None)
+    params["seed"] = params.pop("random_state", 0)
+    params["tree_method"] = "hist"
+    if n_threads or (n_jobs and n_jobs > 0):
+        params["nthread"] = n_threads or n_jobs
+    return params, n_rounds
+
+def train_target(parts, input_cols, target, valid_from, xgb_params, matrix="extmem",
+                 cache_dir=None, max_bin=256, n_threads=None, min_rounds=MIN_BOOST_ROUNDS, refit=True):
+    """
+    Huấn luyện booster của một biến trên các phân vùng, dừng sớm theo RMSE kiểm định,
+    cắt tại vòng tốt nhất (ít nhất `min_rounds` cây) rồi, nếu `refit`, học lại đúng số
+    cây đó trên toàn bộ dữ liệu (như basemodel.fit_with_early_stopping).
+
+    Giá trị trả về
+    -------
+    tuple
+        (XGBRegressor, số cây, RMSE kiểm định trước khi học lại,
+        số dòng huấn luyện, số dòng kiểm định)
+    """
+    dtrain, dvalid = build_matrices(
+        parts, input_cols, target, valid_from, matrix, cache_dir, max_bin, n_threads
+    )
+    params, n_rounds = native_params(xgb_params, n_threads)
+    booster = xgb.train(
+        params, dtrain, num_boost_round=n_rounds,
+        evals=[(dvalid, "valid")],
+        early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+        verbose_eval=False
+    )
+
+    estimator = xgb.XGBRegressor(**xgb_params)
+    estimator._Booster = booster
+    estimator = truncate_to_best_iteration(estimator, min_rounds)
+    n_trees = estimator.best_iteration + 1
+    # RMSE của đúng số cây giữ lại (min_rounds có thể vượt vòng tốt nhất)
+    valid_rmse = float(estimator.get_booster().eval(dvalid, "valid").split(":")[-1])
+    n_train, n_valid = dtrain.num_row(), dvalid.num_row()
+
+    if refit:
+        # Giải phóng ma trận train / kiểm định trước khi dựng ma trận toàn bộ dữ liệu
+        del dtrain, dvalid
+        dall = record_matrix(parts, input_cols, target, "all", valid_from, matrix, cache_dir,
+                             max_bin, n_threads)
+        estimator = xgb.XGBRegressor(**xgb_params)
+        estimator._Booster = xgb.train(params, dall, num_boost_round=n_trees)
+    return estimator, n_trees, valid_rmse, n_train, n_valid
+
+def train_streaming(model_out_path, data_dir=DATA_DIR, pattern="marine_water_quality_*.csv",
+                    lags=(1, 4), chunk_rows=DEFAULT_CHUNK_ROWS, valid_years=DEFAULT_VALID_YEARS,
+                    matrix="extmem", max_bin=256, n_threads=None, use_cache=True):
+    t_start = time.perf_counter()
+    if matrix == "extmem" and not hasattr(xgb, "ExtMemQuantileDMatrix"):
+        print(f"⚠️ xgboost {xgb.__version__} chưa có ExtMemQuantileDMatrix (cần ≥ 3.0), "
+              f"chuyển sang --matrix quantile (ma trận lượng tử hoá trong RAM)")
+        matrix = "quantile"
+    parts, info = record_partitions(data_dir, pattern, lags, chunk_rows, use_cache)
+    input_cols = info["input_cols"]
+    valid_from = pd.Timestamp(info["max_date"]) - pd.DateOffset(years=valid_years)
+    print(f"📂 {len(parts)} phân vùng, {info['rows']} dòng | kiểm định từ {valid_from.date()} "
+          f"| RAM đỉnh: {peak_memory_mb():.0f} MB")
+
+    xgb_params = dict(FORECAST_XGB_PARAMS)
+    xgb_params.update(load_tuned_params(model_out_path))
+
+    cache_dir = OUTPUT_DIR / f"extmem_cache_{os.getpid()}"
+    if matrix == "extmem":
+        cache_dir.mkdir(parents=True, exist_ok=True)
+
+    estimators, metrics = [], {"valid_from": str(valid_from.date()), "valid_rmse": {},
+                               "n_trees": {}, "train_rows": {}, "valid_rows": {}}
+    try:
+        for target in info["targets"]:
+            t0 = time.perf_counter()
+            estimator, n_trees, valid_rmse, n_train, n_valid = train_target(
+                parts, input_cols, target, valid_from, xgb_params, matrix, cache_dir, max_bin, n_threads
+            )
+            estimators.append(estimator)
+            metrics["valid_rmse"][target] = valid_rmse
+            metrics["n_trees"][target] = n_trees
+            metrics["train_rows"][target] = n_train
+            metrics["valid_rows"][target] = n_valid
+            print(f"   🔹 {target:<12} RMSE kiểm định: {valid_rmse:.4f} | cây: {n_trees:<4} "
+                  f"| {n_train} + {n_valid} dòng | {time.perf_counter() - t0:.1f}s "
+                  f"| RAM đỉnh: {peak_memory_mb():.0f} MB")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    model = wrap_multi_output(estimators, xgb_params)
+    path = save_model_bundle(
+        model_out_path, model, input_cols, info["targets"],
+        lags=lags,
+        metrics=metrics,
+        extra={"sources": info["sources"], "training": f"out-of-core ({matrix})"}
+    )
+    print(f"\n🎉 Đã lưu model tại: {path} | {time.perf_counter() - t_start:.1f}s "
+          f"| RAM đỉnh: {peak_memory_mb():.0f} MB")
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Huấn luyện ngoài bộ nhớ trên dữ liệu quan trắc gốc (theo mẫu)")
+    parser.add_argument("--data-dir", default=str(DATA_DIR))
+    parser.add_argument("--pattern", default="marine_water_quality_*.csv")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS,
+                        help="số dòng đọc mỗi lần (= kích thước tối đa một phân vùng)")
+    parser.add_argument("--valid-years", type=int, default=DEFAULT_VALID_YEARS,
+                        help="số năm cuối làm tập kiểm định + early stopping")
+    parser.add_argument("--matrix", choices=["extmem", "quantile"], default="extmem",
+                        help="extmem: ExtMemQuantileDMatrix (trang trên đĩa); quantile: QuantileDMatrix trong RAM")
+    parser.add_argument("--max-bin", type=int, default=256)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--no-cache", action="store_true",
+                        help="tạo lại phân vùng từ CSV, không dùng phân vùng đã có")
+    args = parser.parse_args()
+
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    train_streaming(
+        OUTPUT_DIR / "hk_records_model",
+        data_dir=args.data_dir,
+        pattern=args.pattern,
+        chunk_rows=args.chunk_rows,
+        valid_years=args.valid_years,
+        matrix=args.matrix,
+        max_bin=args.max_bin,
+        n_threads=args.threads,
+        use_cache=not args.no_cache
+    )
@@ -0,0 +1,278 @@
+import os
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import mean_squared_error
+
+from basemodel import (
+    COBIA_FEATURES,
+    DIRECT_HORIZONS,
+    FORECAST_XGB_PARAMS,
+    OYSTER_FEATURES,
+    VALID_QUARTERS,
+    add_direct_targets,
+    fit_target,
+    load_training_frame,
+    load_tuned_params,
+    refit_target,
+    save_model_bundle,
+    holdout_gap,
+    time_holdout_split,
+    wrap_multi_output,
+)
+from metal import METAL_VALID_QUARTERS, METAL_XGB_PARAMS, load_metal_data
+
+
+# Huấn luyện lại toàn bộ mô hình (HÀU, CÁ GIÒ, KIM LOẠI) song song trên một ngân sách CPU.
+#
+# Mỗi job là một booster của một biến mục tiêu (12 + 12 + 8 job ở chế độ rolling).
+# Bộ lập lịch giữ tổng số luồng XGBoost đang chạy ≤ --cpus:
+#   - job lớn (nhiều dòng dữ liệu) được chạy trước (longest job first);
+#   - khi còn nhiều job hơn số lõi trống, mỗi job 1 luồng: dữ liệu vài nghìn dòng
+#     nên chia luồng trong một booster kém hiệu quả hơn chạy nhiều booster cùng lúc;
+#   - khi hàng đợi gần hết, các job cuối được chia đều số lõi còn trống để rút
+#     ngắn thời gian chờ job chậm nhất.
+# Xong mỗi họ mô hình thì gói các booster lại và lưu bundle như basemodel.py / metal.py,
+# rồi in timeline từng job (và ghi ra output/train_timeline.csv).
+#
+#   python model/train_all.py --cpus 16
+
+
+BASE_DIR = Path(__file__).resolve().parent
+PROJECT_DIR = BASE_DIR.parent
+OUTPUT_DIR = PROJECT_DIR / "model" / "output"
+HK_DIR = PROJECT_DIR / "data" / "hk_water_quality"
+QN_DATA_PATH = PROJECT_DIR / "data" / "data_quang_ninh" / "qn_env_clean_ready.csv"
+
+FAMILIES = {
+    "oyster": (HK_DIR / "hk_oyster_quarterly_21vars.csv", OYSTER_FEATURES, "hk_oyster_{suffix}"),
+    "cobia": (HK_DIR / "hk_cobia_quarterly_21vars.csv", COBIA_FEATURES, "hk_cobia_{suffix}"),
+    "metal": (QN_DATA_PATH, None, "metal_{suffix}"),
+}
+MODEL_SUFFIX = {
+    ("species", "rolling"): "forecast_model",
+    ("species", "direct"): "direct_model",
+    ("metal", "rolling"): "ts_model",
+    ("metal", "direct"): "direct_model",
+}
+
+# Dữ liệu các họ mô hình đã nạp trong tiến trình hiện tại (mỗi worker nạp một lần)
+_DATA = {}
+
+
+def model_out_path(family, mode):
+    _, _, name = FAMILIES[family]
+    kind = "metal" if family == "metal" else "species"
+    return OUTPUT_DIR / name.format(suffix=MODEL_SUFFIX[(kind, mode)])
+
+# Đặc trưng / mục tiêu / mặt nạ tập kiểm định của một họ mô hình (giống hệt
+# train_forecast_model và train_model_with_station_history), có cache trong tiến trình
+def family_data(family, mode):
+    key = (family, mode)
+    if key not in _DATA:
+        csv_path, features, _ = FAMILIES[family]
+        gap = holdout_gap(DIRECT_HORIZONS if mode == "direct" else None)
+        if family == "metal":
+            df, input_cols, targets, y_cols = load_metal_data(csv_path, mode)
+            train_mask, valid_mask = time_holdout_split(df, ["X", "Y"], "Quarter", METAL_VALID_QUARTERS, gap)
+        else:
+            df, input_cols = load_training_frame(csv_path, features, lags=[1, 4])
+            targets, y_cols = features, features
+            if mode == "direct":
+                df, y_cols = add_direct_targets(df, features, DIRECT_HORIZONS)
+            train_mask, valid_mask = time_holdout_split(df, 'Station', 'Date', VALID_QUARTERS, gap)
+
+        _DATA[key] = {
+            "X": df[input_cols], "Y": df[y_cols], "train_mask": train_mask, "valid_mask": valid_mask,
+            "input_cols": input_cols, "targets": list(targets), "y_cols": list(y_cols),
+        }
+    return _DATA[key]
+
+def family_params(family, mode):
+    params = dict(METAL_XGB_PARAMS if family == "metal" else FORECAST_XGB_PARAMS)
+    params.update(load_tuned_params(model_out_path(family, mode)))
+    return params
+
+# Job: huấn luyện booster của một biến mục tiêu (chạy trong worker)
+def train_job(family, mode, target_index, xgb_params, n_threads):
+    start = time.time()
+    data = family_data(family, mode)
+    X, Y = data["X"], data["Y"]
+    train, valid = data["train_mask"], data["valid_mask"]
+    col = data["y_cols"][target_index]
+
+    params = dict(xgb_params, n_jobs=n_threads)
+    estimator = fit_target(params, X[train], Y.loc[train, col], X[valid], Y.loc[valid, col])
+    valid_rmse = float(np.sqrt(mean_squared_error(Y.loc[valid, col], estimator.predict(X[valid]))))
+
+    # Học lại với số cây đã chọn trên toàn bộ dữ liệu (kể cả quý mới nhất), như fit_with_early_stopping
+    n_trees = estimator.best_iteration + 1
+    estimator = refit_target(params, n_trees, X, Y[col])
+
+    return {
+        "estimator": estimator,
+        "valid_rmse": valid_rmse,
+        "n_trees": n_trees,
+        "start": start,
+        "end": time.time(),
+        "pid": os.getpid(),
+    }
+
+# Số luồng cho job sắp chạy: 1 luồng khi còn nhiều job hơn số lõi trống,
+# chia đều số lõi trống cho các job cuối
+def pick_threads(free_cpus, n_pending):
+    return max(1, free_cpus // max(1, n_pending))
+
+def schedule(jobs, cpu_budget, threads=None, on_done=None):
+    """
+    Chạy các job trên ngân sách `cpu_budget` lõi, tổng số luồng đang chạy
+    không vượt quá ngân sách.
+
+    jobs: list dict (family, mode, target_index, xgb_params, cost); `threads` cố
+    định số luồng mỗi job (mặc định: pick_threads). `on_done(job, result)` được gọi
+    ngay khi một job xong. Trả về list (job, n_threads, result) theo thứ tự hoàn thành.
+    """
+    pending = sorted(jobs, key=lambda j: j["cost"], reverse=True)
+    free = cpu_budget
+    running = {}
+    finished = []
+
+    with ProcessPoolExecutor(
+        max_workers=cpu_budget,
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as pool:
+        while pending or running:
+            while pending:
+                n = min(threads or pick_threads(free, len(pending)), cpu_budget)
+                if n > free:
+                    break
+                job = pending.pop(0)
+                future = pool.submit(
+                    train_job, job["family"], job["mode"], job["target_index"], job["xgb_params"], n
+                )
+                running[future] = (job, n)
+                free -= n
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, n = running.pop(future)
+                free += n
+                result = future.result()
+                finished.append((job, n, result))
+                if on_done is not None:
+                    on_done(job, result)
+
+    return finished
+
+# Gói booster của một họ mô hình, tính RMSE train và lưu bundle
+def save_family(family, mode, xgb_params, results):
+    data = family_data(family, mode)
+    results = sorted(results, key=lambda r: r[0])
+    model = wrap_multi_output([r[1]["estimator"] for r in results], xgb_params)
+
+    X, Y = data["X"], data["Y"]
+    train_rmse = np.sqrt(mean_squared_error(Y, model.predict(X), multioutput='raw_values'))
+
+    y_cols = data["y_cols"]
+    metrics = {
+        "valid_quarters": METAL_VALID_QUARTERS if family == "metal" else VALID_QUARTERS,
+        "valid_rmse": {c: r[1]["valid_rmse"] for c, r in zip(y_cols, results)},
+        "n_trees": {c: r[1]["n_trees"] for c, r in zip(y_cols, results)},
+        "train_rmse": dict(zip(y_cols, train_rmse)),
+    }
+    csv_path, _, _ = FAMILIES[family]
+    return save_model_bundle(
+        model_out_path(family, mode), model, data["input_cols"], data["targets"],
+        horizons=DIRECT_HORIZONS if mode == "direct" else None,
+        lags=[1, 4],
+        data_path=csv_path,
+        metrics=metrics
+    )
+
+def print_timeline(timeline, cpu_budget, width=40):
+    t0 = timeline["start"].min()
+    wall = timeline["end"].max() - t0
+    print(f"\n🕒 TIMELINE ({len(timeline)} job, {cpu_budget} lõi, {wall:.1f}s):")
+    for row in timeline.sort_values("start").itertuples():
+        a = int((row.start - t0) / wall * width)
+        b = max(a + 1, int((row.end - t0) / wall * width))
+        bar = " " * a + "█" * (b - a) + " " * (width - b)
+        print(f"  {row.job:<24} {row.threads:>2} luồng |{bar}| "
+              f"{row.start - t0:6.1f}s → {row.end - t0:6.1f}s  ({row.trees} cây)")
+
+    busy = (timeline["seconds"] * timeline["threads"]).sum()
+    print(f"👉 Tổng thời gian các job: {timeline['seconds'].sum():.1f}s | "
+          f"sử dụng CPU: {busy / (wall * cpu_budget):.0%} của {cpu_budget} lõi")
+
+def train_all(families=tuple(FAMILIES), mode="rolling", cpu_budget=None, threads=None):
+    cpu_budget = max(1, cpu_budget or os.cpu_count() or 1)
+    t_start = time.perf_counter()
+
+    jobs = []
+    params = {}
+    remaining = {}
+    for family in families:
+        data = family_data(family, mode)
+        params[family] = family_params(family, mode)
+        n_rows = len(data["X"])
+        for i in range(len(data["y_cols"])):
+            jobs.append({
+                "family": family, "mode": mode, "target_index": i, "xgb_params": params[family],
+                "cost": n_rows * params[family]["n_estimators"],
+            })
+        remaining[family] = len(data["y_cols"])
+
+    print(f"🚀 {len(jobs)} job ({', '.join(families)}) trên {cpu_budget} lõi")
+
+    results = {family: [] for family in families}
+
+    def on_done(job, result):
+        family = job["family"]
+        results[family].append((job["target_index"], result))
+        remaining[family] -= 1
+        if remaining[family] == 0:
+            path = save_family(family, mode, params[family], results[family])
+            print(f"🎉 {family}: đã lưu model tại {path} ({time.perf_counter() - t_start:.1f}s)")
+
+    finished = schedule(jobs, cpu_budget, threads, on_done)
+
+    timeline = pd.DataFrame([
+        {
+            "job": f"{job['family']}/{family_data(job['family'], mode)['y_cols'][job['target_index']]}",
+            "family": job["family"],
+            "threads": n,
+            "start": result["start"],
+            "end": result["end"],
+            "seconds": result["end"] - result["start"],
+            "trees": result["n_trees"],
+            "pid": result["pid"],
+        }
+        for job, n, result in finished
+    ])
+    print_timeline(timeline, cpu_budget)
+
+    timeline_path = OUTPUT_DIR / "train_timeline.csv"
+    timeline.assign(
+        start=timeline["start"] - timeline["start"].min(),
+        end=timeline["end"] - timeline["start"].min()
+    ).sort_values("start").to_csv(timeline_path, index=False)
+    print(f"ℹ️  Đã lưu timeline tại: {timeline_path} | tổng {time.perf_counter() - t_start:.1f}s")
+    return timeline
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Huấn luyện song song mọi mô hình trên một ngân sách CPU")
+    parser.add_argument("--families", nargs="+", choices=list(FAMILIES), default=list(FAMILIES))
+    parser.add_argument("--mode", choices=["rolling", "direct"], default="rolling")
+    parser.add_argument("--cpus", type=int, default=None, help="số lõi được dùng (mặc định: toàn bộ)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="cố định số luồng XGBoost mỗi job (mặc định: tự chọn)")
+    args = parser.parse_args()
+
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    train_all(args.families, args.mode, args.cpus, args.threads)
@@ -0,0 +1,387 @@
+import json
+import math
+import os
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+import xgboost as xgb
+
+from basemodel import (
+    COBIA_FEATURES,
+    OYSTER_FEATURES,
+    load_training_frame,
+    tuned_params_path,
+)
+from metal import load_metal_data
+
+
+# Tinh chỉnh siêu tham số XGBoost bằng successive halving trên cross-validation
+# theo thời gian (expanding window):
+#   - fold k: huấn luyện trên các quý trước mốc k, kiểm định trên `valid_quarters`
+#     quý ngay sau mốc (không bao giờ nhìn thấy tương lai);
+#   - vòng 1 thử `n_configs` cấu hình với ít cây, mỗi vòng sau giữ 1/eta cấu hình
+#     tốt nhất và tăng số cây lên eta lần;
+#   - các (cấu hình, fold) chạy song song trên nhiều tiến trình, mỗi tiến trình dựng
+#     QuantileDMatrix (dữ liệu đã lượng tử hoá) của các fold một lần rồi dùng lại
+#     cho mọi lượt thử;
+#   - cấu hình tốt nhất được ghi cạnh file mô hình (<tên mô hình>_params.json),
+#     basemodel.py / metal.py tự đọc khi huấn luyện lại.
+#
+# Các biến mục tiêu được chuẩn hoá (chia độ lệch chuẩn) nên điểm là RMSE chuẩn hoá
+# trung bình, không bị biến có thang đo lớn (Coliform) lấn át. Mỗi lượt thử là một
+# booster nhiều đầu ra (mặc định one_output_per_tree: mỗi cây một biến, gần với
+# 12 booster riêng của MultiOutputRegressor).
+#
+#   python model/tune.py --family oyster --workers 16 --time-limit 3600
+
+
+BASE_DIR = Path(__file__).resolve().parent
+PROJECT_DIR = BASE_DIR.parent
+OUTPUT_DIR = PROJECT_DIR / "model" / "output"
+
+FAMILIES = {
+    "oyster": (PROJECT_DIR / "data" / "hk_water_quality" / "hk_oyster_quarterly_21vars.csv",
+               OUTPUT_DIR / "hk_oyster_forecast_model"),
+    "cobia": (PROJECT_DIR / "data" / "hk_water_quality" / "hk_cobia_quarterly_21vars.csv",
+              OUTPUT_DIR / "hk_cobia_forecast_model"),
+    "metal": (PROJECT_DIR / "data" / "data_quang_ninh" / "qn_env_clean_ready.csv",
+              OUTPUT_DIR / "metal_ts_model"),
+}
+
+# Không gian tìm kiếm: (kiểu, thấp, cao); "log" lấy mẫu đều theo log
+SEARCH_SPACE = {
+    "max_depth": ("int", 3, 8),
+    "learning_rate": ("log", 0.01, 0.2),
+    "subsample": ("float", 0.6, 1.0),
+    "colsample_bytree": ("float", 0.6, 1.0),
+    "min_child_weight": ("log", 1.0, 20.0),
+    "reg_lambda": ("log", 0.1, 10.0),
+}
+
+MAX_BIN = 256
+EARLY_STOPPING_ROUNDS = 50
+
+# Dữ liệu các fold của tiến trình worker (gán trong _init_worker)
+_FOLDS = []
+_N_THREADS = 1
+
+
+def load_family_data(family):
+    """
+    Ma trận đặc trưng / mục tiêu (giống lúc huấn luyện) và cột thời gian của mỗi dòng.
+    """
+    csv_path, _ = FAMILIES[family]
+    if family == "metal":
+        df, feature_cols, target_cols, _ = load_metal_data(csv_path)
+        dates = df["Quarter"]
+    else:
+        features = OYSTER_FEATURES if family == "oyster" else COBIA_FEATURES
+        df, feature_cols = load_training_frame(csv_path, features, lags=[1, 4])
+        target_cols = features
+        dates = df["Date"]
+
+    X = df[feature_cols].to_numpy(dtype=np.float32)
+    Y = df[target_cols].to_numpy(dtype=np.float32)
+    return X, Y, dates.to_numpy(), feature_cols, target_cols
+
+
+def time_series_folds(dates, n_folds=3, valid_quarters=4):
+    """
+    Các fold expanding window theo quý (toàn bộ trạm cùng mốc thời gian).
+
+    Trả về list (train_idx, valid_idx): fold cuối kiểm định trên `valid_quarters`
+    quý mới nhất, các fold trước lùi dần mỗi lần `valid_quarters` quý.
+    """
+    quarters = np.unique(dates)
+    folds = []
+    for k in range(n_folds, 0, -1):
+        start = len(quarters) - k * valid_quarters
+        if start <= 0:
+            continue
+        cutoff = quarters[start]
+        end = quarters[min(start + valid_quarters, len(quarters)) - 1]
+        train_idx = np.flatnonzero(dates < cutoff)
+        valid_idx = np.flatnonzero((dates >= cutoff) & (dates <= end))
+        if len(train_idx) and len(valid_idx):
+            folds.append((train_idx, valid_idx))
+    return folds
+
+
+def sample_configs(n_configs, seed=42):
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(n_configs):
+        config = {}
+        for name, (kind, low, high) in SEARCH_SPACE.items():
+            if kind == "int":
+                config[name] = int(rng.integers(low, high + 1))
+            elif kind == "log":
+                config[name] = float(math.exp(rng.uniform(math.log(low), math.log(high))))
+            else:
+                config[name] = float(rng.uniform(low, high))
+        configs.append(config)
+    return configs
+
+
+def _init_worker(X, Y, folds, n_threads):
+    """
+    Dựng QuantileDMatrix của mọi fold một lần cho tiến trình worker.
+    """
+    global _FOLDS, _N_THREADS
+    _N_THREADS = n_threads
+
+    _FOLDS = []
+    for train_idx, valid_idx in folds:
+        dtrain = xgb.QuantileDMatrix(X[train_idx], Y[train_idx], max_bin=MAX_BIN, nthread=n_threads)
+        dvalid = xgb.QuantileDMatrix(X[valid_idx], Y[valid_idx], ref=dtrain, nthread=n_threads)
+        _FOLDS.append((dtrain, dvalid))
+
+
+def _evaluate(config, fold, n_rounds, multi_strategy):
+    """
+    Huấn luyện một cấu hình trên một fold (có early stopping).
+
+    Trả về (RMSE kiểm định tốt nhất, số cây tốt nhất, số giây).
+    """
+    t0 = time.perf_counter()
+    dtrain, dvalid = _FOLDS[fold]
+    params = dict(
+        config,
+        objective="reg:squarederror",
+        tree_method="hist",
+        multi_strategy=multi_strategy,
+        max_bin=MAX_BIN,
+        eval_metric="rmse",
+        nthread=_N_THREADS,
+        seed=42,
+    )
+    booster = xgb.train(
+        params,
+        dtrain,
+        num_boost_round=n_rounds,
+        evals=[(dvalid, "valid")],
+        early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+        verbose_eval=False,
+    )
+    return float(booster.best_score), int(booster.best_iteration) + 1, time.perf_counter() - t0
+
+
+def successive_halving(
+    X,
+    Y,
+    folds,
+    n_configs=27,
+    eta=3,
+    min_rounds=100,
+    max_rounds=2000,
+    workers=None,
+    multi_strategy="one_output_per_tree",
+    deadline=None,
+    seed=42,
+):
+    """
+    Successive halving song song trên các fold.
+
+    Parameters
+    ----------
+    X, Y : np.ndarray
+        Đặc trưng và mục tiêu (Y được chuẩn hoá bên trong).
+    folds : list
+        Kết quả `time_series_folds`.
+    n_configs, eta, min_rounds, max_rounds : int
+        Vòng r thử n_configs / eta^r cấu hình, mỗi cấu hình tối đa
+        min(min_rounds * eta^r, max_rounds) cây.
+    workers : int, optional
+        Số tiến trình (mặc định: số lõi CPU). Luồng XGBoost mỗi tiến trình =
+        số lõi // workers.
+    deadline : float, optional
+        Mốc time.monotonic() chung cho cả lần tinh chỉnh. Được kiểm tra trước khi
+        gửi từng lượt thử: quá mốc thì không gửi thêm, các lượt đang chạy được chạy
+        nốt (tối đa một lượt mỗi worker) và trả về cấu hình tốt nhất đến lúc đó.
+
+    Returns
+    -------
+    dict
+        "best" (cấu hình + điểm + số cây) và "history" (mọi lượt thử).
+    """
+    t_start = time.perf_counter()
+    n_cores = os.cpu_count() or 1
+    n_tasks = n_configs * len(folds)
+    workers = max(1, min(workers or n_cores, n_tasks))
+    n_threads = max(1, n_cores // workers)
+
+    # Chuẩn hoá mục tiêu: RMSE của mọi biến cùng thang đo
+    scale = Y.std(axis=0)
+    scale[scale == 0] = 1.0
+    Y = (Y - Y.mean(axis=0)) / scale
+
+    configs = sample_configs(n_configs, seed)
+    alive = list(range(n_configs))
+    history = []
+    results = {}
+
+    print(f"🔎 {n_configs} cấu hình × {len(folds)} fold | {workers} tiến trình × {n_threads} luồng")
+
+    ctx = multiprocessing.get_context("spawn")
+    timed_out = False
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(X, Y, folds, n_threads),
+    ) as pool:
+        rung = 0
+        while alive:
+            n_rounds = min(min_rounds * eta ** rung, max_rounds)
+            t_rung = time.perf_counter()
+
+            # Mỗi worker giữ tối đa một lượt thử: hàng đợi nằm ở đây nên hết giờ là dừng được ngay
+            pending = [(c, f) for c in alive for f in range(len(folds))]
+            running = {}
+            scores = {c: [] for c in alive}
+            while pending or running:
+                while pending and len(running) < workers:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        timed_out = True
+                        pending.clear()
+                        break
+                    c, f = pending.pop(0)
+                    running[pool.submit(_evaluate, configs[c], f, n_rounds, multi_strategy)] = (c, f)
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    c, f = running.pop(future)
+                    score, best_rounds, seconds = future.result()
+                    scores[c].append((score, best_rounds))
+                    history.append({
+                        "rung": rung, "config": c, "fold": f, "rounds": n_rounds,
+                        "score": score, "best_rounds": best_rounds, "seconds": round(seconds, 3),
+                    })
+
+            # Vòng bị cắt ngang: chỉ xếp hạng các cấu hình đã chạy đủ mọi fold
+            alive = [c for c in alive if len(scores[c]) == len(folds)]
+            if not alive:
+                break
+            for c in alive:
+                results[c] = {
+                    "score": float(np.mean([s for s, _ in scores[c]])),
+                    "best_rounds": int(np.mean([r for _, r in scores[c]])),
+                    "rounds": n_rounds,
+                    "rung": rung,
+                }
+
+            alive.sort(key=lambda c: results[c]["score"])
+            best = alive[0]
+            print(
+                f"   vòng {rung}: {len(alive)} cấu hình × {n_rounds} cây "
+                f"({time.perf_counter() - t_rung:.1f}s) | tốt nhất #{best}: {results[best]['score']:.4f}"
+            )
+
+            if len(alive) == 1 or n_rounds >= max_rounds or timed_out:
+                break
+
+            alive = alive[:max(1, len(alive) // eta)]
+            rung += 1
+
+    if timed_out:
+        print("⏱️ Hết thời gian, dừng ở vòng hiện tại")
+    if not results:
+        raise TimeoutError("Hết thời gian trước khi thử xong cấu hình nào trên mọi fold")
+
+    # Cấu hình tốt nhất trong vòng xa nhất đã chạy
+    top_rung = max(r["rung"] for r in results.values())
+    best = min(
+        (c for c, r in results.items() if r["rung"] == top_rung),
+        key=lambda c: results[c]["score"],
+    )
+    return {
+        "best": dict(config=configs[best], **results[best]),
+        "history": history,
+        "seconds": time.perf_counter() - t_start,
+        "workers": workers,
+        "threads_per_worker": n_threads,
+    }
+
+
+def tune_family(family, n_folds=3, valid_quarters=4, out_path=None, **kwargs):
+    """
+    Tinh chỉnh một họ mô hình ("oyster", "cobia", "metal") và ghi cấu hình tốt nhất
+    ra <mô hình>_params.json.
+    """
+    X, Y, dates, feature_cols, target_cols = load_family_data(family)
+    folds = time_series_folds(dates, n_folds, valid_quarters)
+    if not folds:
+        raise ValueError("Không đủ dữ liệu để tạo fold theo thời gian")
+
+    result = successive_halving(X, Y, folds, **kwargs)
+    best = result["best"]
+
+    # Số cây khi huấn luyện lại trên toàn bộ dữ liệu: nhiều hơn chút so với
+    # số cây tốt nhất trên fold (dữ liệu nhiều hơn); early stopping vẫn cắt nếu bật
+    params = dict(best["config"], n_estimators=int(math.ceil(best["best_rounds"] * 1.2)))
+
+    _, model_path = FAMILIES[family]
+    out_path = out_path or tuned_params_path(model_path)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "family": family,
+            "params": params,
+            "cv_score": best["score"],
+            "folds": [{"train": len(t), "valid": len(v)} for t, v in folds],
+            "targets": list(target_cols),
+            "features": list(feature_cols),
+            "seconds": round(result["seconds"], 1),
+            "workers": result["workers"],
+            "threads_per_worker": result["threads_per_worker"],
+            "history": result["history"],
+        }, f, ensure_ascii=False, indent=2)
+
+    print(f"✅ {family}: RMSE chuẩn hoá CV {best['score']:.4f} | {params}")
+    print(f"💾 Đã lưu cấu hình tại: {out_path} ({result['seconds']:.0f}s)")
+    return params
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tinh chỉnh siêu tham số (successive halving + CV theo thời gian)")
+    parser.add_argument("--family", nargs="+", choices=list(FAMILIES), default=list(FAMILIES))
+    parser.add_argument("--configs", type=int, default=27, help="số cấu hình ở vòng đầu")
+    parser.add_argument("--eta", type=int, default=3, help="mỗi vòng giữ 1/eta cấu hình, tăng số cây eta lần")
+    parser.add_argument("--min-rounds", type=int, default=100)
+    parser.add_argument("--max-rounds", type=int, default=2000)
+    parser.add_argument("--folds", type=int, default=3)
+    parser.add_argument("--valid-quarters", type=int, default=4, help="số quý kiểm định của mỗi fold")
+    parser.add_argument("--workers", type=int, default=None, help="số tiến trình (mặc định: số lõi)")
+    parser.add_argument("--multi-strategy", choices=["one_output_per_tree", "multi_output_tree"],
+                        default="one_output_per_tree")
+    parser.add_argument("--time-limit", type=float, default=3600,
+                        help="tổng số giây cho mọi họ mô hình được tinh chỉnh")
+    args = parser.parse_args()
+
+    # Một mốc thời gian chung: các họ sau chỉ dùng phần thời gian còn lại
+    deadline = time.monotonic() + args.time_limit
+    for family in args.family:
+        if time.monotonic() >= deadline:
+            print(f"⏱️ Hết thời gian, bỏ qua {family}")
+            continue
+        try:
+            tune_family(
+                family,
+                n_folds=args.folds,
+                valid_quarters=args.valid_quarters,
+                n_configs=args.configs,
+                eta=args.eta,
+                min_rounds=args.min_rounds,
+                max_rounds=args.max_rounds,
+                workers=args.workers,
+                multi_strategy=args.multi_strategy,
+                deadline=deadline,
+            )
+        except TimeoutError as e:
+            # Chưa có cấu hình nào chạy đủ mọi fold: giữ nguyên file tham số cũ (nếu có)
+            print(f"⏱️ {family}: {e}, bỏ qua")
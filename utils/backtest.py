@@ -0,0 +1,285 @@
+"""
+Backtest walk-forward cho dự báo rolling (utils/forecast.py).
+
+    python -m utils.backtest --species oyster --horizon 8 --workers 4 --out backtest_oyster
+
+Với mỗi quý gốc (origin) trong dữ liệu Quảng Ninh, dữ liệu được cắt tới trước
+quý đó rồi chạy đúng đường dự báo batch của dashboard (`predict_for_all_stations`,
+4 quý quan trắc gần nhất của mỗi trạm → dự báo h = 1..H quý). Dự báo được so với
+quan trắc thực tế của quý origin + h - 1, cho ra:
+
+    errors.csv          sai số theo (bước h, biến): n, MAE, RMSE, bias, NRMSE
+    hsi_confusion.csv   ma trận nhầm lẫn mức HSI (thực tế × dự báo) theo bước h
+    forecasts.csv       toàn bộ cặp (dự báo, thực tế)
+
+Các origin được chia cho nhiều tiến trình worker; mỗi worker đọc dữ liệu và nạp
+mô hình một lần.
+
+Lưu ý: mô hình đã được fine-tune trên chính dữ liệu Quảng Ninh nên sai số ở đây
+lạc quan hơn sai số trên dữ liệu thật sự mới.
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils.forecast import (
+    DIRECT_MODEL_FILES,
+    METAL_TARGETS,
+    QN_DATA_PATH,
+    SPECIES_MODEL_FILES,
+    limit_model_threads,
+    load_direct_model,
+    load_metal_model,
+    load_species_model,
+    predict_for_all_stations,
+)
+from utils.hsi import HSI_LEVELS, HSI_LEVEL_DEFAULT, compute_hsi
+
+# Số bước dự báo mặc định (quý) và số quý lịch sử cần cho mỗi trạm (lag1..lag4)
+DEFAULT_HORIZON = 8
+N_HISTORY = 4
+
+# Thứ tự nhãn HSI trong ma trận nhầm lẫn (cao → thấp)
+HSI_LABELS = [label for _, label in HSI_LEVELS] + [HSI_LEVEL_DEFAULT]
+
+# Dữ liệu quan trắc của tiến trình worker (gán trong _init_worker)
+_OBSERVATIONS = None
+
+def load_observations(csv_path=QN_DATA_PATH):
+    """
+    Dữ liệu quan trắc Quảng Ninh kèm cột "Date", "year", "quarter".
+    """
+    df = pd.read_csv(csv_path)
+    df["Date"] = pd.to_datetime(df["Quarter"], errors="coerce")
+    df = df.dropna(subset=["Date"]).reset_index(drop=True)
+    df["year"] = df["Date"].dt.year
+    df["quarter"] = df["Date"].dt.quarter
+    return df
+
+def _init_worker(n_threads, csv_path):
+    """
+    Khởi tạo tiến trình worker: giới hạn số luồng, đọc dữ liệu và nạp sẵn mô hình.
+    """
+    global _OBSERVATIONS
+
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(n_threads)
+
+    _OBSERVATIONS = load_observations(csv_path)
+
+    limit_model_threads(n_threads)
+    loaders = [lambda s=s: load_species_model(s)[0] for s in SPECIES_MODEL_FILES]
+    loaders += [lambda n=n: load_direct_model(n)[0] for n in DIRECT_MODEL_FILES]
+    loaders.append(lambda: load_metal_model()[0])
+    for load in loaders:
+        try:
+            load()
+        except FileNotFoundError:
+            pass
+
+def backtest_origins(species, origins, horizon, strategy="rolling"):
+    """
+    Dự báo từ các quý gốc `origins` [(year, quarter), ...] (chạy trong worker).
+
+    Giá trị trả về
+    -------
+    pd.DataFrame
+        Như `predict_for_all_stations`, thêm cột "origin" ("2022Q1") và "horizon" (1..H).
+    """
+    frames = []
+    for year, quarter in origins:
+        origin = pd.Timestamp(year=year, month=3 * (quarter - 1) + 1, day=1)
+        history = _OBSERVATIONS[_OBSERVATIONS["Date"] < origin]
+
+        df_forecast = predict_for_all_stations(
+            species=species,
+            start_year=year,
+            start_quarter=quarter,
+            n_quarters=horizon,
+            strategy=strategy,
+            df=history
+        )
+        if df_forecast.empty:
+            continue
+
+        df_forecast.insert(3, "origin", f"{year}Q{quarter}")
+        df_forecast.insert(4, "horizon", np.repeat(np.arange(1, horizon + 1), len(df_forecast) // horizon))
+        frames.append(df_forecast)
+
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def error_table(pairs, variables):
+    """
+    Sai số theo (bước h, biến): n, MAE, RMSE, bias (dự báo - thực tế) và
+    NRMSE = RMSE / độ lệch chuẩn của giá trị thực tế (so sánh được giữa các biến).
+    """
+    pred = pairs[variables].to_numpy(dtype=float)
+    actual = pairs[[f"{v}_actual" for v in variables]].to_numpy(dtype=float)
+    err = pd.DataFrame(pred - actual, columns=variables)
+    by_h = err.groupby(pairs["horizon"].to_numpy())
+
+    stats = {
+        "n": by_h.count(),
+        "mae": err.abs().groupby(pairs["horizon"].to_numpy()).mean(),
+        "rmse": (err ** 2).groupby(pairs["horizon"].to_numpy()).mean() ** 0.5,
+        "bias": by_h.mean(),
+    }
+    table = pd.concat(
+        {name: df.stack() for name, df in stats.items()},
+        axis=1
+    ).rename_axis(["horizon", "variable"]).reset_index()
+
+    scale = pd.Series(np.nanstd(actual, axis=0), index=variables).replace(0, np.nan)
+    table["nrmse"] = table["rmse"] / table["variable"].map(scale).to_numpy()
+    return table
+
+def hsi_confusion(pairs):
+    """
+    Ma trận nhầm lẫn mức HSI (hàng: thực tế, cột: dự báo) cho từng bước h.
+
+    Giá trị trả về
+    -------
+    dict
+        {h: pd.DataFrame HSI_LABELS × HSI_LABELS (số mẫu)}
+    """
+    matrices = {}
+    for h, group in pairs.groupby("horizon"):
+        matrices[int(h)] = pd.crosstab(
+            pd.Categorical(group["HSI_Level_actual"], categories=HSI_LABELS),
+            pd.Categorical(group["HSI_Level"], categories=HSI_LABELS),
+            rownames=["actual"],
+            colnames=["predicted"],
+            dropna=False
+        )
+    return matrices
+
+def run_backtest(
+    species,
+    horizon=DEFAULT_HORIZON,
+    workers=None,
+    strategy="rolling",
+    csv_path=QN_DATA_PATH
+):
+    """
+    Backtest walk-forward song song trên mọi quý gốc và mọi trạm.
+
+    Tham số
+    ----------
+    species : {"oyster", "cobia"}
+    horizon : int
+        Số bước dự báo H từ mỗi quý gốc.
+    workers : int, optional
+        Số tiến trình (mặc định: số lõi, tối đa số quý gốc). Mỗi tiến trình
+        dùng số lõi // workers luồng XGBoost.
+    strategy : {"rolling", "direct"}
+        Như `predict_for_all_stations`.
+
+    Giá trị trả về
+    -------
+    dict
+        "pairs" (dự báo + cột *_actual, HSI, HSI_Level, HSI_actual, HSI_Level_actual),
+        "errors" (`error_table`), "hsi_confusion" (`hsi_confusion`),
+        "hsi_accuracy" (tỉ lệ đúng mức HSI theo h), "seconds".
+    """
+    t0 = time.perf_counter()
+    df = load_observations(csv_path)
+
+    # Quý gốc: từ quý có đủ N_HISTORY quý trước đó tới quý quan trắc cuối cùng
+    quarters = sorted(df[["year", "quarter"]].drop_duplicates().itertuples(index=False, name=None))
+    origins = quarters[N_HISTORY:]
+    if not origins:
+        raise ValueError("Không đủ dữ liệu lịch sử để backtest")
+
+    n_cores = os.cpu_count() or 1
+    workers = max(1, min(workers or n_cores, len(origins)))
+    n_threads = max(1, n_cores // workers)
+
+    # Chia quý gốc xen kẽ cho các worker (khối lượng mỗi quý gần như nhau)
+    chunks = [origins[i::workers] for i in range(workers)]
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(n_threads, csv_path)
+    ) as pool:
+        futures = [
+            pool.submit(backtest_origins, species, chunk, horizon, strategy)
+            for chunk in chunks
+        ]
+        forecasts = pd.concat([f.result() for f in futures], ignore_index=True)
+
+    variables = [c for c in forecasts.columns if c not in ("Station", "X", "Y", "origin", "horizon", "year", "quarter")]
+
+    # Giá trị thực tế + HSI thực tế của từng (trạm, quý)
+    actual = compute_hsi(df[["X", "Y", "year", "quarter"] + variables], species)
+    actual = actual.rename(columns={c: f"{c}_actual" for c in variables + ["HSI", "HSI_Level"]})
+
+    pairs = compute_hsi(forecasts, species).merge(actual, on=["X", "Y", "year", "quarter"], how="inner")
+    pairs = pairs.sort_values(["origin", "horizon", "Station"], kind="stable").reset_index(drop=True)
+
+    hit = pairs["HSI_Level"] == pairs["HSI_Level_actual"]
+    return {
+        "pairs": pairs,
+        "errors": error_table(pairs, variables),
+        "hsi_confusion": hsi_confusion(pairs),
+        "hsi_accuracy": hit.groupby(pairs["horizon"]).mean().rename("accuracy"),
+        "seconds": time.perf_counter() - t0,
+        "workers": workers,
+        "origins": len(origins),
+    }
+
+def save_backtest(result, out_dir):
+    """
+    Ghi errors.csv, hsi_confusion.csv (dạng dài) và forecasts.csv vào `out_dir`.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    result["errors"].to_csv(out_dir / "errors.csv", index=False)
+    confusion = pd.concat(
+        {h: m.stack() for h, m in result["hsi_confusion"].items()},
+        names=["horizon"]
+    ).rename("count").reset_index()
+    confusion.to_csv(out_dir / "hsi_confusion.csv", index=False)
+    result["pairs"].to_csv(out_dir / "forecasts.csv", index=False)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest walk-forward cho dự báo môi trường + HSI")
+    parser.add_argument("--species", default="oyster", choices=list(SPECIES_MODEL_FILES))
+    parser.add_argument("--horizon", type=int, default=DEFAULT_HORIZON)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--strategy", choices=["rolling", "direct"], default="rolling")
+    parser.add_argument("--out", default=None, help="thư mục ghi các file CSV kết quả")
+    args = parser.parse_args(argv)
+
+    result = run_backtest(
+        args.species,
+        horizon=args.horizon,
+        workers=args.workers,
+        strategy=args.strategy
+    )
+
+    errors = result["errors"]
+    print(f"📊 NRMSE theo bước dự báo ({args.species}, {args.strategy}):")
+    print(errors.pivot(index="variable", columns="horizon", values="nrmse").round(3).to_string())
+    print("\n🎯 Tỉ lệ đúng mức HSI theo bước dự báo:")
+    print(result["hsi_accuracy"].round(3).to_string())
+    print(f"\n🧮 Ma trận nhầm lẫn HSI (h = 1):")
+    print(result["hsi_confusion"][1].to_string())
+
+    if args.out:
+        save_backtest(result, args.out)
+        print(f"💾 Đã lưu kết quả tại: {args.out}")
+    print(
+        f"✅ {result['origins']} quý gốc × {result['pairs']['Station'].nunique()} trạm, "
+        f"{len(result['pairs'])} cặp dự báo | {result['workers']} tiến trình | {result['seconds']:.1f}s"
+    )
+
+if __name__ == "__main__":
+    main()
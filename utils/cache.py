@@ -0,0 +1,145 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+class ResultCache:
+    """
+    Cache kết quả dùng chung giữa các phiên dashboard.
+
+    - Giới hạn số phần tử (`max_entries`), loại bỏ phần tử ít dùng nhất (LRU).
+    - Mỗi phần tử hết hạn sau `ttl_seconds` giây (None = không hết hạn).
+    - Khoá nên là tuple nhỏ, rẻ để hash, ví dụ
+      ("hsi_map", species, year, quarter, version).
+    - Đếm hit / miss / eviction / expiration để theo dõi hiệu quả cache.
+
+    An toàn khi nhiều luồng (nhiều phiên Streamlit) truy cập cùng lúc.
+    """
+
+    def __init__(self, max_entries=128, ttl_seconds=3600, clock=time.monotonic):
+        if max_entries < 1:
+            raise ValueError("max_entries phải ≥ 1")
+
+        self.max_entries = int(max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expires_at(self):
+        if self.ttl_seconds is None:
+            return None
+        return self._clock() + self.ttl_seconds
+
+    def get(self, key, default=None):
+        """
+        Lấy giá trị theo khoá; trả về `default` nếu không có hoặc đã hết hạn.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= self._clock():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        Ghi giá trị; loại bỏ các phần tử cũ nhất nếu vượt `max_entries`.
+        """
+        with self._lock:
+            self._data[key] = (self._expires_at(), value)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """
+        Trả về giá trị trong cache, hoặc gọi `compute()` rồi lưu lại.
+
+        `compute` chạy ngoài khoá nên các khoá khác không bị chặn.
+        """
+        _missing = object()
+        value = self.get(key, _missing)
+        if value is not _missing:
+            return value
+
+        value = compute()
+        self.set(key, value)
+        return value
+
+    def items(self):
+        """
+        Danh sách (key, value) còn hiệu lực, từ cũ đến mới.
+        """
+        with self._lock:
+            now = self._clock()
+            return [
+                (key, value)
+                for key, (expires_at, value) in self._data.items()
+                if expires_at is None or expires_at > now
+            ]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and (entry[0] is None or entry[0] > self._clock())
+
+    def stats(self):
+        """
+        Thống kê cache (số phần tử, hit, miss, tỉ lệ hit, ...).
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+def file_version(*paths):
+    """
+    Phiên bản rẻ của một nhóm file (dựa trên đường dẫn, mtime, kích thước).
+
+    Dùng làm một phần của khoá cache để kết quả tự làm mới khi dữ liệu
+    hoặc mô hình thay đổi, mà không phải đọc/hash nội dung file.
+    """
+    h = hashlib.sha1()
+    for p in paths:
+        p = str(p)
+        try:
+            st = os.stat(p)
+            h.update(f"{p}:{st.st_mtime_ns}:{st.st_size};".encode())
+        except FileNotFoundError:
+            h.update(f"{p}:missing;".encode())
+    return h.hexdigest()[:12]
@@ -1,11 +1,7 @@
 import pandas as pd
 import pathlib
-from forecast import (
-    predict_future_metal_field_for_station,
-    predict_future_non_metal_field_for_station,
-    predict_for_station
-)
-from hsi import compute_hsi
+from utils.forecast import predict_for_station
+from utils.hsi import compute_hsi
 
 def load_station_coordinates(csv_path):
     """
@@ -120,16 +116,18 @@ def generate_hsi_files(
     print("✅ Generated HSI files:")
     print(f" - {oyster_path}")
     print(f" - {cobia_path}")
-    
-BASE_DIR = pathlib.Path(__file__).resolve().parent
-PROJECT_DIR = BASE_DIR.parent
-DATA_PATH = PROJECT_DIR / "data" / "data_quang_ninh" / "toa_do_qn.csv"
-OUT_DIR = PROJECT_DIR / "data" / "data_quang_ninh"
-
-generate_hsi_files(
-    coord_csv=DATA_PATH,
-    start_year=2026,
-    start_quarter=1,
-    n_quarters=4,
-    out_dir=OUT_DIR
-)
+
+if __name__ == "__main__":
+    # Sinh lại hsi_oyster.csv / hsi_cobia.csv: python -m utils.data
+    BASE_DIR = pathlib.Path(__file__).resolve().parent
+    PROJECT_DIR = BASE_DIR.parent
+    DATA_PATH = PROJECT_DIR / "data" / "data_quang_ninh" / "toa_do_qn.csv"
+    OUT_DIR = PROJECT_DIR / "data" / "data_quang_ninh"
+
+    generate_hsi_files(
+        coord_csv=DATA_PATH,
+        start_year=2026,
+        start_quarter=1,
+        n_quarters=4,
+        out_dir=OUT_DIR
+    )
@@ -0,0 +1,422 @@
+"""
+Xuất bản tĩnh (static snapshot) của dashboard để xem offline trên máy
+không có server Python.
+
+    python -m utils.export --out dist/dashboard_snapshot
+
+Dự báo / HSI / R được chạy batch một lần cho mọi loài và mọi quý
+(2026-2030), sau đó ghi ra thư mục gồm:
+
+    index.html               trang chính, liên kết tới từng loài
+    plotly.min.js            thư viện biểu đồ (dùng chung, không cần CDN)
+    map_<species>.html       bản đồ HSI/R với thanh trượt theo quý
+    stations_<species>.html  bảng + biểu đồ theo từng trạm
+    <species>_forecast.csv   toàn bộ bảng kết quả (mở bằng Excel)
+
+Mọi dữ liệu được nhúng thẳng vào HTML nên mở được bằng file:// .
+Riêng bản đồ nền (ảnh vệ tinh) và Leaflet vẫn tải từ Internet.
+"""
+import argparse
+import html
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils.forecast import QN_DATA_PATH, SPECIES_MODEL_FILES, predict_for_all_stations
+from utils.geo import vn2000_to_latlon
+from utils.hsi import compute_hsi, HSI_LEVELS
+from utils.r_hsi import compute_R_from_hsi
+from utils.timeline import (
+    TIMELINE_START_YEAR,
+    TIMELINE_START_QUARTER,
+    TIMELINE_N_QUARTERS,
+    HSI_LEVEL_COLORS,
+    HSI_LEVEL_DEFAULT_COLOR,
+    build_timeline_payload,
+)
+
+SPECIES_LABELS = {
+    "cobia": "🐟 Cá giò (Cobia)",
+    "oyster": "🦪 Hàu (Oyster)",
+}
+
+# Cột không phải thông số môi trường trong bảng kết quả
+_ID_COLUMNS = ["Station", "X", "Y", "year", "quarter", "HSI", "HSI_Level", "R_km"]
+
+def load_stations(csv_path=QN_DATA_PATH):
+    """
+    Danh sách trạm (Station, Station_Name, lat, lon), mỗi trạm một dòng.
+    """
+    df = pd.read_csv(csv_path, usecols=["Station", "Station_Name", "X", "Y"])
+    df = df.drop_duplicates("Station").reset_index(drop=True)
+    df["lat"], df["lon"] = vn2000_to_latlon(
+        df["X"].to_numpy(dtype=float),
+        df["Y"].to_numpy(dtype=float)
+    )
+    return df[["Station", "Station_Name", "lat", "lon"]]
+
+def compute_species_results(
+    species,
+    start_year=TIMELINE_START_YEAR,
+    start_quarter=TIMELINE_START_QUARTER,
+    n_quarters=TIMELINE_N_QUARTERS
+):
+    """
+    Dự báo + HSI + R cho mọi trạm và mọi quý của một loài (một lượt batch).
+
+    Returns
+    -------
+    DataFrame: Station, X, Y, year, quarter, <thông số>, HSI, HSI_Level, R_km
+    """
+    df_forecast = predict_for_all_stations(
+        species=species,
+        start_year=start_year,
+        start_quarter=start_quarter,
+        n_quarters=n_quarters
+    )
+    df_hsi = compute_hsi(df_forecast, species)
+    df_hsi["year"] = df_hsi["year"].astype(int)
+    df_hsi["quarter"] = df_hsi["quarter"].astype(int)
+
+    df_R = compute_R_from_hsi(pd.DataFrame({
+        "station": df_hsi["Station"],
+        "x": df_hsi["X"],
+        "y": df_hsi["Y"],
+        "year": df_hsi["year"],
+        "quarter": df_hsi["quarter"],
+        "hsi": df_hsi["HSI"].astype(float),
+    }))
+
+    return df_hsi.merge(
+        df_R.rename(columns={"station": "Station"})[["Station", "year", "quarter", "R_km"]],
+        on=["Station", "year", "quarter"],
+        how="left"
+    )
+
+def to_timeline(df_results):
+    """
+    Chuyển kết quả `compute_species_results` sang schema của `compute_timeline`.
+    """
+    return pd.DataFrame({
+        "station": df_results["Station"],
+        "x": df_results["X"],
+        "y": df_results["Y"],
+        "year": df_results["year"],
+        "quarter": df_results["quarter"],
+        "hsi": df_results["HSI"],
+        "hsi_level": df_results["HSI_Level"],
+        "R_km": df_results["R_km"],
+    })
+
+def build_station_payload(df_results, stations):
+    """
+    Payload dạng cột cho trang trạm: mỗi trạm một khối giá trị theo quý.
+
+    Returns
+    -------
+    dict
+        {
+          "params": [...], "periods": [[year, quarter], ...],
+          "stations": {station: {"name", "hsi", "level", "r", "values": {param: [...]}}}
+        }
+    """
+    params = [c for c in df_results.columns if c not in _ID_COLUMNS]
+    df_results = df_results.sort_values(["Station", "year", "quarter"], kind="stable")
+    periods = (
+        df_results[["year", "quarter"]]
+        .drop_duplicates()
+        .sort_values(["year", "quarter"])
+        .itertuples(index=False, name=None)
+    )
+    names = dict(zip(stations["Station"], stations["Station_Name"]))
+
+    def _round(values, ndigits):
+        return [None if pd.isna(v) else round(float(v), ndigits) for v in values]
+
+    payload = {}
+    for station, g in df_results.groupby("Station", sort=False):
+        payload[station] = {
+            "name": names.get(station, ""),
+            "hsi": _round(g["HSI"], 3),
+            "level": g["HSI_Level"].tolist(),
+            "r": _round(g["R_km"], 1),
+            "values": {p: _round(g[p], 3) for p in params},
+        }
+
+    return {
+        "params": params,
+        "periods": [[int(y), int(q)] for y, q in periods],
+        "stations": payload,
+    }
+
+def _json(obj):
+    # Nhúng an toàn vào <script>
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+
+def write_map(path, species, timeline_payload, stations):
+    """
+    Bản đồ Folium với lớp HSI/R theo quý (thanh trượt + nút phát).
+    """
+    import folium
+    from utils.timeline import TimeSliderLayer
+
+    m = folium.Map(
+        location=[stations["lat"].mean(), stations["lon"].mean()],
+        zoom_start=10,
+        tiles="https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}",
+        attr="Esri World Imagery"
+    )
+    first_period = tuple(timeline_payload["periods"][0])
+    TimeSliderLayer(timeline_payload, initial_period=first_period).add_to(m)
+    m.get_root().header.add_child(folium.Element(
+        f"<title>Bản đồ HSI - {html.escape(SPECIES_LABELS.get(species, species))}</title>"
+    ))
+    m.save(str(path))
+
+_STATIONS_TEMPLATE = """<!DOCTYPE html>
+<html lang="vi">
+<head>
+<meta charset="utf-8">
+<title>__TITLE__</title>
+<script src="plotly.min.js"></script>
+<style>
+  body { font-family: Arial, sans-serif; margin: 24px; color: #222; }
+  h1 { color: #2E86AB; font-size: 22px; }
+  table { border-collapse: collapse; font-size: 13px; margin-top: 12px; }
+  th, td { border: 1px solid #ddd; padding: 4px 8px; text-align: right; }
+  th { background: #f5f5f5; }
+  td.level { text-align: left; }
+  .controls { margin: 12px 0; }
+  .controls select { margin-right: 16px; padding: 4px; }
+  .chart { height: 380px; }
+  a { color: #2E86AB; }
+</style>
+</head>
+<body>
+<p><a href="index.html">← Trang chính</a></p>
+<h1>__TITLE__</h1>
+<div class="controls">
+  <label>Trạm: <select id="station"></select></label>
+  <label>Thông số: <select id="param"></select></label>
+</div>
+<div id="info"></div>
+<div id="hsi-chart" class="chart"></div>
+<div id="param-chart" class="chart"></div>
+<div id="table"></div>
+<script>
+(function() {
+  var data = __DATA__;
+  var levels = __LEVELS__;
+  var labels = data.periods.map(function(p) { return "Q" + p[1] + "/" + p[0]; });
+  var stationSelect = document.getElementById("station");
+  var paramSelect = document.getElementById("param");
+
+  Object.keys(data.stations).forEach(function(s) {
+    var opt = document.createElement("option");
+    opt.value = s;
+    opt.textContent = s + " - " + data.stations[s].name;
+    stationSelect.appendChild(opt);
+  });
+  data.params.forEach(function(p) {
+    var opt = document.createElement("option");
+    opt.value = p;
+    opt.textContent = p;
+    paramSelect.appendChild(opt);
+  });
+
+  function fmt(v, d) { return v === null ? "" : v.toFixed(d); }
+
+  function renderTable(st) {
+    var head = "<tr><th>Quý</th><th>HSI</th><th>Đánh giá</th><th>R (km)</th>" +
+      data.params.map(function(p) { return "<th>" + p + "</th>"; }).join("") + "</tr>";
+    var rows = labels.map(function(label, i) {
+      return "<tr><td>" + label + "</td><td>" + fmt(st.hsi[i], 3) + "</td>" +
+        "<td class='level'>" + st.level[i] + "</td><td>" + fmt(st.r[i], 1) + "</td>" +
+        data.params.map(function(p) { return "<td>" + fmt(st.values[p][i], 3) + "</td>"; }).join("") +
+        "</tr>";
+    }).join("");
+    document.getElementById("table").innerHTML = "<table>" + head + rows + "</table>";
+  }
+
+  function renderHsi(station, st) {
+    var shapes = levels.thresholds.map(function(t, i) {
+      return {type: "line", xref: "paper", x0: 0, x1: 1, y0: t, y1: t,
+              line: {color: levels.colors[i], dash: "dash", width: 1}};
+    });
+    Plotly.react("hsi-chart", [{
+      x: labels, y: st.hsi, mode: "lines+markers", name: "HSI",
+      line: {color: "#2E86AB", width: 3}, marker: {size: 8}
+    }], {
+      title: "HSI - trạm " + station, yaxis: {range: [0, 1.05]},
+      shapes: shapes, margin: {t: 40}
+    }, {responsive: true});
+  }
+
+  function renderParam(station, st) {
+    var p = paramSelect.value;
+    Plotly.react("param-chart", [{
+      x: labels, y: st.values[p], mode: "lines+markers", name: p,
+      line: {color: "#fd7e14", width: 2}, marker: {size: 7}
+    }], {title: p + " - trạm " + station, margin: {t: 40}}, {responsive: true});
+  }
+
+  function render() {
+    var station = stationSelect.value;
+    var st = data.stations[station];
+    document.getElementById("info").innerHTML = "<b>" + station + "</b> - " + st.name;
+    renderHsi(station, st);
+    renderParam(station, st);
+    renderTable(st);
+  }
+
+  stationSelect.addEventListener("change", render);
+  paramSelect.addEventListener("change", function() {
+    var station = stationSelect.value;
+    renderParam(station, data.stations[station]);
+  });
+  render();
+})();
+</script>
+</body>
+</html>
+"""
+
+def write_stations_page(path, species, station_payload):
+    """
+    Trang bảng + biểu đồ theo trạm (dữ liệu nhúng sẵn, vẽ bằng plotly.min.js).
+    """
+    levels = {
+        "thresholds": [t for t, _ in HSI_LEVELS],
+        "colors": HSI_LEVEL_COLORS,
+    }
+    title = f"HSI theo trạm - {SPECIES_LABELS.get(species, species)}"
+    page = (
+        _STATIONS_TEMPLATE
+        .replace("__TITLE__", html.escape(title))
+        .replace("__LEVELS__", _json(levels))
+        .replace("__DATA__", _json(station_payload))
+    )
+    Path(path).write_text(page, encoding="utf-8")
+
+def write_index(path, species_list, generated_at, period_range):
+    """
+    Trang chính của bản xuất.
+    """
+    items = "\n".join(
+        f'<li>{html.escape(SPECIES_LABELS.get(s, s))}: '
+        f'<a href="map_{s}.html">bản đồ</a> · '
+        f'<a href="stations_{s}.html">bảng &amp; biểu đồ theo trạm</a> · '
+        f'<a href="{s}_forecast.csv">CSV</a></li>'
+        for s in species_list
+    )
+    legend = "".join(
+        f'<li><span style="color:{color}">●</span> HSI ≥ {threshold}: {html.escape(label)}</li>'
+        for (threshold, label), color in zip(HSI_LEVELS, HSI_LEVEL_COLORS)
+    )
+    page = f"""<!DOCTYPE html>
+<html lang="vi">
+<head>
+<meta charset="utf-8">
+<title>Dự báo HSI - Quảng Ninh (bản xuất tĩnh)</title>
+<style>
+  body {{ font-family: Arial, sans-serif; margin: 24px; color: #222; }}
+  h1 {{ color: #2E86AB; }}
+  li {{ margin: 6px 0; }}
+  a {{ color: #2E86AB; }}
+</style>
+</head>
+<body>
+<h1>🌊 Dự báo HSI các trạm quan trắc Quảng Ninh</h1>
+<p>Giai đoạn dự báo: {period_range}. Tạo lúc: {generated_at}.</p>
+<ul>
+{items}
+</ul>
+<h3>Thang đánh giá</h3>
+<ul>
+{legend}
+<li><span style="color:{HSI_LEVEL_DEFAULT_COLOR}">●</span> Còn lại: Không phù hợp</li>
+</ul>
+</body>
+</html>
+"""
+    Path(path).write_text(page, encoding="utf-8")
+
+def export_bundle(
+    out_dir,
+    species_list=None,
+    start_year=TIMELINE_START_YEAR,
+    start_quarter=TIMELINE_START_QUARTER,
+    n_quarters=TIMELINE_N_QUARTERS
+):
+    """
+    Tính kết quả cho mọi loài / mọi quý và ghi bản xuất tĩnh vào `out_dir`.
+
+    Returns
+    -------
+    dict
+        Thời gian (giây) của từng bước.
+    """
+    from plotly.offline import get_plotlyjs
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    species_list = list(species_list or SPECIES_MODEL_FILES)
+
+    timings = {}
+    stations = load_stations()
+    (out_dir / "plotly.min.js").write_text(get_plotlyjs(), encoding="utf-8")
+
+    periods = None
+    for species in species_list:
+        t0 = time.perf_counter()
+        df_results = compute_species_results(species, start_year, start_quarter, n_quarters)
+        timings[f"{species}_compute"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        df_results.to_csv(out_dir / f"{species}_forecast.csv", index=False, encoding="utf-8-sig")
+
+        timeline_payload = build_timeline_payload(to_timeline(df_results), stations)
+        write_map(out_dir / f"map_{species}.html", species, timeline_payload, stations)
+
+        station_payload = build_station_payload(df_results, stations)
+        write_stations_page(out_dir / f"stations_{species}.html", species, station_payload)
+        periods = station_payload["periods"]
+        timings[f"{species}_write"] = time.perf_counter() - t0
+
+    period_range = f"Q{periods[0][1]}/{periods[0][0]} - Q{periods[-1][1]}/{periods[-1][0]}" if periods else ""
+    write_index(
+        out_dir / "index.html",
+        species_list,
+        pd.Timestamp.now().strftime("%d/%m/%Y %H:%M"),
+        period_range
+    )
+    return timings
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Xuất bản tĩnh (HTML) của dashboard dự báo")
+    parser.add_argument("--out", default="dashboard_snapshot")
+    parser.add_argument("--species", nargs="+", choices=list(SPECIES_MODEL_FILES))
+    parser.add_argument("--year", type=int, default=TIMELINE_START_YEAR)
+    parser.add_argument("--quarter", type=int, default=TIMELINE_START_QUARTER, choices=[1, 2, 3, 4])
+    parser.add_argument("--n-quarters", type=int, default=TIMELINE_N_QUARTERS)
+    args = parser.parse_args(argv)
+
+    timings = export_bundle(
+        args.out,
+        species_list=args.species,
+        start_year=args.year,
+        start_quarter=args.quarter,
+        n_quarters=args.n_quarters
+    )
+
+    print("✅ Xuất bản tĩnh xong:")
+    for step, seconds in timings.items():
+        print(f" - {step:<18} {seconds:.2f}s")
+    total = sum(f.stat().st_size for f in Path(args.out).iterdir() if f.is_file())
+    print(f"💾 Thư mục: {args.out} ({total / 1e6:.1f} MB)")
+
+if __name__ == "__main__":
+    main()
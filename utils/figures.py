@@ -0,0 +1,156 @@
+import copy
+
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from utils.hsi import HSI_LEVELS
+
+# Màu đường ngưỡng HSI (cùng thứ tự với HSI_LEVELS)
+HSI_THRESHOLD_COLORS = ["green", "orange", "red"]
+
+# Số biểu đồ con trên một hàng ở tab thông số môi trường
+ENV_COLS_PER_ROW = 2
+
+def hsi_figure(labels, hsi, title):
+    """
+    Biểu đồ HSI theo quý kèm các đường ngưỡng đánh giá.
+    """
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=list(labels),
+        y=list(hsi),
+        mode='lines+markers',
+        name='HSI',
+        line=dict(color='#2E86AB', width=3),
+        marker=dict(size=10, symbol='circle'),
+        hovertemplate='<b>%{x}</b><br>HSI: %{y:.3f}<br><extra></extra>'
+    ))
+
+    for (threshold, label), color in zip(HSI_LEVELS, HSI_THRESHOLD_COLORS):
+        fig.add_hline(
+            y=threshold, line_dash="dash", line_color=color,
+            annotation_text=f"{label} (≥{threshold})",
+            annotation_position="right"
+        )
+
+    fig.update_layout(
+        title=title,
+        xaxis_title="Thời gian",
+        yaxis_title="Chỉ số HSI",
+        yaxis_range=[0, 1],
+        height=500,
+        hovermode='x unified',
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+    )
+    fig.update_xaxes(showgrid=True, gridwidth=1, gridcolor='lightgray')
+    fig.update_yaxes(showgrid=True, gridwidth=1, gridcolor='lightgray')
+    return fig
+
+def param_trace(labels, values, name):
+    """
+    Spec JSON (dict) của đường một thông số môi trường, chưa gắn trục.
+    """
+    return go.Scatter(
+        x=list(labels),
+        y=[float(v) for v in values],
+        mode='lines+markers',
+        name=name,
+        line=dict(width=2),
+        marker=dict(size=8),
+        showlegend=False,
+        hovertemplate='<b>%{x}</b><br>Giá trị: %{y:.2f}<br><extra></extra>'
+    ).to_plotly_json()
+
+def env_layout(titles, cols_per_row=ENV_COLS_PER_ROW):
+    """
+    Spec JSON (dict) của layout lưới biểu đồ con (chỉ phụ thuộc tiêu đề).
+    """
+    num_rows = (len(titles) + cols_per_row - 1) // cols_per_row
+    fig = make_subplots(
+        rows=num_rows,
+        cols=cols_per_row,
+        subplot_titles=list(titles),
+        vertical_spacing=0.12,
+        horizontal_spacing=0.1
+    )
+    fig.update_xaxes(showgrid=True, gridwidth=1, gridcolor='lightgray')
+    fig.update_yaxes(showgrid=True, gridwidth=1, gridcolor='lightgray')
+    fig.update_layout(
+        height=300 * num_rows,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        hovermode='closest'
+    )
+    return fig.layout.to_plotly_json()
+
+def assemble_env_figure(layout, traces):
+    """
+    Ghép layout lưới và các trace (theo thứ tự ô: trái → phải, trên → dưới).
+    """
+    data = []
+    for idx, trace in enumerate(traces):
+        trace = copy.copy(trace)
+        suffix = "" if idx == 0 else str(idx + 1)
+        trace["xaxis"] = f"x{suffix}"
+        trace["yaxis"] = f"y{suffix}"
+        data.append(trace)
+    return go.Figure(data=data, layout=layout)
+
+def cached_hsi_figure(cache, key, labels, hsi, title):
+    """
+    Biểu đồ HSI lấy từ cache theo `key`, hoặc dựng mới rồi lưu lại.
+
+    `key` nên gồm (species, station, năm/quý bắt đầu, số quý, phiên bản mô hình).
+    Figure trong cache được dùng chung giữa các phiên, không được sửa tại chỗ.
+    """
+    return cache.get_or_compute(
+        ("fig_hsi",) + tuple(key),
+        lambda: hsi_figure(labels, hsi, title)
+    )
+
+def cached_env_figure(cache, key, labels, series, titles):
+    """
+    Lưới biểu đồ thông số môi trường, cache theo từng tầng:
+
+    - trace của mỗi thông số: ("fig_trace", *key, param)
+    - layout lưới: ("fig_env_layout", titles)
+    - figure hoàn chỉnh: ("fig_env", *key, params)
+
+    Khi chỉ đổi lựa chọn thông số, chỉ trace của thông số mới được dựng lại.
+
+    Parameters
+    ----------
+    cache : ResultCache
+    key : tuple
+        (species, station, năm/quý bắt đầu, số quý, phiên bản mô hình).
+    labels : list
+        Nhãn trục thời gian.
+    series : dict
+        {param: giá trị theo quý}, theo thứ tự hiển thị.
+    titles : dict
+        {param: tiêu đề biểu đồ con}.
+
+    Returns
+    -------
+    go.Figure
+    """
+    key = tuple(key)
+    params = tuple(series)
+
+    def build():
+        traces = [
+            cache.get_or_compute(
+                ("fig_trace",) + key + (p,),
+                lambda p=p: param_trace(labels, series[p], titles[p])
+            )
+            for p in params
+        ]
+        layout_titles = tuple(titles[p] for p in params)
+        layout = cache.get_or_compute(
+            ("fig_env_layout", layout_titles),
+            lambda: env_layout(layout_titles)
+        )
+        return assemble_env_figure(layout, traces)
+
+    return cache.get_or_compute(("fig_env",) + key + (params,), build)
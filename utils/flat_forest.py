@@ -0,0 +1,474 @@
+"""
+Bộ suy luận cây "phẳng" (numpy) cho các mô hình XGBoost dự báo.
+
+Toàn bộ booster của một mô hình (`MultiOutputRegressor` gồm nhiều
+`XGBRegressor`, hoặc một booster đơn) được gom thành các mảng nút liền
+kề: feature, threshold, left, right, value. Khi dự báo, mọi cây của mọi
+biến mục tiêu được duyệt cùng lúc cho cả batch (mỗi vòng lặp đi xuống
+một tầng), không qua sklearn / DMatrix.
+
+Nhanh hơn XGBoost rõ rệt với batch nhỏ (dự báo 1 trạm, vài trạm) vì
+không có chi phí cố định mỗi lần gọi; với batch lớn XGBoost (C++, đa
+luồng) vẫn nhanh hơn, xem `FLAT_MAX_ROWS` trong utils/forecast.py.
+
+`RowForest` sắp lại các cây theo tầng cho dự báo từng dòng một (rolling
+forecast một trạm), dùng qua `RowPredictor` trong utils/forecast.py.
+
+Xuất (model/output/<tên>_flat.npz) và kiểm tra khớp với XGBoost:
+
+    python -m utils.flat_forest
+"""
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# Độ sâu tối đa để dựng bố cục theo tầng (mỗi cây chiếm 2^depth ô ở tầng lá)
+ROW_MAX_DEPTH = 12
+
+class FlatForest:
+    """
+    Tập cây của nhiều biến mục tiêu dưới dạng mảng phẳng.
+
+    Quy ước (giống XGBoost):
+    - Đi sang trái nếu `x < threshold` (so sánh float32), NaN đi theo `default_left`.
+    - Nút lá trỏ về chính nó (left = right = chính nút đó, threshold = NaN,
+      default_left = True) nên chỉ cần lặp đúng `max_depth` bước cho mọi cây.
+    - Dự báo của biến mục tiêu k = base_score[k] + tổng giá trị lá của các cây có
+      tree_target == k (cộng float32 theo thứ tự cây, như XGBoost).
+
+    Attributes
+    ----------
+    feature, threshold, left, right, default_left, value : np.ndarray
+        Mảng theo nút (đánh chỉ số toàn cục).
+    roots : np.ndarray
+        Chỉ số nút gốc của từng cây.
+    tree_target : np.ndarray
+        Biến mục tiêu của từng cây.
+    base_score : np.ndarray
+        Giá trị khởi đầu của từng biến mục tiêu.
+    """
+
+    def __init__(
+        self,
+        feature,
+        threshold,
+        left,
+        right,
+        default_left,
+        value,
+        roots,
+        tree_target,
+        base_score,
+        max_depth,
+        feature_names=None,
+        source_version=None
+    ):
+        self.feature = np.asarray(feature, dtype=np.int32)
+        self.threshold = np.asarray(threshold, dtype=np.float32)
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.default_left = np.asarray(default_left, dtype=bool)
+        self.value = np.asarray(value, dtype=np.float32)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.tree_target = np.asarray(tree_target, dtype=np.int32)
+        self.base_score = np.asarray(base_score, dtype=np.float64)
+        self.max_depth = int(max_depth)
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        self.source_version = source_version
+
+        # Cây được sắp theo biến mục tiêu: cây của biến k là roots[bounds[k]:bounds[k + 1]]
+        self._bounds = np.searchsorted(self.tree_target, np.arange(self.n_targets + 1))
+        # XGBoost cấp phát hai nút con liền nhau (right = left + 1): chỉ cần tra mảng left
+        internal = self.left != np.arange(self.n_nodes)
+        self._paired = bool(np.all(self.right[internal] == self.left[internal] + 1))
+
+    @property
+    def n_targets(self):
+        return len(self.base_score)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @classmethod
+    def from_model(cls, model, source_version=None):
+        """
+        Tạo từ `MultiOutputRegressor`, `XGBRegressor` hoặc `xgboost.Booster`.
+
+        Hỗ trợ cả booster nhiều đầu ra (multi_strategy="one_output_per_tree"
+        hoặc "multi_output_tree"; cây lá vector được tách thành một cây vô hướng
+        cho mỗi biến mục tiêu). Chỉ hỗ trợ cây số (không có split phân loại)
+        với hàm mục tiêu hồi quy có link đồng nhất (ví dụ reg:squarederror).
+        """
+        estimators = getattr(model, "estimators_", [model])
+
+        nodes = {k: [] for k in ("feature", "threshold", "left", "right", "default_left", "value")}
+        roots, tree_target, base_score = [], [], []
+        feature_names = None
+        offset = 0
+        max_depth = 0
+
+        for estimator in estimators:
+            booster = estimator.get_booster() if hasattr(estimator, "get_booster") else estimator
+            if feature_names is None:
+                feature_names = booster.feature_names
+
+            learner = json.loads(booster.save_raw("json"))["learner"]
+            objective = learner["objective"]["name"]
+            if objective not in ("reg:squarederror", "reg:absoluteerror", "reg:pseudohubererror"):
+                raise ValueError(f"Hàm mục tiêu chưa được hỗ trợ: {objective}")
+
+            gbm = learner["gradient_booster"]
+            if gbm["name"] != "gbtree":
+                raise ValueError(f"Chỉ hỗ trợ gbtree, nhận được: {gbm['name']}")
+
+            trees = gbm["model"]["trees"]
+            tree_info = gbm["model"]["tree_info"]
+            # Dùng đúng số cây như sklearn predict (tôn trọng early stopping)
+            best_iteration = getattr(estimator, "best_iteration", None)
+            if best_iteration is not None:
+                indptr = gbm["model"].get("iteration_indptr")
+                if indptr is not None:
+                    n_used = int(indptr[best_iteration + 1])
+                else:
+                    per_round = int(gbm["model"]["gbtree_model_param"]["num_parallel_tree"])
+                    n_used = (best_iteration + 1) * per_round
+                trees, tree_info = trees[:n_used], tree_info[:n_used]
+
+            # Booster nhiều đầu ra: base_score là vector "[a,b,...]"
+            target_offset = len(base_score)
+            base_score += [float(v) for v in learner["learner_model_param"]["base_score"].strip("[]").split(",")]
+
+            for tree, group in zip(trees, tree_info):
+                if any(tree.get("split_type", [])):
+                    raise ValueError("Không hỗ trợ split phân loại")
+
+                left = np.asarray(tree["left_children"], dtype=np.int64)
+                right = np.asarray(tree["right_children"], dtype=np.int64)
+                n = len(left)
+                is_leaf = left == -1
+                own = np.arange(n)
+                depth = _tree_depth(left, right)
+
+                n_leaf_values = int(tree["tree_param"].get("size_leaf_vector", "1"))
+                if n_leaf_values > 1:
+                    # Lá vector: giá trị lá của biến k là base_weights[nút * K + k]
+                    weights = np.asarray(tree["base_weights"], dtype=np.float64).reshape(n, n_leaf_values)
+                    leaf_values = [(target_offset + k, weights[:, k]) for k in range(n_leaf_values)]
+                else:
+                    # Với nút lá, split_conditions chứa giá trị lá
+                    leaf_values = [(target_offset + int(group), np.asarray(tree["split_conditions"]))]
+
+                for target, values in leaf_values:
+                    nodes["feature"].append(np.where(is_leaf, 0, tree["split_indices"]))
+                    nodes["threshold"].append(np.where(is_leaf, np.nan, tree["split_conditions"]))
+                    nodes["left"].append(np.where(is_leaf, own, left) + offset)
+                    nodes["right"].append(np.where(is_leaf, own, right) + offset)
+                    nodes["default_left"].append(is_leaf | np.asarray(tree["default_left"], dtype=bool))
+                    nodes["value"].append(np.where(is_leaf, values, 0.0))
+
+                    roots.append(offset)
+                    tree_target.append(target)
+                    max_depth = max(max_depth, depth)
+                    offset += n
+
+        # Gom cây theo biến mục tiêu, giữ nguyên thứ tự cây trong mỗi biến
+        order = np.argsort(np.asarray(tree_target), kind="stable")
+
+        return cls(
+            feature=np.concatenate(nodes["feature"]),
+            threshold=np.concatenate(nodes["threshold"]),
+            left=np.concatenate(nodes["left"]),
+            right=np.concatenate(nodes["right"]),
+            default_left=np.concatenate(nodes["default_left"]),
+            value=np.concatenate(nodes["value"]),
+            roots=np.asarray(roots)[order],
+            tree_target=np.asarray(tree_target)[order],
+            base_score=base_score,
+            max_depth=max_depth,
+            feature_names=feature_names,
+            source_version=source_version
+        )
+
+    def predict(self, X):
+        """
+        Dự báo mọi biến mục tiêu cho một batch.
+
+        Parameters
+        ----------
+        X : array-like, shape (n_rows, n_features)
+            Cùng thứ tự cột với lúc huấn luyện (DataFrame cũng được).
+
+        Returns
+        -------
+        np.ndarray (float32), shape (n_rows, n_targets)
+        """
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        n_rows, n_features = X.shape
+        flat_X = X.ravel()
+        has_nan = bool(np.isnan(flat_X).any())
+
+        # (n_rows, n_trees): nút hiện tại của mỗi cây cho mỗi dòng
+        offsets = (np.arange(n_rows) * n_features)[:, None]
+        idx = np.broadcast_to(self.roots, (n_rows, self.n_trees))
+
+        for _ in range(self.max_depth):
+            x = np.take(flat_X, offsets + np.take(self.feature, idx))
+            # NaN >= threshold luôn False; nút lá có threshold NaN nên đứng yên
+            go_right = x >= np.take(self.threshold, idx)
+            if has_nan:
+                go_right |= np.isnan(x) & ~np.take(self.default_left, idx)
+
+            if self._paired:
+                idx = np.take(self.left, idx) + go_right
+            else:
+                idx = np.where(go_right, np.take(self.right, idx), np.take(self.left, idx))
+
+        # Cộng dồn tuần tự theo float32, bắt đầu từ base_score, đúng thứ tự
+        # cộng của XGBoost nên kết quả khớp từng bit
+        leaf = np.take(self.value, idx)
+        out = np.empty((n_rows, self.n_targets), dtype=np.float32)
+        for k in range(self.n_targets):
+            start, end = self._bounds[k], self._bounds[k + 1]
+            acc = np.empty((n_rows, end - start + 1), dtype=np.float32)
+            acc[:, 0] = self.base_score[k]
+            acc[:, 1:] = leaf[:, start:end]
+            out[:, k] = np.cumsum(acc, axis=1, dtype=np.float32)[:, -1]
+        return out
+
+    def save(self, path):
+        """
+        Ghi các mảng ra file .npz. Ghi vào file tạm rồi đổi tên, nên phiên / worker
+        khác đọc cùng lúc không bao giờ thấy file ghi dở.
+        """
+        path = str(path)
+        tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            with open(tmp, "wb") as f:
+                self._savez(f)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def _savez(self, f):
+        np.savez(
+            f,
+            feature=self.feature,
+            threshold=self.threshold,
+            left=self.left,
+            right=self.right,
+            default_left=self.default_left,
+            value=self.value,
+            roots=self.roots,
+            tree_target=self.tree_target,
+            base_score=self.base_score,
+            max_depth=np.array(self.max_depth),
+            feature_names=np.array(self.feature_names or [], dtype=str),
+            source_version=np.array(self.source_version or ""),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            feature_names = data["feature_names"].tolist() or None
+            source_version = str(data["source_version"]) if "source_version" in data else None
+            return cls(
+                feature=data["feature"],
+                threshold=data["threshold"],
+                left=data["left"],
+                right=data["right"],
+                default_left=data["default_left"],
+                value=data["value"],
+                roots=data["roots"],
+                tree_target=data["tree_target"],
+                base_score=data["base_score"],
+                max_depth=int(data["max_depth"]),
+                feature_names=feature_names,
+                source_version=source_version or None
+            )
+
+class RowForest:
+    """
+    Bố cục theo tầng của `FlatForest`, tối ưu cho dự báo từng dòng một
+    (rolling forecast một trạm).
+
+    Mỗi cây được trải thành cây nhị phân đầy đủ: nút thứ j ở tầng d của cây t
+    nằm ở ô t * 2^d + j, con của nó ở tầng d + 1 là 2j và 2j + 1. Nhờ vậy không
+    cần tra mảng con trái / phải, và các ô của cùng một tầng nằm liền nhau
+    (truy cập bộ nhớ tuần tự theo cây). Nút lá ở tầng nông được nhân bản
+    xuống tới tầng lá.
+
+    Đầu mỗi nhóm cây của một biến mục tiêu có thêm một "cây" hằng bằng
+    base_score (và cây hằng 0 để các nhóm dài bằng nhau), nên tổng lá chỉ cần
+    một lần cumsum float32 trên mảng (n_targets, n_cây_mỗi_nhóm), khớp từng bit
+    với XGBoost.
+
+    Mọi mảng trung gian được cấp phát sẵn; `predict` giữ khoá nên dùng chung
+    được giữa các luồng (các phiên Streamlit).
+    """
+
+    def __init__(self, forest):
+        if forest.max_depth > ROW_MAX_DEPTH:
+            raise ValueError(
+                f"Cây quá sâu cho bố cục theo tầng: {forest.max_depth} > {ROW_MAX_DEPTH}"
+            )
+
+        self.n_targets = forest.n_targets
+        self.max_depth = forest.max_depth
+        self.feature_names = forest.feature_names
+        self.source_version = forest.source_version
+
+        # Thứ tự cây: [cây base_score, các cây của biến k, cây 0 để đệm] cho từng k
+        counts = np.diff(forest._bounds)
+        width = int(counts.max()) + 1
+        order = np.full((self.n_targets, width), -1, dtype=np.int64)
+        for k in range(self.n_targets):
+            order[k, 1:counts[k] + 1] = np.arange(forest._bounds[k], forest._bounds[k + 1])
+        order = order.ravel()
+        is_const = order < 0
+        const_value = np.zeros((self.n_targets, width), dtype=np.float32)
+        const_value[:, 0] = forest.base_score
+        const_value = const_value.ravel()
+
+        n_trees = len(order)
+        self._width = width
+        self._n_trees = n_trees
+
+        # Đi xuống từng tầng, ghi lại feature / threshold / default_left của mỗi ô
+        node = np.where(is_const, 0, forest.roots[np.maximum(order, 0)])[:, None]
+        self._feature, self._threshold, self._default_left = [], [], []
+        for _ in range(self.max_depth):
+            threshold = np.where(is_const[:, None], np.nan, forest.threshold[node])
+            self._feature.append(np.ascontiguousarray(forest.feature[node], dtype=np.intp).ravel())
+            self._threshold.append(np.ascontiguousarray(threshold, dtype=np.float32).ravel())
+            self._default_left.append(np.ascontiguousarray(forest.default_left[node]).ravel())
+            node = np.stack([forest.left[node], forest.right[node]], axis=2).reshape(n_trees, -1)
+
+        leaf = np.where(is_const[:, None], const_value[:, None], forest.value[node])
+        self._leaf = np.ascontiguousarray(leaf, dtype=np.float32).ravel()
+
+        # Ô đầu của mỗi cây ở từng tầng: t * 2^d
+        self._tree_base = [np.arange(n_trees, dtype=np.intp) << d for d in range(self.max_depth + 1)]
+
+        # Bộ đệm cấp phát sẵn
+        self._pos = np.empty(n_trees, dtype=np.intp)
+        self._slot = np.empty(n_trees, dtype=np.intp)
+        self._feat = np.empty(n_trees, dtype=np.intp)
+        self._x = np.empty(n_trees, dtype=np.float32)
+        self._thr = np.empty(n_trees, dtype=np.float32)
+        self._go_right = np.empty(n_trees, dtype=bool)
+        self._nan = np.empty(n_trees, dtype=bool)
+        self._leaf_value = np.empty((self.n_targets, width), dtype=np.float32)
+        self._acc = np.empty((self.n_targets, width), dtype=np.float32)
+        self._lock = threading.Lock()
+
+    def predict(self, x):
+        """
+        Dự báo mọi biến mục tiêu cho một dòng.
+
+        Parameters
+        ----------
+        x : np.ndarray (float32), shape (n_features,)
+            Cùng thứ tự cột với lúc huấn luyện.
+
+        Returns
+        -------
+        np.ndarray (float32), shape (n_targets,)
+            Mảng mới (không phải bộ đệm nội bộ).
+        """
+        has_nan = bool(np.isnan(x).any())
+        pos, slot = self._pos, self._slot
+        go_right = self._go_right
+
+        # Chỉ số luôn hợp lệ nên dùng mode="clip" (bỏ bước kiểm tra biên, nhanh hơn)
+        with self._lock:
+            pos[:] = 0
+            for d in range(self.max_depth):
+                np.add(self._tree_base[d], pos, out=slot)
+                np.take(self._feature[d], slot, out=self._feat, mode="clip")
+                np.take(x, self._feat, out=self._x, mode="clip")
+                np.take(self._threshold[d], slot, out=self._thr, mode="clip")
+                # NaN >= threshold luôn False; ô không tách có threshold NaN nên đi trái
+                np.greater_equal(self._x, self._thr, out=go_right)
+                if has_nan:
+                    np.isnan(self._x, out=self._nan)
+                    self._nan &= ~np.take(self._default_left[d], slot)
+                    go_right |= self._nan
+                np.left_shift(pos, 1, out=pos)
+                pos += go_right
+
+            np.add(self._tree_base[self.max_depth], pos, out=slot)
+            np.take(self._leaf, slot, out=self._leaf_value.reshape(-1), mode="clip")
+            np.cumsum(self._leaf_value, axis=1, dtype=np.float32, out=self._acc)
+            return self._acc[:, -1].copy()
+
+def _tree_depth(left, right):
+    """
+    Độ sâu lớn nhất của một cây (gốc ở độ sâu 0) từ mảng con trái / phải.
+    """
+    depth = np.zeros(len(left), dtype=np.int64)
+    for node in range(len(left)):
+        if left[node] != -1:
+            depth[left[node]] = depth[node] + 1
+            depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+def main():
+    from utils.forecast import SPECIES_MODEL_FILES, load_flat_model, load_metal_model, load_species_model
+
+    models = {species: load_species_model(species)[:2] for species in SPECIES_MODEL_FILES}
+    models["metal"] = load_metal_model()
+
+    rng = np.random.default_rng(0)
+    for name, (model, feature_cols) in models.items():
+        t0 = time.perf_counter()
+        forest = load_flat_model(name)
+        t_load = time.perf_counter() - t0
+
+        # Dữ liệu kiểm tra: ngẫu nhiên, có cả giá trị thiếu
+        X = rng.normal(size=(256, len(feature_cols))) * 10 + 5
+        X[rng.random(X.shape) < 0.02] = np.nan
+
+        y_xgb = np.asarray(model.predict(X))
+        y_flat = forest.predict(X)
+        err = np.abs(y_flat - y_xgb).max()
+        status = "✅" if np.array_equal(y_flat, y_xgb) else ("⚠️" if np.allclose(y_flat, y_xgb, rtol=1e-5) else "❌")
+        print(
+            f"{status} {name:<7} {forest.n_trees} cây, {forest.n_nodes} nút, sâu {forest.max_depth} "
+            f"| nạp/xuất {t_load:.1f}s | sai lệch max {err:.2e}"
+        )
+
+        for n_rows in (1, 4, 16, 99):
+            X_batch = X[:n_rows] if n_rows <= len(X) else X
+            times = {}
+            for engine, predict in (("xgboost", model.predict), ("flat", forest.predict)):
+                predict(X_batch)
+                t0 = time.perf_counter()
+                for _ in range(5):
+                    predict(X_batch)
+                times[engine] = (time.perf_counter() - t0) / 5 * 1000
+            print(f"   {n_rows:>3} dòng: xgboost {times['xgboost']:7.1f} ms | flat {times['flat']:7.1f} ms")
+
+        # Một dòng với bố cục theo tầng (rolling forecast một trạm)
+        row_forest = RowForest(forest)
+        rows = X.astype(np.float32)
+        exact = all(np.array_equal(row_forest.predict(r), y) for r, y in zip(rows, y_flat))
+        t0 = time.perf_counter()
+        for r in rows:
+            row_forest.predict(r)
+        t_row = (time.perf_counter() - t0) / len(rows) * 1000
+        print(f"   {'✅' if exact else '❌'} 1 dòng (theo tầng): {t_row:.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,367 @@
-import joblib
+import threading
+import zipfile
+
 import pandas as pd
 import numpy as np
+from functools import wraps
 from pathlib import Path
 
+from utils.cache import file_version
+from utils.flat_forest import FlatForest, RowForest
+from utils.model_bundle import MANIFEST_FILE, convert_legacy_model, load_model_bundle, read_manifest
+
+BASE_DIR = Path(__file__).resolve().parent
+PROJECT_DIR = BASE_DIR.parent
+QN_DATA_PATH = PROJECT_DIR / "data" / "data_quang_ninh" / "qn_env_clean_ready.csv"
+MODEL_DIR = PROJECT_DIR / "model" / "output"
+
+# Mô hình được lưu dạng bundle (thư mục, xem utils/model_bundle.py)
+METAL_TARGETS = ["CN","As","Cd","Pb","Cu","Hg","Zn","Total_Cr"]
+SPECIES_MODEL_FILES = {
+    "cobia": "hk_cobia_finetuned",
+    "oyster": "hk_oyster_finetuned",
+}
+METAL_MODEL_FILE = "metal_ts_model"
+
+# Mô hình dự báo trực tiếp nhiều bước (--mode direct trong model/basemodel.py,
+# model/finetune_*.py và model/metal.py)
+DIRECT_MODEL_FILES = {
+    "cobia": "hk_cobia_direct_finetuned",
+    "oyster": "hk_oyster_direct_finetuned",
+    "metal": "metal_direct_model",
+}
+
+# Số dòng mỗi lần predict tối đa để dùng bộ suy luận cây phẳng (numpy);
+# batch lớn hơn thì XGBoost nhanh hơn (xem utils/flat_forest.py)
+FLAT_MAX_ROWS = 8
+
+# Số luồng XGBoost khi dự báo một dòng: một dòng không đủ việc cho cả đội luồng,
+# khởi động / đồng bộ luồng còn tốn hơn phần tính toán
+ROW_PREDICT_THREADS = 1
+
+def model_bundle_path(name):
+    """
+    Thư mục bundle của mô hình loài / kim loại ("<tên>_direct": mô hình trực tiếp).
+
+    Nếu chưa có bundle mà còn file pickle cũ (<bundle>.pkl) thì chuyển đổi một lần.
+    """
+    direct = name.endswith("_direct")
+    base_name = name[:-len("_direct")] if direct else name
+
+    if direct and base_name in DIRECT_MODEL_FILES:
+        path = MODEL_DIR / DIRECT_MODEL_FILES[base_name]
+    elif direct:
+        raise ValueError("name phải là 'cobia_direct', 'oyster_direct' hoặc 'metal_direct'")
+    elif name == "metal":
+        path = MODEL_DIR / METAL_MODEL_FILE
+    elif name in SPECIES_MODEL_FILES:
+        path = MODEL_DIR / SPECIES_MODEL_FILES[name]
+    else:
+        raise ValueError("name phải là 'cobia', 'oyster' hoặc 'metal'")
+
+    legacy_path = path.with_name(path.name + ".pkl")
+    if not (path / MANIFEST_FILE).exists() and legacy_path.exists():
+        convert_legacy_model(legacy_path, METAL_TARGETS if base_name == "metal" else None)
+    return path
+
+# Số luồng XGBoost áp cho mọi mô hình nạp trong tiến trình (None = mặc định của XGBoost)
+_MODEL_THREADS = None
+
+def limit_model_threads(n_threads):
+    """
+    Giới hạn số luồng XGBoost cho mọi mô hình nạp sau lời gọi này trong tiến
+    trình, kể cả khi nạp lại vì bundle được huấn luyện / fine-tune lại.
+    """
+    global _MODEL_THREADS
+    _MODEL_THREADS = n_threads
+
+def _bundle_cache(func):
+    """
+    Cache kết quả của `func(name, ...)` theo phiên bản manifest của bundle `name`
+    (`file_version`): mô hình được lưu lại thì lần gọi sau nạp lại, bản cũ bị bỏ.
+    """
+    cache = {}
+
+    @wraps(func)
+    def wrapper(name, *args, **kwargs):
+        version = file_version(model_bundle_path(name) / MANIFEST_FILE)
+        key = (name, args, tuple(sorted(kwargs.items())))
+        hit = cache.get(key)
+        if hit is not None and hit[0] == version:
+            return hit[1]
+
+        value = func(name, *args, **kwargs)
+        cache[key] = (version, value)
+        return value
+
+    wrapper.cache_clear = cache.clear
+    return wrapper
+
+@_bundle_cache
+def load_model_manifest(name):
+    """
+    Manifest của bundle (cột đầu vào, biến mục tiêu, bước dự báo...), không nạp booster.
+    """
+    return read_manifest(model_bundle_path(name))
+
+@_bundle_cache
+def _load_model(name):
+    model, manifest = load_model_bundle(model_bundle_path(name))
+    if _MODEL_THREADS is not None:
+        set_model_threads(model, _MODEL_THREADS)
+    return model, manifest
+
+def forecast_version(species):
+    """
+    Phiên bản (dữ liệu + mô hình) dùng cho khoá cache kết quả dự báo của loài.
+    """
+    return file_version(
+        QN_DATA_PATH,
+        MODEL_DIR / SPECIES_MODEL_FILES[species] / MANIFEST_FILE,
+        MODEL_DIR / METAL_MODEL_FILE / MANIFEST_FILE
+    )
+
+def load_species_model(species):
+    """
+    Tải (và giữ trong bộ nhớ) mô hình môi trường đã fine-tune theo loài.
+
+    Giá trị trả về
+    -------
+    tuple
+        (model, input_cols, features)
+    """
+    if species not in SPECIES_MODEL_FILES:
+        raise ValueError("species phải là 'oyster' hoặc 'cobia'")
+
+    model, manifest = _load_model(species)
+    return model, manifest["input_cols"], manifest["targets"]
+
+def load_metal_model():
+    """
+    Tải (và giữ trong bộ nhớ) mô hình kim loại.
+
+    Giá trị trả về
+    -------
+    tuple
+        (model, feature_cols)
+    """
+    model, manifest = _load_model("metal")
+    return model, manifest["input_cols"]
+
+def load_direct_model(name):
+    """
+    Tải (và giữ trong bộ nhớ) mô hình dự báo trực tiếp của loài hoặc kim loại.
+
+    Mô hình có một đầu ra cho mỗi cặp (bước h, biến), theo thứ tự
+    [biến của h = 1, biến của h = 2, ...], cùng đặc trưng đầu vào với mô hình
+    rolling (lag1, lag4 và thời gian của quý dự báo đầu tiên).
+
+    Tham số
+    ----------
+    name : {"cobia", "oyster", "metal"}
+
+    Giá trị trả về
+    -------
+    tuple
+        (model, input_cols, targets, horizons)
+    """
+    if name not in DIRECT_MODEL_FILES:
+        raise ValueError("name phải là 'cobia', 'oyster' hoặc 'metal'")
+
+    model, manifest = _load_model(name + "_direct")
+    return model, manifest["input_cols"], manifest["targets"], manifest["horizons"]
+
+@_bundle_cache
+def load_flat_model(name):
+    """
+    Mô hình dạng cây phẳng (`FlatForest`) của loài hoặc của mô hình kim loại.
+
+    Đọc từ model/output/<name>_flat.npz nếu file được xuất từ đúng bundle hiện
+    tại (theo checksum của manifest); nếu không thì xuất lại từ mô hình XGBoost
+    và lưu đè. Khi có sẵn file, không cần nạp booster XGBoost.
+
+    Tham số
+    ----------
+    name : {"cobia", "oyster", "metal"} hoặc "<tên>_direct"
+        Thêm hậu tố "_direct" để lấy mô hình dự báo trực tiếp.
+    """
+    flat_path = MODEL_DIR / f"{name}_flat.npz"
+    version = load_model_manifest(name)["checksum"]
+    try:
+        forest = FlatForest.load(flat_path)
+        if forest.source_version == version:
+            return forest
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        # File hỏng (ví dụ bản ghi dở từ phiên bản cũ): xuất lại bên dưới
+        pass
+
+    forest = FlatForest.from_model(_load_model(name)[0], source_version=version)
+    forest.save(flat_path)
+    return forest
+
+class RowPredictor:
+    """
+    Dự báo rolling từng dòng (một trạm) với bộ đệm đầu vào float32 cấp phát sẵn.
+
+    Mỗi bước chỉ ghi các giá trị lag / thời gian vào bộ đệm rồi gọi thẳng bộ
+    suy luận, không dựng DataFrame, không qua `MultiOutputRegressor` / DMatrix.
+    Kết quả giống hệt `model.predict` (sklearn cũng ép đầu vào về float32).
+
+    Bộ suy luận (chọn một):
+    - boosters: các booster XGBoost (mỗi biến mục tiêu một booster, hoặc một
+      booster nhiều đầu ra), gọi `inplace_predict` với số luồng ROW_PREDICT_THREADS.
+    - forest: `RowForest` (cây phẳng theo tầng, numpy).
+
+    Tham số
+    ----------
+    feature_cols : list
+        Thứ tự cột đầu vào của mô hình.
+    targets : list
+        Các biến mục tiêu (theo thứ tự đầu ra của mô hình); lag1 / lag4 của
+        chúng là đặc trưng đầu vào.
+    """
+
+    def __init__(self, feature_cols, targets, boosters=None, forest=None):
+        if (boosters is None) == (forest is None):
+            raise ValueError("Cần đúng một trong hai: boosters hoặc forest")
+
+        self.feature_cols = list(feature_cols)
+        self.targets = list(targets)
+        self.engine = "xgboost" if boosters is not None else "flat"
+        self._boosters = boosters
+        self._forest = forest
+
+        col_index = {c: i for i, c in enumerate(self.feature_cols)}
+        self._lag1 = np.array([col_index[f"{c}_lag1"] for c in self.targets])
+        self._lag4 = np.array([col_index[f"{c}_lag4"] for c in self.targets])
+        self._time = {
+            name: col_index[name]
+            for name in ("Quarter_Num", "year", "quarter")
+            if name in col_index
+        }
+
+        self._x = np.zeros(len(self.feature_cols), dtype=np.float32)
+        self._X = self._x[None, :]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_model(cls, model, feature_cols, targets, n_threads=ROW_PREDICT_THREADS):
+        """
+        Dùng các booster của mô hình XGBoost (bản sao, không đổi mô hình gốc),
+        giữ số cây theo early stopping như sklearn predict.
+
+        `model` là `MultiOutputRegressor` (mỗi biến một booster) hoặc một
+        `XGBRegressor` nhiều đầu ra (một booster cho mọi biến).
+        """
+        boosters = []
+        for estimator in getattr(model, "estimators_", [model]):
+            booster = estimator.get_booster().copy()
+            booster.set_param({"nthread": n_threads})
+            best_iteration = getattr(estimator, "best_iteration", None)
+            iteration_range = (0, best_iteration + 1) if best_iteration is not None else (0, 0)
+            boosters.append((booster, iteration_range))
+        return cls(feature_cols, targets, boosters=boosters)
+
+    def predict_step(self, lag1, lag4, year, quarter):
+        """
+        Dự báo một quý từ giá trị lag1 / lag4 của các biến mục tiêu.
+
+        Giá trị trả về
+        -------
+        np.ndarray (float32), shape (len(targets),)
+        """
+        with self._lock:
+            self._x[self._lag1] = lag1
+            self._x[self._lag4] = lag4
+            time_values = {"Quarter_Num": quarter, "year": year, "quarter": quarter}
+            for name, i in self._time.items():
+                self._x[i] = time_values[name]
+
+            if self._forest is not None:
+                return self._forest.predict(self._x)
+
+            y_pred = np.empty(len(self.targets), dtype=np.float32)
+            k = 0
+            for booster, iteration_range in self._boosters:
+                pred = np.ravel(booster.inplace_predict(
+                    self._X,
+                    iteration_range=iteration_range,
+                    validate_features=False
+                ))
+                y_pred[k:k + len(pred)] = pred
+                k += len(pred)
+            return y_pred
+
+    def rolling(self, history, start_year, start_quarter, n_quarters):
+        """
+        Rolling forecast: kết quả mỗi quý được đưa lại làm lịch sử cho quý sau.
+
+        Tham số
+        ----------
+        history : array-like, shape (4, len(targets))
+            4 quý gần nhất (cũ → mới).
+
+        Giá trị trả về
+        -------
+        np.ndarray (float32), shape (n_quarters, len(targets))
+            Giá trị dự báo (chưa clip).
+        """
+        history = np.array(history, dtype=float)
+        out = np.empty((n_quarters, len(self.targets)), dtype=np.float32)
+        year, quarter = start_year, start_quarter
+
+        for step in range(n_quarters):
+            out[step] = self.predict_step(history[-1], history[0], year, quarter)
+
+            # ---- cập nhật history ----
+            history[:-1] = history[1:]
+            history[-1] = out[step]
+
+            quarter += 1
+            if quarter > 4:
+                quarter = 1
+                year += 1
+
+        return out
+
+@_bundle_cache
+def load_row_predictor(name, engine="auto"):
+    """
+    `RowPredictor` (giữ trong bộ nhớ) cho mô hình của loài hoặc mô hình kim loại.
+
+    Tham số
+    ----------
+    name : {"cobia", "oyster", "metal"}
+    engine : {"auto", "xgboost", "flat"}, mặc định = "auto"
+        "auto" dùng cây phẳng theo tầng (`RowForest`, nhanh nhất cho một dòng),
+        trừ khi cây quá sâu thì dùng XGBoost.
+    """
+    if name != "metal" and name not in SPECIES_MODEL_FILES:
+        raise ValueError("name phải là 'cobia', 'oyster' hoặc 'metal'")
+
+    manifest = load_model_manifest(name)
+    feature_cols, targets = manifest["input_cols"], manifest["targets"]
+
+    if engine in ("auto", "flat"):
+        try:
+            return RowPredictor(feature_cols, targets, forest=RowForest(load_flat_model(name)))
+        except ValueError:
+            if engine == "flat":
+                raise
+    elif engine != "xgboost":
+        raise ValueError("engine phải là 'auto', 'xgboost' hoặc 'flat'")
+
+    return RowPredictor.from_model(_load_model(name)[0], feature_cols, targets)
+
 def predict_future_metal_field_for_station(
     start_year,
     start_quarter,
     n_quarters,
     x,
-    y
+    y,
+    engine="auto"
 ):
     """
     Rolling forecast nồng độ kim loại tại một trạm.
@@ -31,6 +384,8 @@ def predict_future_metal_field_for_station(
     x, y : numeric
         Tọa độ trạm, dùng để chọn trạm tương ứng trong file CSV (toạ độ VN2000)
         (các cột "X", "Y").
+    engine : {"auto", "xgboost", "flat"}, mặc định = "auto"
+        Bộ suy luận một dòng, xem `load_row_predictor`.
 
     Giá trị trả về
     -------
@@ -39,19 +394,13 @@ def predict_future_metal_field_for_station(
         "year", "quarter" và các cột kim loại dự báo (giá trị không âm).
     """
 
-    BASE_DIR = Path(__file__).resolve().parent
-    PROJECT_DIR = BASE_DIR.parent
-
-    DATA_PATH = PROJECT_DIR / "data" / "data_quang_ninh" / "qn_env_clean_ready.csv"
-    model_path = PROJECT_DIR / "model" / "output" / "metal_ts_model.pkl"
-
     # ===== PREDICT cho 1 trạm =====
-    df = pd.read_csv(DATA_PATH)
+    df = pd.read_csv(QN_DATA_PATH)
     df_station = df[(df["X"] == x) & (df["Y"] == y)]
 
-    target_cols = ["CN","As","Cd","Pb","Cu","Hg","Zn","Total_Cr"]
+    target_cols = METAL_TARGETS
 
-    model, feature_cols = joblib.load(model_path)
+    predictor = load_row_predictor("metal", engine)
 
     df_station = df_station.copy()
     df_station["Quarter"] = pd.to_datetime(df_station["Quarter"])
@@ -61,44 +410,10 @@ def predict_future_metal_field_for_station(
         df_station[c] = pd.to_numeric(df_station[c], errors="coerce")
 
     # cần ít nhất 4 quý lịch sử
-    history = df_station[target_cols].iloc[-4:].copy()
-
-    results = []
-    year, quarter = start_year, start_quarter
-
-    for _ in range(n_quarters):
-        row = {}
-
-        for c in target_cols:
-            row[f"{c}_lag1"] = float(history[c].iloc[-1])
-            row[f"{c}_lag4"] = float(history[c].iloc[0])
-
-        row["year"] = int(year)
-        row["quarter"] = int(quarter)
-
-        X_pred = pd.DataFrame([row])[feature_cols]
-
-        # 🔒 ENSURE numeric 100%
-        X_pred = X_pred.astype(float)
-
-        y_pred = model.predict(X_pred)[0]
+    history = df_station[target_cols].iloc[-4:].to_numpy(dtype=float)
 
-        result = {"year": year, "quarter": quarter}
-        result.update(dict(zip(target_cols, y_pred)))
-        results.append(result)
-
-        # update history
-        history = pd.concat(
-            [history.iloc[1:], pd.DataFrame([y_pred], columns=target_cols)],
-            ignore_index=True
-        )
-
-        quarter += 1
-        if quarter > 4:
-            quarter = 1
-            year += 1
-    
-    df_future = pd.DataFrame(results)
+    y_pred = predictor.rolling(history, start_year, start_quarter, n_quarters)
+    df_future = _future_frame(y_pred, target_cols, start_year, start_quarter)
 
     # Clip giá trị âm (ràng buộc vật lý)
     for c in target_cols:
@@ -112,7 +427,8 @@ def predict_future_non_metal_field_for_station(
     y,
     start_year,
     start_quarter,
-    n_quarters=4
+    n_quarters=4,
+    engine="auto"
 ):
     """
     Rolling forecast các biến môi trường không phải kim loại
@@ -126,7 +442,7 @@ def predict_future_non_metal_field_for_station(
 
     Hành vi chính / các cơ chế bảo vệ:
     - Tự động chọn file mô hình dựa trên tham số `species`.
-    - Tải metadata (input_cols, features) từ file "_features.pkl" đi kèm.
+    - Tải metadata (input_cols, features) từ manifest của bundle mô hình.
     - Yêu cầu tối thiểu 4 quý dữ liệu lịch sử của trạm (để tạo lag1 và lag4).
     - Ép kiểu dữ liệu lịch sử và các đặc trưng đầu vào về numeric
       (có thể phát sinh NaN nếu dữ liệu không hợp lệ).
@@ -145,6 +461,8 @@ def predict_future_non_metal_field_for_station(
         Số quý (1..4) của bước dự báo đầu tiên.
     n_quarters : int, mặc định = 4
         Số lượng quý cần dự báo.
+    engine : {"auto", "xgboost", "flat"}, mặc định = "auto"
+        Bộ suy luận một dòng, xem `load_row_predictor`.
 
     Giá trị trả về
     -------
@@ -152,22 +470,14 @@ def predict_future_non_metal_field_for_station(
         DataFrame gồm các dòng cho từng quý dự báo, chứa các cột "year", "quarter"
         và các cột biến môi trường không phải kim loại (giá trị đã được cắt ≥ 0).
     """
-    BASE_DIR = Path(__file__).resolve().parent
-    PROJECT_DIR = BASE_DIR.parent
-
-    csv_data_path = PROJECT_DIR / "data" / "data_quang_ninh" / "qn_env_clean_ready.csv"
-    if species == "cobia":
-        model_path = PROJECT_DIR / "model" / "output" / "hk_cobia_finetuned.pkl"
-    elif species == "oyster":
-        model_path = PROJECT_DIR / "model" / "output" / "hk_oyster_finetuned.pkl"
     # ===== LOAD MODEL + METADATA =====
-    model = joblib.load(model_path)
-    input_cols, features = joblib.load(
-        str(model_path).replace(".pkl", "_features.pkl")
-    )
+    if species not in SPECIES_MODEL_FILES:
+        raise ValueError("species phải là 'oyster' hoặc 'cobia'")
+    predictor = load_row_predictor(species, engine)
+    features = predictor.targets
 
     # ===== LOAD DATA =====
-    df = pd.read_csv(csv_data_path)
+    df = pd.read_csv(QN_DATA_PATH)
 
     df["Date"] = pd.to_datetime(df["Quarter"], errors="coerce")
     df = df.dropna(subset=["Date"])
@@ -184,51 +494,37 @@ def predict_future_non_metal_field_for_station(
         df_station[c] = pd.to_numeric(df_station[c], errors="coerce")
 
     # ===== LẤY LỊCH SỬ GẦN NHẤT (đủ cho lag 1 & 4) =====
-    history = df_station[features].iloc[-4:].copy()
+    history = df_station[features].iloc[-4:].to_numpy(dtype=float)
     if len(history) < 4:
         raise ValueError("❌ Không đủ dữ liệu lịch sử (cần ≥ 4 quý)")
 
-    results = []
-    year, quarter = start_year, start_quarter
-
     # ===== ROLLING FORECAST =====
-    for _ in range(n_quarters):
-        row = {}
-
-        for c in features:
-            row[f"{c}_lag1"] = float(history[c].iloc[-1])
-            row[f"{c}_lag4"] = float(history[c].iloc[0])
+    y_pred = predictor.rolling(history, start_year, start_quarter, n_quarters)
+    df_future = _future_frame(y_pred, features, start_year, start_quarter)
 
-        row["Quarter_Num"] = quarter
-
-        X_pred = pd.DataFrame([row])[input_cols].astype(float)
-
-        y_pred = model.predict(X_pred)[0]
-
-        result = {
-            "year": year,
-            "quarter": quarter
-        }
-        result.update(dict(zip(features, y_pred)))
-        results.append(result)
+    # ===== CLIP ÂM (VẬT LÝ) =====
+    for c in features:
+        df_future[c] = df_future[c].clip(lower=0)
 
-        # ---- cập nhật history ----
-        history = pd.concat(
-            [history.iloc[1:], pd.DataFrame([y_pred], columns=features)],
-            ignore_index=True
-        )
+    return df_future
 
+def _future_frame(values, targets, start_year, start_quarter):
+    """
+    DataFrame "year", "quarter" + các biến mục tiêu từ mảng (n_quarters, n_targets).
+    """
+    years, quarters = [], []
+    year, quarter = start_year, start_quarter
+    for _ in range(len(values)):
+        years.append(year)
+        quarters.append(quarter)
         quarter += 1
         if quarter > 4:
             quarter = 1
             year += 1
 
-    df_future = pd.DataFrame(results)
-
-    # ===== CLIP ÂM (VẬT LÝ) =====
-    for c in features:
-        df_future[c] = df_future[c].clip(lower=0)
-
+    df_future = pd.DataFrame({"year": years, "quarter": quarters})
+    for j, c in enumerate(targets):
+        df_future[c] = values[:, j]
     return df_future
 
 def predict_for_station(
@@ -273,14 +569,294 @@ def predict_for_station(
     )
     return df_merged
 
-#Test
-df = predict_for_station(
-    species="cobia",
-    x=2318587,
-    y=428692,
-    start_year=2026,
-    start_quarter=1,
-    n_quarters=4
-)
-print(df)
-df.info()
\ No newline at end of file
+def set_model_threads(model, n_threads):
+    """
+    Giới hạn số luồng XGBoost của mô hình (kể cả các mô hình con
+    trong `MultiOutputRegressor`), tránh tranh chấp CPU khi nhiều
+    tiến trình dự báo chạy song song.
+    """
+    for estimator in getattr(model, "estimators_", [model]):
+        estimator.set_params(n_jobs=n_threads)
+        estimator.get_booster().set_param({"nthread": n_threads})
+    return model
+
+def _station_histories(df, cols, n_lags=4):
+    """
+    Lấy `n_lags` quý quan trắc gần nhất của mỗi trạm.
+
+    Giá trị trả về
+    -------
+    keys : pd.DataFrame
+        Các cột "Station", "X", "Y" của những trạm có đủ lịch sử.
+    history : np.ndarray, shape (n_stations, n_lags, len(cols))
+        Lịch sử theo thứ tự thời gian (cũ → mới).
+    """
+    df = df.sort_values(["X", "Y", "Date"], kind="stable")
+    tail = df.groupby(["X", "Y"], sort=True).tail(n_lags)
+
+    counts = tail.groupby(["X", "Y"], sort=True)["Date"].transform("size")
+    tail = tail[counts == n_lags]
+
+    keys = tail[["Station", "X", "Y"]].iloc[::n_lags].reset_index(drop=True)
+    history = tail[cols].to_numpy(dtype=float).reshape(len(keys), n_lags, len(cols))
+    return keys, history
+
+def _fill_features(X, feature_cols, targets, history, year, quarter):
+    """
+    Ghi đặc trưng lag1 / lag4 (từ lịch sử 4 quý) và thời gian của quý dự báo vào X.
+    """
+    col_index = {c: i for i, c in enumerate(feature_cols)}
+    for j, c in enumerate(targets):
+        X[:, col_index[f"{c}_lag1"]] = history[:, -1, j]
+        X[:, col_index[f"{c}_lag4"]] = history[:, 0, j]
+
+    time_values = {"Quarter_Num": quarter, "year": year, "quarter": quarter}
+    for name, value in time_values.items():
+        if name in col_index:
+            X[:, col_index[name]] = value
+
+def _predict_batch(model, X, feature_cols):
+    """
+    `predict` cho mô hình XGBoost (qua DataFrame, đúng tên cột) hoặc `FlatForest`.
+    """
+    if isinstance(model, FlatForest):
+        return model.predict(X)
+    return np.asarray(model.predict(pd.DataFrame(X, columns=feature_cols)))
+
+def _rolling_forecast_batch(
+    model,
+    feature_cols,
+    targets,
+    history,
+    start_year,
+    start_quarter,
+    n_quarters
+):
+    """
+    Rolling forecast cho nhiều trạm cùng lúc: mỗi bước chỉ gọi
+    `model.predict` một lần cho toàn bộ trạm.
+
+    Tham số
+    ----------
+    history : np.ndarray, shape (n_stations, 4, len(targets))
+        4 quý gần nhất của từng trạm (cũ → mới).
+
+    Giá trị trả về
+    -------
+    np.ndarray, shape (n_quarters, n_stations, len(targets))
+        Giá trị dự báo (chưa clip).
+    """
+    history = np.array(history, dtype=float)
+    n_stations = history.shape[0]
+
+    X = np.empty((n_stations, len(feature_cols)), dtype=float)
+    out = np.empty((n_quarters, n_stations, len(targets)), dtype=float)
+    year, quarter = start_year, start_quarter
+
+    for step in range(n_quarters):
+        _fill_features(X, feature_cols, targets, history, year, quarter)
+        y_pred = _predict_batch(model, X, feature_cols).reshape(n_stations, len(targets))
+        out[step] = y_pred
+
+        # ---- cập nhật history ----
+        history = np.concatenate([history[:, 1:], y_pred[:, None, :]], axis=1)
+
+        quarter += 1
+        if quarter > 4:
+            quarter = 1
+            year += 1
+
+    return out
+
+def _direct_forecast_batch(
+    model,
+    feature_cols,
+    targets,
+    horizons,
+    history,
+    start_year,
+    start_quarter,
+    n_quarters
+):
+    """
+    Dự báo trực tiếp cho nhiều trạm: mọi bước h và mọi trạm trong một lần
+    `predict` (mô hình có một đầu ra cho mỗi cặp (h, biến)), không phụ thuộc
+    vào dự báo của quý trước.
+
+    Giá trị trả về
+    -------
+    np.ndarray, shape (n_quarters, n_stations, len(targets))
+        Giá trị dự báo (chưa clip).
+    """
+    horizons = list(horizons)
+    if horizons != list(range(1, len(horizons) + 1)):
+        raise ValueError(f"Mô hình trực tiếp cần các bước liên tiếp 1..H, nhận được {horizons}")
+    if n_quarters > len(horizons):
+        raise ValueError(
+            f"Mô hình trực tiếp chỉ dự báo tối đa {len(horizons)} quý (yêu cầu {n_quarters})"
+        )
+
+    history = np.array(history, dtype=float)
+    n_stations = history.shape[0]
+
+    X = np.empty((n_stations, len(feature_cols)), dtype=float)
+    _fill_features(X, feature_cols, targets, history, start_year, start_quarter)
+
+    y_pred = _predict_batch(model, X, feature_cols)
+    y_pred = y_pred.reshape(n_stations, len(horizons), len(targets))[:, :n_quarters]
+    return np.ascontiguousarray(y_pred.transpose(1, 0, 2), dtype=float)
+
+def _stack_forecast(keys, values, targets, start_year, start_quarter):
+    """
+    Trải mảng (n_quarters, n_stations, n_targets) thành DataFrame dạng dài.
+    """
+    n_quarters, n_stations, _ = values.shape
+
+    years, quarters = [], []
+    year, quarter = start_year, start_quarter
+    for _ in range(n_quarters):
+        years.append(year)
+        quarters.append(quarter)
+        quarter += 1
+        if quarter > 4:
+            quarter = 1
+            year += 1
+
+    df_out = pd.DataFrame({
+        "Station": np.tile(keys["Station"].to_numpy(), n_quarters),
+        "X": np.tile(keys["X"].to_numpy(), n_quarters),
+        "Y": np.tile(keys["Y"].to_numpy(), n_quarters),
+        "year": np.repeat(years, n_stations),
+        "quarter": np.repeat(quarters, n_stations),
+    })
+    df_values = pd.DataFrame(
+        values.reshape(n_quarters * n_stations, len(targets)).clip(min=0),
+        columns=targets
+    )
+    return pd.concat([df_out, df_values], axis=1)
+
+def predict_for_all_stations(
+    species,
+    start_year,
+    start_quarter,
+    n_quarters=4,
+    stations=None,
+    engine="auto",
+    strategy="rolling",
+    df=None
+):
+    """
+    Dự báo (môi trường + kim loại) cho toàn bộ trạm trong một lượt.
+
+    Cho kết quả giống `predict_for_station` gọi lần lượt từng trạm, nhưng
+    dữ liệu và mô hình chỉ được tải một lần và mỗi quý dự báo chỉ gọi
+    `predict` một lần cho tất cả các trạm (batch).
+
+    Tham số
+    ----------
+    species : {"oyster", "cobia"}
+        Loài sử dụng mô hình dự báo (hàu hoặc cá giò).
+    start_year : int
+        Năm của quý dự báo đầu tiên.
+    start_quarter : int
+        Số quý (1..4) của bước dự báo đầu tiên.
+    n_quarters : int, mặc định = 4
+        Số lượng quý cần dự báo.
+    stations : list-like, tùy chọn
+        Danh sách mã trạm cần dự báo (mặc định: tất cả).
+    engine : {"auto", "xgboost", "flat"}, mặc định = "auto"
+        Bộ suy luận: XGBoost hoặc cây phẳng numpy (`load_flat_model`, cho kết
+        quả giống hệt). "auto" dùng cây phẳng khi số trạm ≤ FLAT_MAX_ROWS.
+    strategy : {"rolling", "direct"}, mặc định = "rolling"
+        "rolling": dự báo lặp từng quý (quý sau dùng dự báo của quý trước).
+        "direct": mô hình dự báo trực tiếp (`load_direct_model`), mọi quý và mọi
+        trạm trong một lần predict cho mỗi mô hình; thời gian không phụ thuộc
+        số quý, tối đa bằng số bước của mô hình (8 quý).
+    df : pd.DataFrame, tùy chọn
+        Dữ liệu quan trắc đã đọc sẵn (cùng cột với QN_DATA_PATH); mặc định đọc
+        QN_DATA_PATH. Backtest truyền dữ liệu cắt tới trước quý dự báo đầu tiên.
+
+    Giá trị trả về
+    -------
+    pd.DataFrame
+        Dạng dài, mỗi dòng là một (trạm, quý) với các cột "Station", "X", "Y",
+        "year", "quarter", các biến môi trường và các cột kim loại (≥ 0).
+        Trạm không đủ 4 quý lịch sử bị bỏ qua.
+    """
+    if strategy not in ("rolling", "direct"):
+        raise ValueError("strategy phải là 'rolling' hoặc 'direct'")
+    if species not in SPECIES_MODEL_FILES:
+        raise ValueError("species phải là 'oyster' hoặc 'cobia'")
+
+    # Chỉ đọc manifest; booster XGBoost chỉ được nạp khi thực sự dùng engine "xgboost"
+    suffix = "_direct" if strategy == "direct" else ""
+    manifest = load_model_manifest(species + suffix)
+    metal_manifest = load_model_manifest("metal" + suffix)
+    input_cols, features, horizons = manifest["input_cols"], manifest["targets"], manifest["horizons"]
+    metal_feature_cols, metal_horizons = metal_manifest["input_cols"], metal_manifest["horizons"]
+
+    df = pd.read_csv(QN_DATA_PATH) if df is None else df.copy()
+    df["Date"] = pd.to_datetime(df["Quarter"], errors="coerce")
+    df = df.dropna(subset=["Date"])
+
+    if stations is not None:
+        df = df[df["Station"].isin(list(stations))]
+
+    for c in list(features) + METAL_TARGETS:
+        df[c] = pd.to_numeric(df[c], errors="coerce")
+
+    keys, history = _station_histories(df, list(features) + METAL_TARGETS)
+    if len(keys) == 0:
+        return pd.DataFrame(
+            columns=["Station", "X", "Y", "year", "quarter"] + list(features) + METAL_TARGETS
+        )
+
+    if engine == "auto":
+        engine = "flat" if len(keys) <= FLAT_MAX_ROWS else "xgboost"
+    if engine == "flat":
+        model, metal_model = load_flat_model(species + suffix), load_flat_model("metal" + suffix)
+    elif engine == "xgboost":
+        model, metal_model = _load_model(species + suffix)[0], _load_model("metal" + suffix)[0]
+    else:
+        raise ValueError("engine phải là 'auto', 'xgboost' hoặc 'flat'")
+
+    n_env = len(features)
+    if strategy == "direct":
+        env_values = _direct_forecast_batch(
+            model, input_cols, list(features), horizons, history[:, :, :n_env],
+            start_year, start_quarter, n_quarters
+        )
+        metal_values = _direct_forecast_batch(
+            metal_model, metal_feature_cols, METAL_TARGETS, metal_horizons, history[:, :, n_env:],
+            start_year, start_quarter, n_quarters
+        )
+    else:
+        env_values = _rolling_forecast_batch(
+            model, input_cols, list(features), history[:, :, :n_env],
+            start_year, start_quarter, n_quarters
+        )
+        metal_values = _rolling_forecast_batch(
+            metal_model, metal_feature_cols, METAL_TARGETS, history[:, :, n_env:],
+            start_year, start_quarter, n_quarters
+        )
+
+    return _stack_forecast(
+        keys,
+        np.concatenate([env_values, metal_values], axis=2),
+        list(features) + METAL_TARGETS,
+        start_year,
+        start_quarter
+    )
+
+if __name__ == "__main__":
+    # Chạy thử: python -m utils.forecast
+    df = predict_for_station(
+        species="cobia",
+        x=2318587,
+        y=428692,
+        start_year=2026,
+        start_quarter=1,
+        n_quarters=4
+    )
+    print(df)
+    df.info()
@@ -0,0 +1,106 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.forecast import PROJECT_DIR, QN_DATA_PATH
+
+HK_DATA_DIR = PROJECT_DIR / "data" / "water_data"
+
+# Biến chuẩn → cột gốc trong marine_water_quality_*.csv
+HK_COLUMNS = {
+    "DO": "Dissolved Oxygen (mg/L)",
+    "Temperature": "Temperature (°C)",
+    "pH": "pH",
+    "Salinity": "Salinity (psu)",
+    "NH3": "Unionised Ammonia (mg/L)",
+    "PO4": "Orthophosphate Phosphorus (mg/L)",
+    "BOD5": "5-day Biochemical Oxygen Demand (mg/L)",
+    "TSS": "Suspended Solids (mg/L)",
+    "Coliform": "Faecal Coliforms (cfu/100mL)",
+}
+
+# Tầng nước dùng khi huấn luyện mô hình từng loài (xem process_data/datahk.py)
+HK_DEPTH_BY_SPECIES = {
+    "cobia": "Middle Water",
+    "oyster": "Surface Water",
+}
+
+def parse_lod(series):
+    """
+    Giá trị dạng "<x" (dưới ngưỡng phát hiện) → x / 2; "N/A" → NaN.
+    """
+    s = series.astype(str).str.strip()
+    below = s.str.startswith("<")
+    values = pd.to_numeric(s.str.lstrip("<"), errors="coerce")
+    return values.where(~below, values / 2)
+
+def load_hk_history(data_dir=HK_DATA_DIR):
+    """
+    Đọc toàn bộ dữ liệu quan trắc gốc của Hồng Kông (theo mẫu, mọi tầng nước).
+
+    Returns
+    -------
+    DataFrame với schema:
+    Station, Date, Depth, DO, Temperature, pH, Salinity, NH3, PO4, BOD5, TSS, Coliform
+    (sắp xếp theo Station, Depth, Date)
+    """
+    files = sorted(glob.glob(os.path.join(str(data_dir), "marine_water_quality_*.csv")))
+    if not files:
+        raise RuntimeError("❌ Không load được file HK nào")
+
+    usecols = ["Station", "Dates", "Depth"] + list(HK_COLUMNS.values())
+    dfs = []
+
+    for f in files:
+        df = pd.read_csv(f, usecols=usecols, dtype=str)
+        out = pd.DataFrame({
+            "Station": df["Station"],
+            "Date": pd.to_datetime(df["Dates"], errors="coerce"),
+            "Depth": df["Depth"],
+        })
+        for std_col, hk_col in HK_COLUMNS.items():
+            out[std_col] = parse_lod(df[hk_col])
+        dfs.append(out)
+
+    df = pd.concat(dfs, ignore_index=True).dropna(subset=["Date"])
+    return df.sort_values(["Station", "Depth", "Date"], kind="stable").reset_index(drop=True)
+
+def load_qn_history(csv_path=QN_DATA_PATH):
+    """
+    Chuỗi quan trắc theo quý của các trạm Quảng Ninh (2021-2024).
+
+    Returns
+    -------
+    DataFrame (cột "Date" là ngày đầu quý)
+    """
+    df = pd.read_csv(csv_path)
+    df["Date"] = pd.to_datetime(df["Quarter"], errors="coerce")
+    df = df.dropna(subset=["Date"])
+    return df.sort_values(["Station", "Date"], kind="stable").reset_index(drop=True)
+
+def station_series(df, station, variable, depth=None):
+    """
+    Chuỗi thời gian (Date, giá trị) của một biến tại một trạm, bỏ NaN.
+    """
+    mask = df["Station"] == station
+    if depth is not None:
+        mask &= df["Depth"] == depth
+
+    series = df.loc[mask, ["Date", variable]]
+    series = series.assign(**{variable: pd.to_numeric(series[variable], errors="coerce")})
+    series = series.dropna().sort_values("Date", kind="stable")
+    return series["Date"].reset_index(drop=True), series[variable].reset_index(drop=True)
+
+def quarter_start(year, quarter):
+    """
+    Ngày đầu quý (để nối chuỗi dự báo theo quý với chuỗi lịch sử).
+    """
+    year = np.asarray(year, dtype=int)
+    quarter = np.asarray(quarter, dtype=int)
+    return pd.to_datetime(pd.DataFrame({
+        "year": year,
+        "month": 3 * (quarter - 1) + 1,
+        "day": 1,
+    }))
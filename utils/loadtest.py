@@ -0,0 +1,401 @@
+"""
+Kiểm thử tải (load test) dashboard không cần trình duyệt.
+
+Khởi động một server Streamlit thật (headless, cổng cục bộ) chạy
+interface/main.py, rồi giả lập N người dùng đồng thời: mỗi người dùng là
+một kết nối websocket nói đúng giao thức của trình duyệt (BackMsg /
+ForwardMsg protobuf), phát lại một chuỗi thao tác ngẫu nhiên nhưng thực
+tế: đổi loài, đổi quý / năm trên bản đồ, chọn trạm, đổi thông số biểu
+đồ, bật trình chiếu theo quý.
+
+    python -m utils.loadtest --users 5 20 50 --steps 8
+
+(`AppTest` của Streamlit không dùng được cho nhiều phiên đồng thời: mỗi
+lượt chạy ghi đè runtime toàn cục.)
+
+Kết quả: độ trễ mỗi lượt chạy lại (gửi thao tác → script chạy xong,
+p50 / p95 / p99), số lỗi và bộ nhớ đỉnh của server (tiến trình chính +
+các worker dự báo). Dùng `--max-p95` để chặn deploy: lệnh trả về mã lỗi
+1 nếu p95 vượt ngưỡng hoặc có lỗi. Chỉ cần máy cục bộ, không cần mạng.
+
+Cần thêm psutil và websockets ≥ 13 (client asyncio), có trong requirements.txt.
+"""
+import argparse
+import asyncio
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+from utils.forecast import PROJECT_DIR
+
+APP_PATH = PROJECT_DIR / "interface" / "main.py"
+
+# Thao tác và tỉ trọng (người dùng chủ yếu đổi quý / trạm)
+ACTIONS = {
+    "species": 1,
+    "map_quarter": 3,
+    "map_year": 1,
+    "station": 3,
+    "params": 2,
+    "animate": 1,
+}
+
+_WIDGET_TYPES = ("selectbox", "multiselect", "checkbox", "number_input")
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class AppServer:
+    """
+    Server Streamlit chạy app trong tiến trình con (dùng với `with`).
+    """
+
+    def __init__(self, app_path=APP_PATH, port=None, startup_timeout=120):
+        self.app_path = app_path
+        self.port = port or _free_port()
+        self.startup_timeout = startup_timeout
+        self.process = None
+
+    @property
+    def url(self):
+        return f"ws://127.0.0.1:{self.port}/_stcore/stream"
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [
+                sys.executable, "-m", "streamlit", "run", str(self.app_path),
+                "--server.headless", "true",
+                "--server.address", "127.0.0.1",
+                "--server.port", str(self.port),
+                "--server.fileWatcherType", "none",
+                "--server.enableXsrfProtection", "false",
+                "--browser.gatherUsageStats", "false",
+                "--logger.level", "error",
+            ],
+            cwd=str(PROJECT_DIR),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+        deadline = time.monotonic() + self.startup_timeout
+        health = f"http://127.0.0.1:{self.port}/_stcore/health"
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("❌ Server Streamlit dừng khi khởi động")
+            try:
+                with urllib.request.urlopen(health, timeout=1) as r:
+                    if r.status == 200:
+                        return self
+            except OSError:
+                time.sleep(0.2)
+
+        self.__exit__()
+        raise RuntimeError("❌ Server Streamlit không khởi động kịp")
+
+    def __exit__(self, *exc):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+class MemorySampler:
+    """
+    Lấy mẫu RSS (MB) của một tiến trình và các tiến trình con theo chu kỳ.
+    """
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="memory-sampler", daemon=True)
+
+    def sample(self):
+        import psutil
+
+        try:
+            proc = psutil.Process(self.pid)
+            procs = [proc] + proc.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return 0.0
+
+        total = 0
+        for p in procs:
+            try:
+                total += p.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        return total / 2**20
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, self.sample())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+class Session:
+    """
+    Một phiên trình duyệt giả lập.
+
+    Giữ các widget của lượt chạy gần nhất và giá trị người dùng đã đặt,
+    gửi lại toàn bộ giá trị đó ở mỗi lượt chạy như frontend thật.
+    """
+
+    def __init__(self, url, timeout=300):
+        self.url = url
+        self.timeout = timeout
+        self.widgets = {}  # id -> (loại, proto)
+        self.states = {}   # id -> WidgetState
+        self._ws = None
+
+    async def connect(self):
+        from websockets.asyncio.client import connect
+
+        self._ws = await connect(self.url, subprotocols=["streamlit"], max_size=None)
+
+    async def close(self):
+        if self._ws is not None:
+            await self._ws.close()
+
+    async def rerun(self):
+        """
+        Gửi yêu cầu chạy lại và chờ script chạy xong.
+
+        Returns
+        -------
+        seconds : float
+        error : str | None
+            Thông điệp exception / st.error đầu tiên (nếu có).
+        """
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.widget_states.widgets.extend(
+            ws for wid, ws in self.states.items() if wid in self.widgets
+        )
+
+        t0 = time.perf_counter()
+        await self._ws.send(msg.SerializeToString())
+
+        widgets = {}
+        error = None
+        while True:
+            data = await asyncio.wait_for(self._ws.recv(), timeout=self.timeout)
+            fmsg = ForwardMsg()
+            fmsg.ParseFromString(data)
+            kind = fmsg.WhichOneof("type")
+
+            if kind == "delta" and fmsg.delta.WhichOneof("type") == "new_element":
+                element = fmsg.delta.new_element
+                etype = element.WhichOneof("type")
+                if etype in _WIDGET_TYPES:
+                    proto = getattr(element, etype)
+                    widgets[proto.id] = (etype, proto)
+                elif etype == "exception" and error is None:
+                    error = element.exception.message
+                elif etype == "alert" and element.alert.format == element.alert.ERROR and error is None:
+                    error = element.alert.body
+            elif kind == "script_finished":
+                if fmsg.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                break
+
+        seconds = time.perf_counter() - t0
+        self.widgets = widgets
+        return seconds, error
+
+    def find(self, etype, label=None, key=None):
+        for wid, (t, proto) in self.widgets.items():
+            if t != etype:
+                continue
+            if (label is not None and proto.label == label) or (key is not None and wid.endswith(f"-{key}")):
+                return wid, proto
+        return None, None
+
+    def set_state(self, wid, **value):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        ws = WidgetState(id=wid)
+        for field, v in value.items():
+            if field == "string_array_value":
+                ws.string_array_value.data[:] = v
+            else:
+                setattr(ws, field, v)
+        self.states[wid] = ws
+
+def apply_action(session, action, rng):
+    """
+    Đặt giá trị widget cho một thao tác (chưa gửi lên server).
+
+    Returns
+    -------
+    bool
+        False nếu widget tương ứng không có trên trang.
+    """
+    if action == "species":
+        wid, proto = session.find("selectbox", label="Loài")
+        if wid is None:
+            return False
+        session.set_state(wid, string_value=rng.choice(list(proto.options)))
+    elif action == "map_quarter":
+        wid, proto = session.find("selectbox", key="map_quarter")
+        if wid is None:
+            return False
+        session.set_state(wid, string_value=rng.choice(list(proto.options)))
+    elif action == "map_year":
+        wid, proto = session.find("number_input", key="map_year")
+        if wid is None:
+            return False
+        session.set_state(wid, double_value=float(rng.randint(int(proto.min), int(proto.max))))
+    elif action == "station":
+        wid, proto = session.find("selectbox", key="station_selector")
+        if wid is None:
+            return False
+        session.set_state(wid, string_value=rng.choice(list(proto.options)))
+    elif action == "params":
+        wid, proto = session.find("multiselect", label="Chọn các thông số để hiển thị:")
+        if wid is None or not proto.options:
+            return False
+        options = list(proto.options)
+        session.set_state(wid, string_array_value=rng.sample(options, rng.randint(1, len(options))))
+    elif action == "animate":
+        wid, proto = session.find("checkbox", label="Trình chiếu theo quý")
+        if wid is None:
+            return False
+        current = session.states[wid].bool_value if wid in session.states else proto.default
+        session.set_state(wid, bool_value=not current)
+    return True
+
+async def simulate_user(url, user_id, n_steps, seed=0, think_time=0.5):
+    """
+    Một người dùng giả lập: mở trang rồi thực hiện `n_steps` thao tác.
+
+    Returns
+    -------
+    list of dict
+        Mỗi lượt chạy: user, step, action, seconds, error.
+    """
+    rng = random.Random(seed * 10007 + user_id)
+    actions, weights = zip(*ACTIONS.items())
+    results = []
+
+    session = Session(url)
+    # Người dùng không vào trang cùng một lúc
+    await asyncio.sleep(rng.uniform(0, think_time))
+    await session.connect()
+    try:
+        async def _run(step, action):
+            try:
+                seconds, error = await session.rerun()
+            except Exception as e:  # timeout, mất kết nối
+                seconds, error = float("nan"), f"{type(e).__name__}: {e}"
+            results.append({
+                "user": user_id,
+                "step": step,
+                "action": action,
+                "seconds": seconds,
+                "error": error,
+            })
+
+        await _run(0, "open")
+        for step in range(1, n_steps + 1):
+            await asyncio.sleep(rng.uniform(0, 2 * think_time))
+            action = rng.choices(actions, weights)[0]
+            if apply_action(session, action, rng):
+                await _run(step, action)
+    finally:
+        await session.close()
+
+    return results
+
+def run_load_test(server, n_users, n_steps=8, seed=0, think_time=0.5):
+    """
+    Chạy `n_users` người dùng đồng thời trên `server` (AppServer đang chạy).
+
+    Returns
+    -------
+    dict
+        users, reruns, errors, first_error, p50/p95/p99/max (giây), wall (giây), peak_mem_mb
+    """
+    async def _all():
+        return await asyncio.gather(*[
+            simulate_user(server.url, u, n_steps, seed, think_time) for u in range(n_users)
+        ])
+
+    with MemorySampler(server.process.pid) as memory:
+        t0 = time.perf_counter()
+        results = [r for user_results in asyncio.run(_all()) for r in user_results]
+        wall = time.perf_counter() - t0
+
+    seconds = np.array([r["seconds"] for r in results if not np.isnan(r["seconds"])])
+    errors = [r for r in results if r["error"]]
+    return {
+        "users": n_users,
+        "reruns": len(results),
+        "errors": len(errors),
+        "first_error": errors[0]["error"] if errors else None,
+        "p50": float(np.percentile(seconds, 50)) if len(seconds) else float("nan"),
+        "p95": float(np.percentile(seconds, 95)) if len(seconds) else float("nan"),
+        "p99": float(np.percentile(seconds, 99)) if len(seconds) else float("nan"),
+        "max": float(seconds.max()) if len(seconds) else float("nan"),
+        "wall": wall,
+        "peak_mem_mb": memory.peak_mb,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test dashboard (server Streamlit cục bộ + client websocket)")
+    parser.add_argument("--users", type=int, nargs="+", default=[5, 20, 50])
+    parser.add_argument("--steps", type=int, default=8, help="Số thao tác của mỗi người dùng")
+    parser.add_argument("--think", type=float, default=0.5, help="Thời gian nghỉ trung bình giữa hai thao tác (giây)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-p95", type=float, default=None, help="Ngưỡng p95 (giây) để chặn deploy")
+    args = parser.parse_args(argv)
+
+    failed = False
+    with AppServer() as server:
+        # Lượt mở trang đầu tiên (nạp mô hình, warm-up) đo riêng, giống bước deploy
+        t0 = time.perf_counter()
+        warm = run_load_test(server, 1, n_steps=0)
+        print(f"🔥 Khởi động nguội: {time.perf_counter() - t0:.1f}s")
+        if warm["first_error"]:
+            print(f"   ❌ {warm['first_error']}")
+
+        print(f"{'users':>5} {'reruns':>6} {'errors':>6} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7} {'wall':>7} {'peak mem':>9}")
+        for n_users in args.users:
+            r = run_load_test(server, n_users, args.steps, args.seed, args.think)
+            print(
+                f"{r['users']:>5} {r['reruns']:>6} {r['errors']:>6} "
+                f"{r['p50']:>6.2f}s {r['p95']:>6.2f}s {r['p99']:>6.2f}s {r['max']:>6.2f}s "
+                f"{r['wall']:>6.1f}s {r['peak_mem_mb']:>6.0f} MB"
+            )
+            if r["first_error"]:
+                print(f"   ❌ {r['first_error']}")
+            if r["errors"] or (args.max_p95 is not None and r["p95"] > args.max_p95):
+                failed = True
+
+    if failed:
+        print("❌ Load test không đạt")
+        sys.exit(1)
+    print("✅ Load test đạt")
+
+if __name__ == "__main__":
+    main()
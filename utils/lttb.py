@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+# Số điểm tối đa gửi xuống một biểu đồ (~ độ rộng biểu đồ tính theo pixel)
+DEFAULT_MAX_POINTS = 800
+
+def _as_float(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").astype(np.int64).astype(float)
+    return x.astype(float)
+
+def lttb_indices(x, y, n_out):
+    """
+    Chỉ số các điểm được giữ lại theo thuật toán
+    Largest-Triangle-Three-Buckets (Steinarsson, 2013).
+
+    Điểm đầu và cuối luôn được giữ; mỗi bucket ở giữa giữ lại điểm tạo
+    tam giác có diện tích lớn nhất với điểm đã chọn ở bucket trước và
+    trung bình của bucket sau, nên hình dạng (đỉnh, đáy) của chuỗi được
+    bảo toàn tốt hơn lấy mẫu đều.
+
+    Parameters
+    ----------
+    x, y : array-like
+        Chuỗi đã sắp xếp theo x, không chứa NaN (x có thể là datetime).
+    n_out : int
+        Số điểm mong muốn.
+
+    Returns
+    -------
+    np.ndarray (chỉ số tăng dần)
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = _as_float(x)
+    y = np.asarray(y, dtype=float)
+
+    every = (n - 2) / (n_out - 2)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0] = 0
+    a = 0
+
+    for i in range(n_out - 2):
+        start = int(np.floor(i * every)) + 1
+        end = int(np.floor((i + 1) * every)) + 1
+        next_start = end
+        next_end = min(int(np.floor((i + 2) * every)) + 1, n)
+
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        areas = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(areas))
+        indices[i + 1] = a
+
+    indices[-1] = n - 1
+    return indices
+
+def downsample(x, y, n_out=DEFAULT_MAX_POINTS):
+    """
+    Rút gọn chuỗi (x, y) còn tối đa `n_out` điểm bằng LTTB.
+
+    Giữ nguyên kiểu dữ liệu đầu vào (Series / ndarray).
+    """
+    idx = lttb_indices(x, y, n_out)
+    if isinstance(x, pd.Series):
+        x = x.iloc[idx]
+    else:
+        x = np.asarray(x)[idx]
+    if isinstance(y, pd.Series):
+        y = y.iloc[idx]
+    else:
+        y = np.asarray(y)[idx]
+    return x, y
@@ -0,0 +1,312 @@
+"""
+Định dạng lưu mô hình (bundle) dùng chung cho HÀU, CÁ GIÒ và KIM LOẠI.
+
+Một bundle là một thư mục:
+
+    <tên mô hình>/
+        manifest.json        cột đầu vào, biến mục tiêu, lag, bước dự báo (mô hình
+                             trực tiếp), hash dữ liệu huấn luyện, chỉ số đánh giá,
+                             tham số và SHA-256 của từng booster + của manifest
+        booster_00.ubj ...   booster ở định dạng gốc của XGBoost (UBJSON)
+
+Thay cho pickle của wrapper sklearn (kèm file _features.pkl): định dạng gốc của
+XGBoost đọc được qua các phiên bản XGBoost / scikit-learn, không chạy code khi
+nạp, và nạp nhanh hơn unpickle (các booster được đọc song song).
+
+    python -m utils.model_bundle      # chuyển các mô hình .pkl cũ sang bundle
+"""
+import hashlib
+import json
+import math
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+BUNDLE_FORMAT = "hsi-model-bundle"
+BUNDLE_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+
+def bundle_path(path):
+    """
+    Thư mục bundle của một đường dẫn mô hình ("x.pkl" cũ → "x").
+    """
+    path = Path(path)
+    return path.with_suffix("") if path.suffix == ".pkl" else path
+
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _manifest_checksum(manifest):
+    body = {k: v for k, v in manifest.items() if k != "checksum"}
+    return hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _json_params(estimator):
+    """
+    Tham số sklearn của XGBRegressor ghi được ra JSON (bỏ None / NaN / đối tượng).
+    """
+    params = {}
+    for key, value in estimator.get_params().items():
+        if isinstance(value, float) and math.isnan(value):
+            continue
+        if isinstance(value, (str, bool, int, float)):
+            params[key] = value
+    return params
+
+def _to_json(value):
+    if isinstance(value, dict):
+        return {str(k): _to_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_to_json(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def save_model_bundle(
+    path,
+    model,
+    input_cols,
+    targets,
+    horizons=None,
+    lags=(1, 4),
+    data_path=None,
+    metrics=None,
+    extra=None
+):
+    """
+    Lưu mô hình (MultiOutputRegressor của XGBRegressor, hoặc một XGBRegressor
+    nhiều đầu ra) thành bundle. Ghi vào thư mục tạm rồi đổi tên, nên bundle cũ
+    vẫn nguyên vẹn nếu quá trình lưu bị ngắt.
+
+    Tham số
+    ----------
+    path : str | Path
+        Thư mục bundle (đường dẫn ".pkl" cũ được đổi thành thư mục cùng tên).
+    input_cols : list
+        Cột đặc trưng đầu vào, đúng thứ tự.
+    targets : list
+        Biến mục tiêu; mô hình trực tiếp có một đầu ra cho mỗi cặp (h, biến),
+        thứ tự [biến của h = 1, biến của h = 2, ...].
+    horizons : list, optional
+        Các bước dự báo của mô hình trực tiếp (None = mô hình rolling).
+    data_path : str | Path, optional
+        File dữ liệu huấn luyện (ghi tên + SHA-256 vào manifest).
+    metrics : dict, optional
+        Chỉ số đánh giá (RMSE train / kiểm định...).
+    extra : dict, optional
+        Thông tin thêm ghi vào manifest (ví dụ mô hình gốc của bản fine-tune).
+
+    Giá trị trả về
+    -------
+    Path
+        Thư mục bundle.
+    """
+    import xgboost as xgb
+
+    path = bundle_path(path)
+    estimators = list(getattr(model, "estimators_", [model]))
+    kind = "multi_output" if hasattr(model, "estimators_") else "native"
+
+    if horizons is None:
+        output_cols = list(targets)
+    else:
+        output_cols = [f"{c}_h{h}" for h in horizons for c in targets]
+
+    tmp = path.with_name(f"{path.name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    old = path.with_name(f"{path.name}.old-{os.getpid()}")
+    try:
+        boosters = []
+        for i, estimator in enumerate(estimators):
+            file_name = f"booster_{i:02d}.ubj"
+            estimator.save_model(tmp / file_name)
+            boosters.append({
+                "file": file_name,
+                "outputs": output_cols[i:i + 1] if kind == "multi_output" else output_cols,
+                "n_trees": estimator.get_booster().num_boosted_rounds(),
+                "params": _json_params(estimator),
+                "sha256": file_sha256(tmp / file_name),
+            })
+
+        manifest = {
+            "format": BUNDLE_FORMAT,
+            "format_version": BUNDLE_VERSION,
+            "name": path.name,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "xgboost_version": xgb.__version__,
+            "kind": kind,
+            "input_cols": list(input_cols),
+            "targets": list(targets),
+            "horizons": None if horizons is None else [int(h) for h in horizons],
+            "output_cols": output_cols,
+            "lags": [int(l) for l in lags],
+            "data": None if data_path is None else {
+                "file": Path(data_path).name,
+                "sha256": file_sha256(data_path),
+            },
+            "metrics": _to_json(metrics or {}),
+            "boosters": boosters,
+        }
+        manifest.update(_to_json(extra or {}))
+        manifest["checksum"] = _manifest_checksum(manifest)
+
+        with open(tmp / MANIFEST_FILE, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        # Đổi bundle cũ sang tên tạm, đưa bundle mới vào chỗ, rồi mới xoá bản cũ
+        if path.exists():
+            os.replace(path, old)
+        os.replace(tmp, path)
+    except BaseException:
+        # Lưu hỏng giữa chừng: xoá thư mục tạm, trả bundle cũ về chỗ nếu đã bị dời đi
+        shutil.rmtree(tmp, ignore_errors=True)
+        if old.exists() and not path.exists():
+            os.replace(old, path)
+        raise
+    shutil.rmtree(old, ignore_errors=True)
+    return path
+
+def read_manifest(path):
+    """
+    Đọc manifest.json của bundle (không nạp booster).
+    """
+    with open(bundle_path(path) / MANIFEST_FILE, encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"{path} không phải bundle mô hình")
+    if manifest.get("format_version", 0) > BUNDLE_VERSION:
+        raise ValueError(
+            f"Bundle {path} có phiên bản {manifest['format_version']}, "
+            f"mã hiện tại chỉ đọc được tới {BUNDLE_VERSION}"
+        )
+    return manifest
+
+def load_model_bundle(path, verify=True, n_threads=None):
+    """
+    Nạp bundle thành mô hình sklearn như lúc huấn luyện (MultiOutputRegressor
+    của XGBRegressor, hoặc một XGBRegressor nhiều đầu ra).
+
+    Tham số
+    ----------
+    verify : bool
+        Kiểm tra checksum của manifest và của từng booster (ValueError nếu sai).
+    n_threads : int, optional
+        Số luồng đọc booster song song (mặc định: số lõi).
+
+    Giá trị trả về
+    -------
+    tuple
+        (model, manifest)
+    """
+    # XGBoost / sklearn chỉ được import khi thật sự nạp booster: đường dự báo
+    # chỉ dùng manifest + cây phẳng (numpy) không phải trả chi phí import
+    import xgboost as xgb
+    from sklearn.multioutput import MultiOutputRegressor
+
+    path = bundle_path(path)
+    manifest = read_manifest(path)
+    boosters = manifest["boosters"]
+
+    if verify and _manifest_checksum(manifest) != manifest.get("checksum"):
+        raise ValueError(f"Checksum manifest của {path} không khớp")
+
+    def _load(entry):
+        file_path = path / entry["file"]
+        if verify and file_sha256(file_path) != entry["sha256"]:
+            raise ValueError(f"Checksum của {file_path} không khớp")
+        estimator = xgb.XGBRegressor(**entry["params"])
+        estimator.load_model(file_path)
+        return estimator
+
+    # XGBoost nhả GIL khi đọc booster nên các booster được đọc song song
+    n_threads = max(1, min(n_threads or os.cpu_count() or 1, len(boosters)))
+    if n_threads > 1:
+        with ThreadPoolExecutor(max_workers=n_threads) as pool:
+            estimators = list(pool.map(_load, boosters))
+    else:
+        estimators = [_load(entry) for entry in boosters]
+
+    if manifest["kind"] == "native":
+        return estimators[0], manifest
+
+    model = MultiOutputRegressor(xgb.XGBRegressor(**boosters[0]["params"]))
+    model.estimators_ = estimators
+    model.n_features_in_ = len(manifest["input_cols"])
+    model.feature_names_in_ = np.asarray(manifest["input_cols"], dtype=object)
+    return model, manifest
+
+def load_legacy_model(pkl_path, default_targets=None):
+    """
+    Đọc mô hình pickle cũ: "<tên>.pkl" + "<tên>_features.pkl" (HÀU / CÁ GIÒ),
+    hoặc tuple (model, feature_cols[, horizons]) của mô hình kim loại.
+
+    Giá trị trả về
+    -------
+    tuple
+        (model, input_cols, targets, horizons)
+    """
+    import joblib
+
+    pkl_path = str(pkl_path)
+    saved = joblib.load(pkl_path)
+    if isinstance(saved, tuple):
+        model, input_cols = saved[:2]
+        horizons = saved[2] if len(saved) > 2 else None
+        if default_targets is None:
+            raise ValueError(f"{pkl_path} không lưu danh sách biến mục tiêu")
+        return model, input_cols, list(default_targets), horizons
+
+    meta = joblib.load(pkl_path.replace(".pkl", "_features.pkl"))
+    horizons = meta[2] if len(meta) > 2 else None
+    return saved, meta[0], meta[1], horizons
+
+def convert_legacy_model(pkl_path, default_targets=None):
+    """
+    Chuyển mô hình pickle cũ sang bundle cạnh nó (cùng tên, bỏ ".pkl").
+    """
+    model, input_cols, targets, horizons = load_legacy_model(pkl_path, default_targets)
+    return save_model_bundle(
+        pkl_path, model, input_cols, targets, horizons=horizons,
+        extra={"converted_from": Path(pkl_path).name}
+    )
+
+def main():
+    from utils.forecast import METAL_TARGETS, MODEL_DIR
+
+    legacy = [
+        p for p in sorted(MODEL_DIR.glob("*.pkl"))
+        if not p.stem.endswith("_features") and p.stem != "warmup_snapshot"
+    ]
+    if not legacy:
+        print("Không có mô hình .pkl nào cần chuyển đổi")
+        return
+
+    for pkl_path in legacy:
+        default_targets = METAL_TARGETS if pkl_path.stem.startswith("metal") else None
+        path = convert_legacy_model(pkl_path, default_targets)
+
+        t0 = time.perf_counter()
+        load_legacy_model(pkl_path, default_targets)
+        t_pickle = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        load_model_bundle(path)
+        t_bundle = time.perf_counter() - t0
+
+        print(
+            f"✅ {pkl_path.name} → {path.name}/ | nạp pickle {t_pickle * 1000:.0f} ms, "
+            f"bundle {t_bundle * 1000:.0f} ms"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -66,6 +66,88 @@ def compute_local_R_for_station_quarter(
 
     return exceed["bin_center"].min()
 
+def _local_R_for_quarter(g, max_dist_km, bin_km):
+    """
+    Bán kính R cho mọi trạm của 1 (year, quarter) bằng ma trận khoảng cách.
+
+    Cùng quy tắc với `compute_local_R_for_station_quarter` (gom theo khoảng
+    (a, b] của `pd.cut`, ngưỡng 0.2 * std(hsi)) nhưng tính cho tất cả trạm
+    một lần thay vì lặp từng cặp trạm.
+
+    Returns
+    -------
+    np.ndarray (R_km của từng dòng trong g)
+    """
+    station = g["station"].to_numpy()
+    x = g["x"].to_numpy(dtype=float)
+    y = g["y"].to_numpy(dtype=float)
+    hsi = g["hsi"].to_numpy(dtype=float)
+
+    dist = distance_vn2000_km(x[:, None], y[:, None], x[None, :], y[None, :])
+    dhsi = np.abs(hsi[:, None] - hsi[None, :])
+
+    # Cặp hợp lệ: khác trạm và nằm trong phạm vi khảo sát
+    pair = (station[:, None] != station[None, :]) & (dist <= max_dist_km)
+    has_pairs = pair.any(axis=1)
+
+    bins = np.arange(0, max_dist_km + bin_km, bin_km)
+    n_bins = len(bins) - 1
+    bin_idx = np.searchsorted(bins, dist, side="left") - 1
+    in_bin = pair & (bin_idx >= 0) & (bin_idx < n_bins) & ~np.isnan(dhsi)
+
+    n = len(g)
+    flat = (np.arange(n)[:, None] * n_bins + bin_idx)[in_bin]
+    sums = np.bincount(flat, weights=dhsi[in_bin], minlength=n * n_bins)
+    counts = np.bincount(flat, minlength=n * n_bins)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_dhsi = (sums / counts).reshape(n, n_bins)
+
+    delta_hsi_threshold = 0.2 * g["hsi"].std()
+    exceed = mean_dhsi >= delta_hsi_threshold
+
+    bin_center = 0.5 * (bins[:-1] + bins[1:])
+    R = np.where(exceed.any(axis=1), bin_center[exceed.argmax(axis=1)], max_dist_km)
+
+    return np.where(has_pairs, R, np.nan)
+
+def compute_R_from_hsi(df_hsi, max_dist_km=50, bin_km=1.0):
+    """
+    Tính bán kính R cho tất cả trạm, tất cả quý từ một bảng HSI.
+
+    Input:
+        df_hsi: DataFrame có các cột station, x, y, year, quarter, hsi
+
+    Output:
+        DataFrame: station, x, y, year, quarter, R_km
+    """
+    required = {"station", "x", "y", "year", "quarter", "hsi"}
+    if not required.issubset(df_hsi.columns):
+        raise ValueError(f"File HSI phải có các cột: {required}")
+
+    results = []
+
+    for (year, quarter), g in df_hsi.groupby(["year", "quarter"]):
+        g = g.reset_index(drop=True)
+        R = _local_R_for_quarter(g, max_dist_km=max_dist_km, bin_km=bin_km)
+
+        # Mỗi trạm lấy dòng đầu tiên (giống cách làm theo từng trạm)
+        first = ~g["station"].duplicated()
+
+        results.append(pd.DataFrame({
+            "station": g["station"][first].to_numpy(),
+            "x": g["x"][first].to_numpy(),
+            "y": g["y"][first].to_numpy(),
+            "year": int(year),
+            "quarter": int(quarter),
+            "R_km": R[first.to_numpy()]
+        }))
+
+    if not results:
+        return pd.DataFrame(columns=["station", "x", "y", "year", "quarter", "R_km"])
+
+    return pd.concat(results, ignore_index=True)
+
 def compute_R_for_all_stations_all_quarters(
     hsi_csv_path,
     max_dist_km=50,
@@ -78,52 +160,25 @@ def compute_R_for_all_stations_all_quarters(
     Output:
         DataFrame: station, x, y, year, quarter, R_km
     """
-
     df = pd.read_csv(hsi_csv_path)
 
-    required = {"station", "x", "y", "year", "quarter", "hsi"}
-    if not required.issubset(df.columns):
-        raise ValueError(f"File HSI phải có các cột: {required}")
+    return compute_R_from_hsi(df, max_dist_km=max_dist_km, bin_km=bin_km)
 
-    results = []
+if __name__ == "__main__":
+    # Sinh lại R_oyster.csv / R_cobia.csv: python -m utils.r_hsi
+    BASE_DIR = pathlib.Path(__file__).resolve().parent
+    PROJECT_DIR = BASE_DIR.parent
+    DATA_PATH = PROJECT_DIR / "data" / "data_quang_ninh" / "toa_do_qn.csv"
+    OUT_DIR = PROJECT_DIR / "data" / "data_quang_ninh"
 
-    for (year, quarter), g in df.groupby(["year", "quarter"]):
-        g = g.reset_index(drop=True)
+    # Cho hàu
+    df_R_oyster = compute_R_for_all_stations_all_quarters(
+        hsi_csv_path=OUT_DIR / "hsi_oyster.csv",
+    )
+    df_R_oyster.to_csv(OUT_DIR / "R_oyster.csv", index=False)
 
-        for station in g["station"].unique():
-            R = compute_local_R_for_station_quarter(
-                df_quarter=g,
-                station_id=station,
-                max_dist_km=max_dist_km,
-                bin_km=bin_km
-            )
-
-            row = g[g["station"] == station].iloc[0]
-
-            results.append({
-                "station": station,
-                "x": row.x,
-                "y": row.y,
-                "year": int(year),
-                "quarter": int(quarter),
-                "R_km": R
-            })
-
-    return pd.DataFrame(results)
-
-BASE_DIR = pathlib.Path(__file__).resolve().parent
-PROJECT_DIR = BASE_DIR.parent
-DATA_PATH = PROJECT_DIR / "data" / "data_quang_ninh" / "toa_do_qn.csv"
-OUT_DIR = PROJECT_DIR / "data" / "data_quang_ninh"
-
-# Cho hàu
-df_R_oyster = compute_R_for_all_stations_all_quarters(
-    hsi_csv_path=OUT_DIR / "hsi_oyster.csv",
-)
-df_R_oyster.to_csv(OUT_DIR / "R_oyster.csv", index=False)
-
-# Cho cá giò
-df_R_cobia = compute_R_for_all_stations_all_quarters(
-    hsi_csv_path=OUT_DIR / "hsi_cobia.csv",
-)
-df_R_cobia.to_csv(OUT_DIR / "R_cobia.csv", index=False)
+    # Cho cá giò
+    df_R_cobia = compute_R_for_all_stations_all_quarters(
+        hsi_csv_path=OUT_DIR / "hsi_cobia.csv",
+    )
+    df_R_cobia.to_csv(OUT_DIR / "R_cobia.csv", index=False)
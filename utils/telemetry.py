@@ -0,0 +1,199 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# Lượt chạy (rerun) đang được đo của luồng hiện tại; mỗi phiên Streamlit
+# chạy script trong luồng riêng nên các phiên không ghi lẫn vào nhau.
+_current_run = contextvars.ContextVar("telemetry_run", default=None)
+
+class RunRecord:
+    """
+    Thời gian của các bước trong một lượt chạy script.
+    """
+
+    def __init__(self, label=None, telemetry=None):
+        self.label = label
+        self.started_at = time.time()
+        self.stages = {}  # tên bước -> tổng số giây (cộng dồn nếu gọi nhiều lần)
+        self.total = None
+        self.status = None  # "ok", "rerun", "interrupted" hoặc tên exception
+        self.telemetry = telemetry
+        self._t0 = time.perf_counter()
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def finish(self):
+        self.total = time.perf_counter() - self._t0
+
+class Telemetry:
+    """
+    Bộ đo thời gian nhẹ cho các lượt chạy dashboard.
+
+    Giữ `max_runs` lượt gần nhất (ring buffer). Cách dùng:
+
+        run = telemetry.begin(label)
+        with stage("forecast"):
+            ...
+        telemetry.end(run)
+
+    `stage` không làm gì nếu luồng hiện tại không có lượt chạy nào đang đo,
+    nên có thể gọi ở bất kỳ đâu (kể cả trong CLI / worker).
+
+    Lượt chạy không tới được `end` vẫn được ghi lại: exception thoát khỏi một
+    `stage` (kể cả `st.rerun()` / `st.stop()`) kết thúc lượt chạy ngay tại đó,
+    còn lượt chạy bỏ dở ngoài mọi `stage` được kết thúc ở `begin` kế tiếp của
+    cùng luồng (trạng thái "interrupted").
+    """
+
+    def __init__(self, max_runs=50):
+        self.max_runs = int(max_runs)
+        self._runs = deque(maxlen=self.max_runs)
+        self._lock = threading.Lock()
+
+    def begin(self, label=None):
+        previous = _current_run.get()
+        if previous is not None and previous.telemetry is not None:
+            previous.telemetry.end(previous, status="interrupted")
+
+        run = RunRecord(label, telemetry=self)
+        _current_run.set(run)
+        return run
+
+    def end(self, run, status="ok"):
+        if _current_run.get() is run:
+            _current_run.set(None)
+        # Mỗi lượt chạy chỉ được ghi một lần
+        if run.total is not None:
+            return
+        run.finish()
+        run.status = status
+        with self._lock:
+            self._runs.append(run)
+
+    def runs(self):
+        """
+        Bảng các lượt chạy gần nhất (mới nhất ở cuối), mỗi bước một cột (ms).
+        """
+        with self._lock:
+            runs = list(self._runs)
+
+        rows = []
+        for run in runs:
+            row = {
+                "time": pd.Timestamp(run.started_at, unit="s"),
+                "label": run.label,
+                "status": run.status,
+                "total_ms": run.total * 1000,
+            }
+            row.update({f"{name}_ms": seconds * 1000 for name, seconds in run.stages.items()})
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def summary(self):
+        """
+        Thống kê theo bước trên các lượt gần nhất: số lần, trung bình, p50, p95, max (ms).
+        """
+        with self._lock:
+            runs = list(self._runs)
+
+        samples = {}
+        for run in runs:
+            for name, seconds in run.stages.items():
+                samples.setdefault(name, []).append(seconds * 1000)
+            samples.setdefault("total", []).append(run.total * 1000)
+
+        rows = []
+        for name, values in samples.items():
+            values = np.asarray(values)
+            rows.append({
+                "stage": name,
+                "count": len(values),
+                "mean_ms": values.mean(),
+                "p50_ms": np.percentile(values, 50),
+                "p95_ms": np.percentile(values, 95),
+                "max_ms": values.max(),
+            })
+        return pd.DataFrame(rows, columns=["stage", "count", "mean_ms", "p50_ms", "p95_ms", "max_ms"])
+
+    def clear(self):
+        with self._lock:
+            self._runs.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._runs)
+
+@contextmanager
+def stage(name):
+    """
+    Đo thời gian một bước và ghi vào lượt chạy hiện tại (nếu có).
+    """
+    run = _current_run.get()
+    if run is None:
+        yield
+        return
+
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException as exc:
+        # Script dừng giữa chừng (lỗi, st.rerun, st.stop): kết thúc lượt chạy tại đây
+        run.add(name, time.perf_counter() - t0)
+        if run.telemetry is not None:
+            run.telemetry.end(run, status=type(exc).__name__)
+        raise
+    else:
+        run.add(name, time.perf_counter() - t0)
+
+def record(name, seconds):
+    """
+    Ghi thời gian của một bước đã đo sẵn (khi không tiện dùng `stage`).
+    """
+    run = _current_run.get()
+    if run is not None:
+        run.add(name, seconds)
+
+def process_memory():
+    """
+    Bộ nhớ (MB): RSS hiện tại và RSS đỉnh của tiến trình hiện tại, và tổng RSS
+    hiện tại của các tiến trình con (worker dự báo).
+
+    Dùng psutil nếu có; nếu không thì đọc /proc (Linux) và `resource`, khi đó
+    không đo được tiến trình con (`children_rss_mb` = None).
+    """
+    rss = None
+    children_rss = None
+    try:
+        import psutil
+        proc = psutil.Process(os.getpid())
+        rss = proc.memory_info().rss / 2**20
+
+        children_rss = 0.0
+        for child in proc.children(recursive=True):
+            try:
+                children_rss += child.memory_info().rss / 2**20
+            except psutil.NoSuchProcess:
+                pass
+    except ImportError:
+        try:
+            with open("/proc/self/statm") as f:
+                rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+        except (OSError, ValueError):
+            pass
+
+    peak = None
+    try:
+        import resource
+        # Linux: KB
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        pass
+
+    return {"rss_mb": rss, "peak_rss_mb": peak, "children_rss_mb": children_rss}
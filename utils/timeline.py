@@ -0,0 +1,249 @@
+import json
+
+import numpy as np
+import pandas as pd
+from branca.element import MacroElement
+from jinja2 import Template
+
+from utils.forecast import predict_for_all_stations
+from utils.hsi import compute_hsi, HSI_LEVELS, HSI_LEVEL_DEFAULT
+from utils.r_hsi import compute_R_from_hsi
+
+# Toàn bộ khung thời gian dự báo của dashboard: Q1/2026 → Q4/2030
+TIMELINE_START_YEAR = 2026
+TIMELINE_START_QUARTER = 1
+TIMELINE_N_QUARTERS = 20
+
+# Màu marker theo mức HSI (cùng thứ tự với HSI_LEVELS)
+HSI_LEVEL_COLORS = ["#28a745", "#ffc107", "#fd7e14"]
+HSI_LEVEL_DEFAULT_COLOR = "#dc3545"
+NO_HSI_COLOR = "#C81E1E"
+
+def compute_timeline(
+    species,
+    start_year=TIMELINE_START_YEAR,
+    start_quarter=TIMELINE_START_QUARTER,
+    n_quarters=TIMELINE_N_QUARTERS
+):
+    """
+    Tính HSI và bán kính R cho mọi trạm trên toàn bộ chuỗi quý trong một lượt.
+
+    Dự báo được chạy batch cho tất cả trạm (`predict_for_all_stations`),
+    sau đó HSI và R được tính theo cột cho cả bảng.
+
+    Returns
+    -------
+    DataFrame với schema:
+    station, x, y, year, quarter, hsi, hsi_level, R_km
+    """
+    df_forecast = predict_for_all_stations(
+        species=species,
+        start_year=start_year,
+        start_quarter=start_quarter,
+        n_quarters=n_quarters
+    )
+    df_hsi = compute_hsi(df_forecast, species)
+
+    df_timeline = pd.DataFrame({
+        "station": df_hsi["Station"],
+        "x": df_hsi["X"],
+        "y": df_hsi["Y"],
+        "year": df_hsi["year"].astype(int),
+        "quarter": df_hsi["quarter"].astype(int),
+        "hsi": df_hsi["HSI"].astype(float),
+        "hsi_level": df_hsi["HSI_Level"],
+    })
+
+    df_R = compute_R_from_hsi(df_timeline)
+
+    return df_timeline.merge(
+        df_R[["station", "year", "quarter", "R_km"]],
+        on=["station", "year", "quarter"],
+        how="left"
+    )
+
+def _rounded_or_none(values, ndigits):
+    return [None if pd.isna(v) else round(float(v), ndigits) for v in values]
+
+def build_timeline_payload(df_timeline, stations):
+    """
+    Đóng gói kết quả `compute_timeline` thành payload dạng cột gọn nhẹ
+    để gửi xuống trình duyệt một lần.
+
+    Parameters
+    ----------
+    df_timeline : pd.DataFrame
+        Kết quả của `compute_timeline`.
+    stations : pd.DataFrame
+        Các cột Station, Station_Name, lat, lon.
+
+    Returns
+    -------
+    dict
+        {
+          "stations": [...], "names": [...], "lat": [...], "lon": [...],
+          "periods": [[year, quarter], ...],
+          "hsi": [[hsi của từng trạm] cho từng quý],
+          "r": [[R_km của từng trạm] cho từng quý]
+        }
+    """
+    stations = stations.drop_duplicates("Station").reset_index(drop=True)
+    periods = (
+        df_timeline[["year", "quarter"]]
+        .drop_duplicates()
+        .sort_values(["year", "quarter"])
+        .itertuples(index=False, name=None)
+    )
+    periods = [(int(y), int(q)) for y, q in periods]
+
+    # Ma trận (quý × trạm), thứ tự trạm theo `stations`
+    grid = df_timeline.set_index(["year", "quarter", "station"])
+    index = pd.MultiIndex.from_tuples(
+        [(y, q, s) for y, q in periods for s in stations["Station"]],
+        names=["year", "quarter", "station"]
+    )
+    hsi = grid["hsi"].reindex(index).to_numpy().reshape(len(periods), len(stations))
+    r_km = grid["R_km"].reindex(index).to_numpy().reshape(len(periods), len(stations))
+
+    return {
+        "stations": stations["Station"].tolist(),
+        "names": stations["Station_Name"].tolist(),
+        "lat": _rounded_or_none(stations["lat"], 6),
+        "lon": _rounded_or_none(stations["lon"], 6),
+        "periods": [[y, q] for y, q in periods],
+        "hsi": [_rounded_or_none(row, 3) for row in hsi],
+        "r": [_rounded_or_none(row, 1) for row in r_km],
+    }
+
+class TimeSliderLayer(MacroElement):
+    """
+    Lớp bản đồ Folium hiển thị HSI/R theo quý với thanh trượt thời gian.
+
+    Toàn bộ payload được nhúng một lần vào trang; việc chuyển quý
+    (kéo thanh trượt hoặc bấm phát) chỉ cập nhật style của các marker
+    trên trình duyệt, không cần gọi lại server.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var data = {{ this.payload_json }};
+            var levels = {{ this.levels_json }};
+
+            function levelOf(h) {
+                for (var i = 0; i < levels.thresholds.length; i++) {
+                    if (h >= levels.thresholds[i]) {
+                        return i;
+                    }
+                }
+                return levels.thresholds.length;
+            }
+
+            var circles = [];
+            var markers = [];
+            for (var i = 0; i < data.stations.length; i++) {
+                if (data.lat[i] === null || data.lon[i] === null) {
+                    circles.push(null);
+                    markers.push(null);
+                    continue;
+                }
+                var latlng = [data.lat[i], data.lon[i]];
+                circles.push(L.circle(latlng, {
+                    radius: 0, color: "#2E86AB", fillColor: "#2E86AB",
+                    fill: true, fillOpacity: 0.15, weight: 2, opacity: 0.5
+                }).addTo(map));
+                markers.push(L.circleMarker(latlng, {
+                    radius: 8, fill: true, fillOpacity: 0.7, weight: 2
+                }).bindTooltip("").addTo(map));
+            }
+
+            function show(t) {
+                var period = data.periods[t];
+                label.innerHTML = "Q" + period[1] + "/" + period[0];
+                for (var i = 0; i < data.stations.length; i++) {
+                    if (markers[i] === null) {
+                        continue;
+                    }
+                    var h = data.hsi[t][i];
+                    var r = data.r[t][i];
+                    var tip = data.stations[i] + " - " + data.names[i];
+                    var color = levels.missing_color;
+                    if (h !== null) {
+                        var lv = levelOf(h);
+                        color = levels.colors[lv];
+                        tip += " | HSI: " + h.toFixed(3) + " (" + levels.labels[lv] + ")";
+                    }
+                    if (r !== null) {
+                        tip += " | R = " + r + " km";
+                    }
+                    markers[i].setStyle({color: color, fillColor: color});
+                    markers[i].setTooltipContent(tip);
+                    circles[i].setRadius(r === null ? 0 : r * 1000);
+                }
+            }
+
+            var control = L.control({position: "bottomleft"});
+            var slider, label, button;
+            control.onAdd = function() {
+                var div = L.DomUtil.create("div");
+                div.style.cssText = "background: white; padding: 6px 10px; " +
+                    "border: 2px solid grey; border-radius: 5px; font-size: 14px;";
+                button = L.DomUtil.create("button", "", div);
+                button.innerHTML = "▶";
+                slider = L.DomUtil.create("input", "", div);
+                slider.type = "range";
+                slider.min = 0;
+                slider.max = data.periods.length - 1;
+                slider.value = {{ this.initial_index }};
+                slider.style.cssText = "vertical-align: middle; margin: 0 8px;";
+                label = L.DomUtil.create("b", "", div);
+                L.DomEvent.disableClickPropagation(div);
+                return div;
+            };
+            control.addTo(map);
+
+            var timer = null;
+            slider.addEventListener("input", function() {
+                show(parseInt(slider.value));
+            });
+            button.addEventListener("click", function() {
+                if (timer !== null) {
+                    clearInterval(timer);
+                    timer = null;
+                    button.innerHTML = "▶";
+                    return;
+                }
+                button.innerHTML = "⏸";
+                timer = setInterval(function() {
+                    slider.value = (parseInt(slider.value) + 1) % data.periods.length;
+                    show(parseInt(slider.value));
+                }, {{ this.interval_ms }});
+            });
+
+            show({{ this.initial_index }});
+        })();
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, payload, initial_period=None, interval_ms=800):
+        super().__init__()
+        self._name = "TimeSliderLayer"
+
+        periods = [tuple(p) for p in payload["periods"]]
+        self.initial_index = (
+            periods.index(tuple(initial_period))
+            if initial_period is not None and tuple(initial_period) in periods
+            else 0
+        )
+        self.interval_ms = int(interval_ms)
+        # Nhúng vào <script>: "</" trong tên trạm / nhãn không được đóng thẻ sớm
+        self.payload_json = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+        self.levels_json = json.dumps({
+            "thresholds": [threshold for threshold, _ in HSI_LEVELS],
+            "labels": [label for _, label in HSI_LEVELS] + [HSI_LEVEL_DEFAULT],
+            "colors": HSI_LEVEL_COLORS + [HSI_LEVEL_DEFAULT_COLOR],
+            "missing_color": NO_HSI_COLOR,
+        }, ensure_ascii=False).replace("</", "<\\/")
@@ -0,0 +1,209 @@
+"""
+Làm nóng (warm-up) dashboard: nạp sẵn mô hình / dữ liệu và tính trước
+màn hình mặc định để người dùng đầu tiên sau khi deploy không phải chờ.
+
+Chạy thủ công (ví dụ trong bước deploy):
+
+    python -m utils.warmup --species cobia --year 2026 --quarter 1 --ahead 3
+
+Lệnh CLI lưu kết quả đã tính vào snapshot; dashboard nạp snapshot này
+khi khởi động (khoá cache có kèm phiên bản dữ liệu/mô hình nên snapshot
+cũ tự bị bỏ qua).
+"""
+import argparse
+import logging
+import threading
+import time
+
+import joblib
+import pandas as pd
+
+from utils.forecast import MODEL_DIR, QN_DATA_PATH
+
+# Khớp với giá trị mặc định của interface/main.py
+DEFAULT_SPECIES = "cobia"
+DEFAULT_START_YEAR = 2026
+DEFAULT_START_QUARTER = 1
+DEFAULT_N_QUARTERS = 4
+DEFAULT_N_AHEAD = 3
+
+SNAPSHOT_PATH = MODEL_DIR / "warmup_snapshot.pkl"
+
+logger = logging.getLogger(__name__)
+
+def first_station(csv_path=QN_DATA_PATH):
+    """
+    Trạm được chọn mặc định trên dashboard (mã trạm có số nhỏ nhất).
+    """
+    stations = pd.read_csv(csv_path, usecols=["Station"])["Station"].drop_duplicates()
+    sort_key = stations.str.extract(r"(\d+)", expand=False).astype(int)
+    return stations.loc[sort_key.sort_values(kind="stable").index[0]]
+
+def next_quarters(year, quarter, n):
+    """
+    n quý kế tiếp sau (year, quarter).
+    """
+    out = []
+    for _ in range(n):
+        quarter += 1
+        if quarter > 4:
+            quarter = 1
+            year += 1
+        out.append((year, quarter))
+    return out
+
+def warm_up(
+    pool,
+    species=DEFAULT_SPECIES,
+    start_year=DEFAULT_START_YEAR,
+    start_quarter=DEFAULT_START_QUARTER,
+    n_quarters=DEFAULT_N_QUARTERS,
+    n_ahead=DEFAULT_N_AHEAD,
+    station=None,
+    background=True
+):
+    """
+    Làm nóng pool dự báo và cache kết quả.
+
+    1. Khởi động toàn bộ worker (nạp mô hình).
+    2. Tính trước màn hình mặc định: HSI bản đồ của (start_year, start_quarter)
+       và dự báo chi tiết của trạm mặc định.
+    3. Tính trước HSI bản đồ của `n_ahead` quý kế tiếp, chạy nền nếu
+       `background=True`.
+
+    Returns
+    -------
+    timings : dict
+        Thời gian (giây) của từng bước đã chạy đồng bộ.
+    thread : threading.Thread | None
+        Luồng nền tính các quý kế tiếp (None nếu chạy đồng bộ).
+    """
+    timings = {}
+
+    t0 = time.perf_counter()
+    pool.start()
+    timings["workers"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    pool.hsi_map(species, start_year, start_quarter)
+    timings["hsi_map"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    pool.forecast(
+        species, start_year, start_quarter, n_quarters,
+        stations=[station or first_station()]
+    )
+    timings["station_forecast"] = time.perf_counter() - t0
+
+    def _ahead():
+        for year, quarter in next_quarters(start_year, start_quarter, n_ahead):
+            pool.hsi_map(species, year, quarter)
+
+    if not background:
+        t0 = time.perf_counter()
+        _ahead()
+        timings["ahead"] = time.perf_counter() - t0
+        return timings, None
+
+    thread = threading.Thread(target=_ahead, name="forecast-warmup", daemon=True)
+    thread.start()
+    return timings, thread
+
+def start_warm_up(pool, cache=None, snapshot_path=SNAPSHOT_PATH, preload=(), **kwargs):
+    """
+    Warm-up cho dashboard: nạp snapshot (nhanh) rồi, trong một luồng nền, gọi
+    các hàm `preload` (không tham số, ví dụ đọc CSV + chuyển toạ độ của dashboard)
+    và chạy toàn bộ `warm_up`, để lượt chạy của người dùng đầu tiên không phải chờ.
+    Lỗi chỉ được ghi log, không làm hỏng dashboard.
+
+    Returns
+    -------
+    threading.Thread
+    """
+    if cache is not None:
+        try:
+            n = load_snapshot(cache, snapshot_path)
+            logger.info("Đã nạp %d kết quả từ snapshot warm-up", n)
+        except Exception:
+            logger.exception("Không nạp được snapshot warm-up %s", snapshot_path)
+
+    def _run():
+        for func in preload:
+            t0 = time.perf_counter()
+            try:
+                func()
+                logger.info("Warm-up %s: %.2fs", getattr(func, "__name__", func), time.perf_counter() - t0)
+            except Exception:
+                logger.exception("Warm-up %s thất bại", getattr(func, "__name__", func))
+
+        try:
+            timings, _ = warm_up(pool, background=False, **kwargs)
+            logger.info("Warm-up xong: %s", {k: round(v, 2) for k, v in timings.items()})
+        except Exception:
+            logger.exception("Warm-up dashboard thất bại")
+
+    thread = threading.Thread(target=_run, name="dashboard-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def save_snapshot(cache, path=SNAPSHOT_PATH):
+    """
+    Lưu các kết quả đang có trong cache ra file.
+    """
+    joblib.dump(cache.items(), path)
+
+def load_snapshot(cache, path=SNAPSHOT_PATH):
+    """
+    Nạp snapshot (nếu có) vào cache.
+
+    Returns
+    -------
+    int
+        Số kết quả đã nạp.
+    """
+    try:
+        items = joblib.load(path)
+    except FileNotFoundError:
+        return 0
+
+    for key, value in items:
+        cache.set(key, value)
+    return len(items)
+
+def main(argv=None):
+    from utils.cache import ResultCache
+    from utils.worker import ForecastPool
+
+    parser = argparse.ArgumentParser(description="Warm-up cache cho dashboard dự báo")
+    parser.add_argument("--species", default=DEFAULT_SPECIES, choices=["cobia", "oyster"])
+    parser.add_argument("--year", type=int, default=DEFAULT_START_YEAR)
+    parser.add_argument("--quarter", type=int, default=DEFAULT_START_QUARTER, choices=[1, 2, 3, 4])
+    parser.add_argument("--n-quarters", type=int, default=DEFAULT_N_QUARTERS)
+    parser.add_argument("--ahead", type=int, default=DEFAULT_N_AHEAD)
+    parser.add_argument("--snapshot", default=str(SNAPSHOT_PATH))
+    args = parser.parse_args(argv)
+
+    cache = ResultCache(max_entries=64, ttl_seconds=None)
+    pool = ForecastPool(cache=cache)
+    try:
+        timings, _ = warm_up(
+            pool,
+            species=args.species,
+            start_year=args.year,
+            start_quarter=args.quarter,
+            n_quarters=args.n_quarters,
+            n_ahead=args.ahead,
+            background=False
+        )
+    finally:
+        pool.shutdown()
+
+    save_snapshot(cache, args.snapshot)
+
+    print("✅ Warm-up xong:")
+    for step, seconds in timings.items():
+        print(f" - {step:<18} {seconds:.2f}s")
+    print(f"💾 Đã lưu {len(cache)} kết quả vào: {args.snapshot}")
+
+if __name__ == "__main__":
+    main()
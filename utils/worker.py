@@ -0,0 +1,240 @@
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from utils.forecast import (
+    SPECIES_MODEL_FILES,
+    forecast_version,
+    load_flat_model,
+    load_metal_model,
+    limit_model_threads,
+    load_species_model,
+    predict_for_all_stations,
+)
+from utils.hsi import compute_hsi
+
+# Số luồng XGBoost của mỗi tiến trình worker (gán trong _init_worker)
+_WORKER_THREADS = 1
+
+def _init_worker(n_threads):
+    """
+    Khởi tạo tiến trình worker: giới hạn số luồng và nạp sẵn mô hình.
+    """
+    global _WORKER_THREADS
+    _WORKER_THREADS = n_threads
+
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(n_threads)
+
+    limit_model_threads(n_threads)
+    for species in SPECIES_MODEL_FILES:
+        try:
+            load_species_model(species)
+            load_flat_model(species)
+        except FileNotFoundError:
+            pass
+
+    try:
+        load_metal_model()
+        load_flat_model("metal")
+    except FileNotFoundError:
+        pass
+
+@contextmanager
+def _detached_main():
+    """
+    Streamlit thay `sys.modules["__main__"]` bằng script của app, nên tiến
+    trình spawn sẽ chạy lại cả script dashboard khi khởi động. Tạm thay
+    bằng module rỗng trong lúc tạo worker.
+    """
+    main_module = sys.modules.get("__main__")
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main_module
+
+def _ping(hold=0.0):
+    # Giữ worker một chút để các ping khác phải sang worker còn lại
+    time.sleep(hold)
+    return os.getpid()
+
+def forecast_task(species, start_year, start_quarter, n_quarters, stations=None):
+    """
+    Dự báo batch cho các trạm (chạy trong worker).
+    """
+    return predict_for_all_stations(
+        species=species,
+        start_year=start_year,
+        start_quarter=start_quarter,
+        n_quarters=n_quarters,
+        stations=stations
+    )
+
+def hsi_map_task(species, year, quarter):
+    """
+    HSI của tất cả trạm cho một quý: {station: {"HSI", "HSI_Level"}}.
+    """
+    forecast_df = predict_for_all_stations(
+        species=species,
+        start_year=year,
+        start_quarter=quarter,
+        n_quarters=1
+    )
+    forecast_with_hsi = compute_hsi(forecast_df, species=species)
+    return {
+        station: {"HSI": float(h), "HSI_Level": level}
+        for station, h, level in zip(
+            forecast_with_hsi["Station"],
+            forecast_with_hsi["HSI"],
+            forecast_with_hsi["HSI_Level"]
+        )
+    }
+
+def timeline_task(species):
+    """
+    HSI + R cho mọi trạm trên toàn bộ khung 2026-2030 (xem `compute_timeline`).
+    """
+    from utils.timeline import compute_timeline
+
+    return compute_timeline(species)
+
+class ForecastPool:
+    """
+    Pool tiến trình dự báo dùng chung giữa các phiên dashboard.
+
+    - Mô hình được nạp sẵn trong từng worker, dự báo chạy ngoài luồng
+      script của Streamlit (không tranh GIL giữa các phiên).
+    - Tổng CPU bị giới hạn: `max_workers * threads_per_worker ≤ cpu_budget`.
+    - Các yêu cầu giống hệt nhau đang chạy được gộp lại: 10 phiên cùng
+      chọn một quý chỉ tạo ra 1 lần tính toán.
+    - Nếu truyền `cache` (ResultCache), kết quả xong được lưu vào cache.
+
+    Parameters
+    ----------
+    cpu_budget : int, optional
+        Tổng số lõi được dùng (mặc định: số lõi của máy).
+    threads_per_worker : int
+        Số luồng XGBoost của mỗi worker.
+    max_workers : int, optional
+        Số worker (mặc định: cpu_budget // threads_per_worker, tối đa 4).
+    cache : ResultCache, optional
+    """
+
+    def __init__(self, cpu_budget=None, threads_per_worker=1, max_workers=None, cache=None):
+        self.cpu_budget = max(1, int(cpu_budget or os.cpu_count() or 1))
+        self.threads_per_worker = max(1, min(int(threads_per_worker), self.cpu_budget))
+
+        budget_workers = max(1, self.cpu_budget // self.threads_per_worker)
+        self.max_workers = min(budget_workers, max_workers or 4)
+
+        self.cache = cache
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.threads_per_worker,)
+        )
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+        self.submitted = 0
+        self.deduplicated = 0
+
+    def start(self, timeout=120.0, hold=0.05):
+        """
+        Khởi động sẵn toàn bộ worker (nạp mô hình) thay vì đợi yêu cầu đầu tiên.
+
+        Worker nào khởi động xong trước có thể nhận hết các ping, nên ping được
+        gửi lại cho tới khi mọi worker đều trả lời (hoặc hết `timeout` giây).
+
+        Returns
+        -------
+        set
+            PID của các worker đã trả lời (ít hơn `max_workers` nếu hết thời gian).
+        """
+        pids = set()
+        deadline = time.monotonic() + timeout
+        while len(pids) < self.max_workers and time.monotonic() < deadline:
+            with self._lock, _detached_main():
+                futures = [self._executor.submit(_ping, hold) for _ in range(self.max_workers)]
+            pids.update(f.result() for f in futures)
+        return pids
+
+    def _on_done(self, key, future):
+        if self.cache is not None and not future.cancelled() and future.exception() is None:
+            self.cache.set(key, future.result())
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def submit(self, key, task, *args):
+        """
+        Gửi `task(*args)` cho worker, gộp với yêu cầu cùng `key` đang chạy.
+
+        Returns
+        -------
+        concurrent.futures.Future
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.deduplicated += 1
+                return future
+
+            with _detached_main():
+                future = self._executor.submit(task, *args)
+            self._inflight[key] = future
+            self.submitted += 1
+
+        future.add_done_callback(lambda f: self._on_done(key, f))
+        return future
+
+    def run(self, key, task, *args, timeout=None):
+        """
+        Lấy kết quả từ cache, hoặc tính (có gộp yêu cầu) rồi chờ kết quả.
+        """
+        if self.cache is not None:
+            _missing = object()
+            value = self.cache.get(key, _missing)
+            if value is not _missing:
+                return value
+
+        return self.submit(key, task, *args).result(timeout=timeout)
+
+    def forecast(self, species, start_year, start_quarter, n_quarters, stations=None):
+        stations = tuple(stations) if stations is not None else None
+        key = (
+            "forecast", species, int(start_year), int(start_quarter), int(n_quarters),
+            stations, forecast_version(species)
+        )
+        return self.run(
+            key, forecast_task,
+            species, int(start_year), int(start_quarter), int(n_quarters), stations
+        )
+
+    def hsi_map(self, species, year, quarter):
+        key = ("hsi_map", species, int(year), int(quarter), forecast_version(species))
+        return self.run(key, hsi_map_task, species, int(year), int(quarter))
+
+    def timeline(self, species):
+        key = ("timeline", species, forecast_version(species))
+        return self.run(key, timeline_task, species)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "cpu_budget": self.cpu_budget,
+                "workers": self.max_workers,
+                "threads_per_worker": self.threads_per_worker,
+                "submitted": self.submitted,
+                "deduplicated": self.deduplicated,
+                "inflight": len(self._inflight),
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)